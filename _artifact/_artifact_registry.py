@@ -0,0 +1,126 @@
+"""
+Registry of the templates shipped in the _artifact package.
+
+The packaged templates are resolved through importlib.resources, so a lookup is a dictionary access no
+matter how large the Python installation is, and it can only return a template of this package.
+Templates that are not packaged are looked up in user-supplied template directories (ARTIFACT_TEMPLATE_PATH,
+separated by os.pathsep); each directory is indexed once per process and every later lookup is a
+dictionary access as well.
+"""
+import os
+import threading
+from collections import deque
+from functools import lru_cache
+from importlib import resources
+from importlib.resources.abc import Traversable
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+# Files of the package that are code, not templates
+_NOT_TEMPLATES = ("__init__.py", "_artifact_registry.py", "__pycache__")
+
+_index_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def packaged_templates() -> Dict[str, Traversable]:
+    """
+    Indexes the templates shipped in the _artifact package by file name.
+
+    Returns:
+        Dict[str, Traversable]: The template resources, keyed by file name.
+
+    """
+    return {
+        resource.name: resource
+        for resource in resources.files(__package__).iterdir()
+        if resource.is_file() and resource.name not in _NOT_TEMPLATES and not resource.name.endswith(".pyc")
+    }
+
+
+@lru_cache(maxsize=None)
+def _directory_index(directory: str) -> Dict[str, str]:
+    index = {}
+    pending = deque([directory])
+    # Breadth first, so a template closer to the root wins over one with the same name deeper down
+    while pending:
+        current = pending.popleft()
+        try:
+            with os.scandir(current) as entries:
+                for entry in sorted(entries, key=lambda entry: entry.name):
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file():
+                        index.setdefault(entry.name, entry.path)
+        except OSError:
+            continue
+    return index
+
+
+def directory_index(directory: str) -> Dict[str, str]:
+    """
+    Indexes the files of a user-supplied template directory by file name.
+
+    The directory is walked once per process; the index is cached and reused by every later lookup,
+    until clear_index_cache is called.
+
+    Args:
+        directory: The template directory to index.
+
+    Returns:
+        Dict[str, str]: The template paths, keyed by file name.
+
+    """
+    with _index_lock:
+        return _directory_index(os.path.realpath(directory))
+
+
+def clear_index_cache() -> None:
+    """Forget the indexes of the user-supplied template directories, e.g. after templates were added."""
+    with _index_lock:
+        _directory_index.cache_clear()
+
+
+def template_dirs() -> Tuple[str, ...]:
+    """The user-supplied template directories from ARTIFACT_TEMPLATE_PATH."""
+    return tuple(path for path in os.environ.get("ARTIFACT_TEMPLATE_PATH", "").split(os.pathsep) if path)
+
+
+def find_template(name: str, search_dirs: Optional[Iterable[str]] = None) -> Optional[Union[Traversable, str]]:
+    """
+    Finds a template by file name: packaged templates first, then the user-supplied directories.
+
+    Args:
+        name: The file name of the template, e.g. Dockerfile_aws_linux_2.
+        search_dirs: The user-supplied template directories, ARTIFACT_TEMPLATE_PATH when not given.
+
+    Returns:
+        The packaged resource or the path of the template, None when there is no such template.
+
+    """
+    if name in packaged_templates():
+        return packaged_templates()[name]
+    for directory in template_dirs() if search_dirs is None else search_dirs:
+        if path := directory_index(directory).get(name):
+            return path
+    return None
+
+
+def load_template(name: str, search_dirs: Optional[Iterable[str]] = None) -> Optional[str]:
+    """
+    Loads the content of a template by file name.
+
+    Args:
+        name: The file name of the template, e.g. Dockerfile.
+        search_dirs: The user-supplied template directories, ARTIFACT_TEMPLATE_PATH when not given.
+
+    Returns:
+        str: The template content, None when there is no such template.
+
+    """
+    template = find_template(name, search_dirs)
+    if template is None:
+        return None
+    if isinstance(template, str):
+        with open(template, "r") as file:
+            return file.read()
+    return template.read_text()
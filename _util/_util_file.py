@@ -1,10 +1,13 @@
 import csv
 import os
 import json
+import re
+import fnmatch
+from dataclasses import dataclass, field
 from pathlib import Path
 import yaml
 from inspect import currentframe
-from typing import List, Dict, Tuple, Union, Any
+from typing import List, Dict, Iterable, NamedTuple, Optional, Tuple, Union, Any
 from logging import Logger as Log
 from _common import _common as _common_
 
@@ -350,6 +353,123 @@ def find_file(starting_directory: str, filename: str, max_depth: int = None) ->
 
     return None  # Return None if file is not found
 
+class ManifestEntry(NamedTuple):
+    """A file of a scanned directory, with the stat fields later stages use to detect changes."""
+    # A NamedTuple rather than a frozen dataclass: one is built per file, and this is several times cheaper
+    relpath: str
+    path: str
+    size: int
+    mtime_ns: int
+    inode: int
+    depth: int
+    # A symbolic link is listed as such, with the stat fields of the link itself, and never followed
+    symlink: bool = False
+
+
+@dataclass
+class DirectoryManifest:
+    """
+    The files of a directory tree, collected in one traversal and shared by the deployment stages.
+
+    Files are listed in a stable order: the files of a directory sorted by name, then its
+    subdirectories sorted by name, depth first.
+    """
+    root: str
+    files: List[ManifestEntry] = field(default_factory=list)
+    targets: Dict[str, ManifestEntry] = field(default_factory=dict)
+
+    def find(self, filename: str, max_depth: Optional[int] = None) -> Optional[str]:
+        """The absolute path of the shallowest target named filename, within max_depth of the root."""
+        entry = self.targets.get(filename)
+        if entry is None or (max_depth is not None and entry.depth > max_depth):
+            return None
+        return entry.path
+
+    def add(self, filepath: str) -> ManifestEntry:
+        """Record a file created in the tree after the scan, e.g. a generated Dockerfile."""
+        relpath = os.path.relpath(filepath, self.root).replace(os.sep, "/")
+        self.files = [entry for entry in self.files if entry.relpath != relpath]
+        stat = os.lstat(filepath)
+        entry = ManifestEntry(relpath=relpath, path=os.path.abspath(filepath), size=stat.st_size,
+                              mtime_ns=stat.st_mtime_ns, inode=stat.st_ino, depth=relpath.count("/"),
+                              symlink=os.path.islink(filepath))
+        self.files.append(entry)
+        self.files.sort(key=_manifest_order)
+        current = self.targets.get(entry.relpath.rsplit("/", 1)[-1])
+        if current is None or current.depth >= entry.depth:
+            self.targets[entry.relpath.rsplit("/", 1)[-1]] = entry
+        return entry
+
+
+def _manifest_order(entry: ManifestEntry) -> Tuple:
+    # Files of a directory before its subdirectories, both by name: the order of the scan
+    parts = entry.relpath.split("/")
+    return tuple((1, part) for part in parts[:-1]) + ((0, parts[-1]),)
+
+
+def scan_directory(dirpath: str,
+                   targets: Iterable[str] = (),
+                   max_depth: Optional[int] = None,
+                   ignore_patterns: Iterable[str] = ("__pycache__",)) -> DirectoryManifest:
+    """
+    Scans a directory tree once and returns its manifest.
+
+    The tree is traversed with os.scandir, so the file type and stat fields come from the directory
+    entries. Every file is listed in the manifest, and the shallowest file of every name in 'targets'
+    is recorded so it can be found without walking the tree again. Files and directories whose name
+    matches one of 'ignore_patterns' (fnmatch patterns) are skipped, and directories deeper than
+    'max_depth' are not entered. Symbolic links are listed as links, with their own stat fields, and
+    never followed, so a dangling link is listed like any other; this is how Docker sends them.
+
+    Args:
+        dirpath: The path of the directory to scan.
+        targets: File names to locate during the scan, e.g. Dockerfile.
+        max_depth: The deepest directory level to enter, 0 for the top directory only; None for no limit.
+        ignore_patterns: Name patterns of the files and directories to skip.
+
+    Returns:
+        DirectoryManifest: The files of the tree and the located targets.
+
+    Raises:
+        OSError: When a directory of the tree cannot be read, e.g. 'dirpath' does not exist.
+
+    """
+    targets = set(targets)
+    manifest = DirectoryManifest(root=os.path.abspath(dirpath))
+
+    # One compiled regex for all the patterns, checked once per directory entry
+    ignore_patterns = tuple(ignore_patterns)
+    ignored = re.compile("|".join(fnmatch.translate(pattern) for pattern in ignore_patterns)).match \
+        if ignore_patterns else (lambda name: None)
+
+    def scan(current: str, prefix: str, depth: int) -> None:
+        with os.scandir(current) as iterator:
+            entries = sorted(iterator, key=lambda entry: entry.name)
+        subdirs = []
+        for entry in entries:
+            if ignored(entry.name):
+                continue
+            symlink = entry.is_symlink()
+            if not symlink and entry.is_dir():
+                subdirs.append(entry)
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            # entry.path is absolute already, since the scan starts from the absolute root
+            file_entry = ManifestEntry(relpath=prefix + entry.name, path=entry.path,
+                                       size=stat.st_size, mtime_ns=stat.st_mtime_ns, inode=stat.st_ino,
+                                       depth=depth, symlink=symlink)
+            manifest.files.append(file_entry)
+            if entry.name in targets and entry.name not in manifest.targets:
+                manifest.targets[entry.name] = file_entry
+        if max_depth is not None and depth >= max_depth:
+            return
+        for entry in subdirs:
+            scan(entry.path, f"{prefix}{entry.name}/", depth + 1)
+
+    scan(manifest.root, "", 0)
+    return manifest
+
+
 # def pghtml_to_jira_wiki(filepath: str, logger: Log = None) -> str:
 #     try:
 #         with open(filepath) as file:
@@ -0,0 +1,216 @@
+"""
+Incremental content hashing of directory trees.
+
+Files are listed with _util_file.scan_directory and only the files whose (inode, size, mtime_ns) changed
+since the last run are read again: the digests of the others come from a persistent stat cache. Files
+that do have to be read are hashed in a thread pool (hashlib releases the GIL on large buffers), large
+files through mmap. The per-file digests are folded into a Merkle tree, one digest per directory, so the
+root digest changes whenever a path or a content anywhere in the tree changes.
+"""
+import os
+import json
+import mmap
+import time
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from _util import _util_file as _util_file_
+
+# Files at least this large are hashed through mmap instead of buffered reads
+MMAP_THRESHOLD = 4 * 1024 * 1024
+READ_CHUNK_SIZE = 1024 * 1024
+
+# A file modified this recently may change again within the same mtime tick, so its digest is not cached
+RACY_WINDOW_NS = 2 * 1000 * 1000 * 1000
+
+DEFAULT_MAX_WORKERS = min(32, (os.cpu_count() or 1) * 2)
+HASH_BATCH_SIZE = 64
+
+
+@dataclass
+class TreeDigest:
+    """The Merkle digest of a directory tree, with the digest of every file and directory."""
+    root: str
+    digest: str = ""
+    files: Dict[str, str] = field(default_factory=dict)
+    directories: Dict[str, str] = field(default_factory=dict)
+    hashed: int = 0
+    cached: int = 0
+
+
+def cache_dir() -> str:
+    """Directory holding the stat caches (HASH_CACHE_DIR, defaults to ~/.cache/aws_ecr_deploy)."""
+    return os.environ.get("HASH_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "aws_ecr_deploy"))
+
+
+def cache_filepath(dirpath: str) -> str:
+    """Stat cache file of one directory tree."""
+    key = hashlib.sha256(os.path.realpath(dirpath).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir(), f"hash_cache_{key}.json")
+
+
+def load_stat_cache(filepath: str) -> Dict[str, Tuple[int, int, int, str]]:
+    """
+    Loads a stat cache: relative path -> (inode, size, mtime_ns, digest).
+
+    Args:
+        filepath: The path of the cache file.
+
+    Returns:
+        Dict: The cached digests, empty when the cache is missing or unreadable.
+
+    """
+    try:
+        with open(filepath) as file:
+            return {relpath: tuple(value) for relpath, value in json.load(file).items()}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_stat_cache(filepath: str, cache: Dict[str, Tuple[int, int, int, str]]) -> None:
+    """
+    Writes a stat cache atomically, so a concurrent reader never sees a partial file.
+
+    Args:
+        filepath: The path of the cache file.
+        cache: The digests to store, relative path -> (inode, size, mtime_ns, digest).
+
+    """
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    file_descriptor, tmp_filepath = tempfile.mkstemp(dir=os.path.dirname(filepath), suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "w") as file:
+            json.dump(cache, file, separators=(",", ":"))
+        os.replace(tmp_filepath, filepath)
+    except BaseException:
+        os.unlink(tmp_filepath)
+        raise
+
+
+def file_digest(filepath: str, size: Optional[int] = None) -> str:
+    """
+    Computes the SHA-256 digest of a file, through mmap for large files.
+
+    Args:
+        filepath: The path of the file to hash.
+        size: The size of the file when already known.
+
+    Returns:
+        str: The hex digest of the file content.
+
+    """
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as file:
+        if (size if size is not None else os.fstat(file.fileno()).st_size) >= MMAP_THRESHOLD:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+        else:
+            for chunk in iter(lambda: file.read(READ_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_digest(linkpath: str) -> str:
+    """The digest of a symbolic link: its target path, which is what the build context holds."""
+    return hashlib.sha256(b"symlink\0" + os.fsencode(os.readlink(linkpath))).hexdigest()
+
+
+def _hash_batch(entries: List[_util_file_.ManifestEntry]) -> List[str]:
+    return [link_digest(entry.path) if entry.symlink else file_digest(entry.path, entry.size) for entry in entries]
+
+
+def merkle_digest(files: Dict[str, str]) -> Tuple[str, Dict[str, str]]:
+    """
+    Folds file digests into a Merkle tree of directory digests.
+
+    A directory digest covers the sorted names, kinds and digests of its children, so renaming,
+    moving, adding or removing a file changes the digest of every directory up to the root.
+
+    Args:
+        files: The file digests, keyed by relative path with "/" separators.
+
+    Returns:
+        Tuple[str, Dict[str, str]]: The root digest, and the digest of every directory ("" is the root).
+
+    """
+    children: Dict[str, list] = {"": []}
+    for relpath, digest in files.items():
+        parent, _, name = relpath.rpartition("/")
+        # Register every ancestor, so directories containing only directories are folded as well
+        ancestor = parent
+        while ancestor and ancestor not in children:
+            children[ancestor] = []
+            ancestor = ancestor.rpartition("/")[0]
+        children[parent].append((name, "f", digest))
+
+    directories: Dict[str, str] = {}
+    # Deepest directories first, so each directory is folded after all of its subdirectories
+    for directory in sorted(children, key=lambda path: path.count("/") + bool(path), reverse=True):
+        digest = hashlib.sha256()
+        for name, kind, child_digest in sorted(children[directory]):
+            digest.update(f"{kind}\0{name}\0{child_digest}\n".encode("utf-8"))
+        directories[directory] = digest.hexdigest()
+        if directory:
+            parent, _, name = directory.rpartition("/")
+            children[parent].append((name, "d", directories[directory]))
+    return directories[""], directories
+
+
+def tree_digest(dirpath: str,
+                manifest: _util_file_.DirectoryManifest = None,
+                cache_path: Optional[str] = None,
+                use_cache: bool = True,
+                max_workers: int = DEFAULT_MAX_WORKERS) -> TreeDigest:
+    """
+    Computes the Merkle digest of a directory tree, reading only the files that changed.
+
+    Args:
+        dirpath: The path of the directory to hash.
+        manifest: The manifest of 'dirpath' from scan_directory; the tree is scanned when not given.
+        cache_path: The stat cache file, cache_filepath(dirpath) when not given.
+        use_cache: Whether to read and update the persistent stat cache.
+        max_workers: The number of threads hashing the files that are not in the cache.
+
+    Returns:
+        TreeDigest: The root digest, the file and directory digests and how many files were read.
+
+    Raises:
+        OSError: When the tree cannot be scanned or one of its files cannot be read.
+
+    """
+    if manifest is None:
+        manifest = _util_file_.scan_directory(dirpath)
+    cache_path = cache_path or cache_filepath(dirpath)
+    cache = load_stat_cache(cache_path) if use_cache else {}
+
+    result = TreeDigest(root=manifest.root)
+    pending = []
+    for entry in manifest.files:
+        cached = cache.get(entry.relpath)
+        if cached is not None and cached[:3] == (entry.inode, entry.size, entry.mtime_ns):
+            result.files[entry.relpath] = cached[3]
+        else:
+            pending.append(entry)
+
+    if pending:
+        # Small files are handed to the workers in batches, a task per file costs more than hashing it
+        batches = [pending[index:index + HASH_BATCH_SIZE] for index in range(0, len(pending), HASH_BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as executor:
+            for batch, digests in zip(batches, executor.map(_hash_batch, batches)):
+                for entry, digest in zip(batch, digests):
+                    result.files[entry.relpath] = digest
+    result.hashed = len(pending)
+    result.cached = len(manifest.files) - len(pending)
+    result.digest, result.directories = merkle_digest(result.files)
+
+    if use_cache:
+        racy_after = time.time_ns() - RACY_WINDOW_NS
+        cacheable = {entry.relpath: (entry.inode, entry.size, entry.mtime_ns, result.files[entry.relpath])
+                     for entry in manifest.files if entry.mtime_ns < racy_after}
+        # Racy files are left out, so the cache is only written when what can be cached changed
+        if cacheable != cache:
+            save_stat_cache(cache_path, cacheable)
+    return result
@@ -0,0 +1,62 @@
+"""
+Benchmark: looking up a Dockerfile template by walking sys.prefix versus the _artifact template registry.
+
+check_artifact used to call find_file(starting_directory=sys.prefix, filename="Dockerfile"), an os.walk
+over the whole Python installation. This builds a synthetic prefix of site-packages-like directories and
+compares that walk with the packaged-template lookup and with the cached index of a user template
+directory the size of the prefix.
+
+    python benchmarks/bench_artifact_templates.py [files]
+"""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from _artifact import _artifact_registry as _artifact_registry_
+from _util import _util_file as _util_file_
+
+FILES_PER_PACKAGE = 100
+
+
+def synthetic_prefix(root: str, files: int) -> None:
+    """A prefix with `files` files spread over packages, and a Dockerfile in the last package only."""
+    packages = max(1, files // FILES_PER_PACKAGE)
+    for package in range(packages):
+        dirpath = os.path.join(root, "lib", "python3.11", "site-packages", f"package_{package:05d}", "module")
+        os.makedirs(dirpath)
+        for index in range(FILES_PER_PACKAGE):
+            open(os.path.join(dirpath, f"file_{index:03d}.py"), "w").close()
+    open(os.path.join(dirpath, "Dockerfile"), "w").close()
+
+
+def timed(function, *args, repeat: int = 1) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function(*args)
+    return (time.perf_counter() - start) / repeat
+
+
+def main(files: int) -> None:
+    with tempfile.TemporaryDirectory(prefix="bench_prefix_") as prefix:
+        synthetic_prefix(prefix, files)
+
+        # Where the walk meets the Dockerfile depends on the directory order of the filesystem
+        walk = timed(_util_file_.find_file, prefix, "Dockerfile")
+        full_walk = timed(_util_file_.find_file, prefix, "Dockerfile_missing")
+        packaged = timed(_artifact_registry_.load_template, "Dockerfile", (), repeat=1000)
+        index_build = timed(_artifact_registry_.directory_index, prefix)
+        index_lookup = timed(_artifact_registry_.find_template, "Dockerfile", (prefix,), repeat=1000)
+
+        print(f"files in prefix:           {files}")
+        print(f"os.walk of the prefix:     {walk * 1000:10.3f} ms  ({full_walk * 1000:.3f} ms for a missing template)")
+        print(f"packaged template:         {packaged * 1000:10.3f} ms")
+        print(f"user directory, first use: {index_build * 1000:10.3f} ms  (index built once)")
+        print(f"user directory, cached:    {index_lookup * 1000:10.3f} ms")
+        print(f"speedup, packaged:         {walk / packaged:10.0f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
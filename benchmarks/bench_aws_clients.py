@@ -0,0 +1,64 @@
+"""
+Benchmark: cost of building an ECR client per call versus reusing the shared client.
+
+Every stage used to build Session(**get_boto3_session_args()).client('ecr') before each call. This
+compares that pattern with src.aws_clients.get_client against moto, so only client construction and
+the local request path are measured.
+
+    python benchmarks/bench_aws_clients.py [iterations]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.pop("AWS_PROFILE", None)
+
+from boto3.session import Session
+from moto import mock_aws
+
+from src import aws_clients
+
+REGION = "us-east-1"
+REPOSITORY_NAME = "bench-repo"
+
+
+def per_call_client(iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        ecr_client = Session(region_name=REGION).client('ecr')
+        ecr_client.describe_repositories(repositoryNames=[REPOSITORY_NAME])
+    return time.perf_counter() - start
+
+
+def shared_client(iterations: int) -> float:
+    aws_clients.clear_cache()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        ecr_client = aws_clients.get_client('ecr', region_name=REGION)
+        ecr_client.describe_repositories(repositoryNames=[REPOSITORY_NAME])
+    return time.perf_counter() - start
+
+
+@mock_aws
+def main(iterations: int) -> None:
+    Session(region_name=REGION).client('ecr').create_repository(repositoryName=REPOSITORY_NAME)
+
+    # Warm up imports and the botocore loader caches so neither variant pays for them
+    per_call_client(2)
+    shared_client(2)
+
+    before = per_call_client(iterations)
+    after = shared_client(iterations)
+
+    print(f"iterations:           {iterations}")
+    print(f"client per call:      {before:8.3f}s  ({before / iterations * 1000:7.2f} ms/call)")
+    print(f"shared client:        {after:8.3f}s  ({after / iterations * 1000:7.2f} ms/call)")
+    print(f"speedup:              {before / after:8.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -0,0 +1,59 @@
+"""
+Benchmark: generating the handlers of a monorepo of applications with src.batch_handlers.
+
+Builds a synthetic monorepo of applications with a main.py each, then times the first generation, a
+second run where every handler is up to date, and a run after main.py changed in every application.
+
+    python benchmarks/bench_batch_handlers.py [applications] [workers]
+"""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src import batch_handlers
+
+MAIN_SOURCE = '''
+import json
+
+
+def main(role_arn: str, region: str = "us-east-1", retries: int = 3):
+    from _task import _task
+    return _task.list_s3_buckets(role_arn=role_arn, region=region, retries=retries)
+'''
+
+
+def synthetic_monorepo(root: str, applications: int) -> None:
+    for index in range(applications):
+        app_dir = os.path.join(root, "services", f"app_{index:03d}")
+        os.makedirs(os.path.join(app_dir, "pkg"))
+        with open(os.path.join(app_dir, "main.py"), "w") as file:
+            file.write(MAIN_SOURCE)
+        for module in range(20):
+            open(os.path.join(app_dir, "pkg", f"module_{module:02d}.py"), "w").close()
+
+
+def main(applications: int, workers: int) -> None:
+    with tempfile.TemporaryDirectory(prefix="bench_monorepo_") as root:
+        synthetic_monorepo(root, applications)
+        runs = []
+        for label in ("first generation", "up to date", "main.py changed"):
+            if label == "main.py changed":
+                for app_dir in batch_handlers.discover_apps(root):
+                    with open(os.path.join(app_dir, "main.py"), "a") as file:
+                        file.write("\n# changed\n")
+            start = time.perf_counter()
+            report = batch_handlers.generate_handlers(root, max_workers=workers)
+            runs.append((label, time.perf_counter() - start, report))
+
+        print(f"applications: {applications}, workers: {workers}")
+        for label, duration, report in runs:
+            print(f"{label:<17} {duration * 1000:10.1f} ms  "
+                  f"({len(report.generated)} generated, {len(report.unchanged)} unchanged, {len(report.failed)} failed)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+         int(sys.argv[2]) if len(sys.argv) > 2 else batch_handlers.DEFAULT_MAX_WORKERS)
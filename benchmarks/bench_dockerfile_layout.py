@@ -0,0 +1,88 @@
+"""
+Benchmark: rebuild time after a one-line code change, old Dockerfile layout versus the generated one.
+
+The old _artifact/Dockerfile copied the whole application before `pip install`, so any code change
+invalidated the dependency layer. src.gen_dockerfile installs requirements.txt first and copies the code
+last. For each layout the application is built once to warm the local cache, one line of
+lambda_function.py is changed and the rebuild is timed.
+
+Needs a running Docker daemon with access to the base image.
+
+    python benchmarks/bench_dockerfile_layout.py [requirement ...]
+"""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import docker
+
+from src.docker_stream import follow_build
+from src.gen_dockerfile import DEFAULT_BASE_IMAGE, render_dockerfile
+
+OLD_LAYOUT = f"""FROM {DEFAULT_BASE_IMAGE}
+COPY . .
+RUN pip install --no-cache-dir -r requirements.txt
+CMD [ "lambda_function.lambda_handler" ]
+"""
+
+HANDLER = """import json
+
+
+def lambda_handler(event, context):
+    return {{'statusCode': 200, 'body': json.dumps({message!r})}}
+"""
+
+
+def build(client: docker.DockerClient, dirpath: str, tag: str):
+    report = follow_build(client.api.build(path=dirpath, tag=tag, rm=True, decode=True), on_line=lambda line: None)
+    if not report.success:
+        raise RuntimeError(f"build of {tag} failed: {report.error}")
+    return report
+
+
+def rebuild_after_code_change(client: docker.DockerClient, dockerfile: str, requirements: list, tag: str):
+    with tempfile.TemporaryDirectory(prefix="bench_dockerfile_") as dirpath:
+        with open(os.path.join(dirpath, "Dockerfile"), "w") as file:
+            file.write(dockerfile)
+        with open(os.path.join(dirpath, "requirements.txt"), "w") as file:
+            file.write("\n".join(requirements) + "\n")
+        with open(os.path.join(dirpath, "lambda_function.py"), "w") as file:
+            file.write(HANDLER.format(message="before"))
+
+        build(client, dirpath, tag)
+
+        with open(os.path.join(dirpath, "lambda_function.py"), "w") as file:
+            file.write(HANDLER.format(message="after"))
+
+        start = time.perf_counter()
+        report = build(client, dirpath, tag)
+        return time.perf_counter() - start, report
+
+
+def main(requirements: list) -> None:
+    client = docker.from_env()
+    client.images.pull(DEFAULT_BASE_IMAGE)
+
+    layouts = [
+        ("old: COPY . . before pip", OLD_LAYOUT),
+        ("generated", render_dockerfile()),
+        ("generated, multi-stage", render_dockerfile(multi_stage=True)),
+    ]
+    print(f"requirements: {' '.join(requirements)}")
+    try:
+        for index, (name, dockerfile) in enumerate(layouts):
+            elapsed, report = rebuild_after_code_change(client, dockerfile, requirements, f"bench-layout:{index}")
+            print(f"{name:28} rebuild {elapsed:7.2f}s  {report.cache_hits}/{len(report.steps)} steps from cache")
+    finally:
+        for index in range(len(layouts)):
+            try:
+                client.images.remove(f"bench-layout:{index}", force=True)
+            except docker.errors.ImageNotFound:
+                pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or ["requests==2.32.3", "pydantic==2.9.2"])
@@ -0,0 +1,66 @@
+"""
+Benchmark: reading main() by importing main.py versus parsing it with src.main_analyzer.
+
+generate_lambda_handler used to execute main.py (load_module_from_path) so that inspect could read the
+signature of main(), which runs every top-level import of the application. This writes a main.py whose
+top level imports a set of standard-library modules standing in for heavy dependencies, and compares
+importing it, in a fresh interpreter as a first deployment would, with the static analysis.
+
+    python benchmarks/bench_handler_generation.py [repeat]
+"""
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.main_analyzer import analyze_main
+
+HEAVY_IMPORTS = ("asyncio", "decimal", "email.mime.multipart", "http.server", "json", "sqlite3",
+                 "unittest.mock", "urllib.request", "xml.etree.ElementTree", "zipfile")
+
+MAIN_SOURCE = "\n".join(f"import {module}" for module in HEAVY_IMPORTS) + '''
+
+
+def main(role_arn: str, region: str = "us-east-1"):
+    from _task import _task
+    return _task.list_s3_buckets(role_arn=role_arn, region=region)
+'''
+
+IMPORT_AND_INSPECT = '''
+import importlib.util, inspect, sys
+spec = importlib.util.spec_from_file_location("main", sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+inspect.signature(module.main)
+inspect.getsource(module.main)
+'''
+
+
+def timed(function, *args, repeat: int = 1) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function(*args)
+    return (time.perf_counter() - start) / repeat
+
+
+def main(repeat: int) -> None:
+    with tempfile.TemporaryDirectory(prefix="bench_handler_") as dirpath:
+        main_filepath = os.path.join(dirpath, "main.py")
+        with open(main_filepath, "w") as file:
+            file.write(MAIN_SOURCE)
+
+        interpreter = timed(subprocess.run, [sys.executable, "-c", "pass"], repeat=repeat)
+        imported = timed(subprocess.run, [sys.executable, "-c", IMPORT_AND_INSPECT, main_filepath], repeat=repeat)
+        analyzed = timed(analyze_main, main_filepath, repeat=repeat * 100)
+
+        print(f"top-level imports in main.py: {len(HEAVY_IMPORTS)}")
+        print(f"import and inspect:           {(imported - interpreter) * 1000:10.3f} ms  (interpreter start excluded)")
+        print(f"ast analysis:                 {analyzed * 1000:10.3f} ms")
+        print(f"speedup:                      {(imported - interpreter) / analyzed:10.0f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
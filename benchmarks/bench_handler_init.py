@@ -0,0 +1,65 @@
+"""
+Benchmark: hoisting the initializers of main() to the init phase, and short-circuiting keep-warm pings.
+
+The main() of the sample application builds a lookup table before answering, standing in for a boto3
+client, a configuration load or a model file. Its handler is generated three times and run through
+src.handler_benchmark, which imports it in fresh interpreters and replays events through it:
+
+- called: main() is called from main.py and builds the table on every invocation;
+- hoisted: the table is built once, at module scope, so init pays for it and invocations do not;
+- keep-warm pings: the same hoisted handler replaying {"keep_warm": true} events only.
+
+    python benchmarks/bench_handler_init.py [iterations]
+"""
+import os
+import sys
+import json
+import logging
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.gen_aws_lambda_handler import HandlerOptions, generate_lambda_handler
+from src.handler_benchmark import run_benchmark
+
+MAIN_SOURCE = '''
+import hashlib
+
+
+def main(key: str):
+    table = {hashlib.sha256(str(index).encode()).hexdigest()[:8]: index for index in range(50000)}
+    return table.get(key)
+'''
+
+
+def write_events(dirpath: str, name: str, events: list) -> str:
+    filepath = os.path.join(dirpath, name)
+    with open(filepath, "w") as file:
+        json.dump(events, file)
+    return filepath
+
+
+def main(iterations: int) -> None:
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory(prefix="bench_handler_init_") as dirpath:
+        with open(os.path.join(dirpath, "main.py"), "w") as file:
+            file.write(MAIN_SOURCE)
+        requests = write_events(dirpath, "requests.json", [{"queryStringParameters": {"key": "5feceb66"}}])
+        pings = write_events(dirpath, "pings.json", [{"keep_warm": True}])
+
+        runs = []
+        for label, options, events in (("called", HandlerOptions(), requests),
+                                        ("hoisted", HandlerOptions(hoist=("table",), keep_warm=True), requests),
+                                        ("keep-warm pings", HandlerOptions(hoist=("table",), keep_warm=True), pings)):
+            generate_lambda_handler(dirpath, options=options)
+            runs.append((label, run_benchmark(dirpath, events_path=events, iterations=iterations, cold_runs=3)))
+
+        print(f"{'handler':<16} {'init':>10} {'p50':>12} {'p99':>12} {'init + n x p50':>16}")
+        for label, result in runs:
+            total = result.init_ms + iterations * result.p50_ms
+            print(f"{label:<16} {result.init_ms:>7.2f} ms {result.p50_ms:>9.4f} ms {result.p99_ms:>9.4f} ms "
+                  f"{total:>13.1f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -0,0 +1,80 @@
+"""
+Benchmark: init time of a generated handler with eager imports versus LazyImport proxies.
+
+The main() of the sample application serves several code paths, each needing one of a set of
+standard-library modules standing in for heavy dependencies; a request only takes one of them. Its
+handler is generated with and without HandlerOptions.lazy_imports and run through
+src.handler_benchmark, which imports it in fresh interpreters and replays requests of one code path.
+
+With eager imports the init phase imports every dependency. With lazy imports it imports none of them,
+and the first request of a code path pays for the import of its own dependency only, which shows
+in the max latency.
+
+    python benchmarks/bench_lazy_imports.py [iterations]
+"""
+import os
+import sys
+import json
+import logging
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.gen_aws_lambda_handler import HandlerOptions, generate_lambda_handler
+from src.handler_benchmark import run_benchmark
+
+MAIN_SOURCE = '''
+import asyncio
+import decimal
+import email.mime.multipart
+import http.server
+import sqlite3
+import unittest.mock
+import urllib.request
+import xml.etree.ElementTree
+import zipfile
+
+
+def main(mode: str = "decimal", value: str = "1.5"):
+    return {
+        "async": lambda: type(asyncio.get_event_loop_policy()).__name__,
+        "decimal": lambda: str(decimal.Decimal(value)),
+        "http": lambda: http.server.BaseHTTPRequestHandler.responses[200][0],
+        "mail": lambda: email.mime.multipart.MIMEMultipart().get_content_type(),
+        "mock": lambda: unittest.mock.sentinel.value is not None,
+        "sqlite": lambda: sqlite3.sqlite_version,
+        "url": lambda: len(urllib.request.getproxies()),
+        "xml": lambda: xml.etree.ElementTree.fromstring(value).tag,
+        "zip": lambda: zipfile.is_zipfile(value),
+    }[mode]()
+'''
+
+
+def main(iterations: int) -> None:
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory(prefix="bench_lazy_imports_") as dirpath:
+        with open(os.path.join(dirpath, "main.py"), "w") as file:
+            file.write(MAIN_SOURCE)
+        events_path = os.path.join(dirpath, "events.json")
+        with open(events_path, "w") as file:
+            json.dump([{"queryStringParameters": {"mode": "decimal", "value": "2.5"}}], file)
+
+        runs = []
+        for label, options in (("eager", HandlerOptions()), ("lazy", HandlerOptions(lazy_imports=True))):
+            generate_lambda_handler(dirpath, options=options)
+            runs.append((label, run_benchmark(dirpath, events_path=events_path, iterations=iterations, cold_runs=5)))
+
+        print(f"{'imports':<8} {'init':>10} {'max latency':>14} {'p50':>12} {'modules at init':>16}")
+        for label, result in runs:
+            print(f"{label:<8} {result.init_ms:>7.2f} ms {result.max_ms:>11.3f} ms {result.p50_ms:>9.4f} ms "
+                  f"{len(result.imports):>16}")
+        (_, eager), (_, lazy) = runs
+        print(f"init time saved by lazy imports: {eager.init_ms - lazy.init_ms:.2f} ms "
+              f"({(1 - lazy.init_ms / eager.init_ms) * 100:.0f}%)")
+        print("slowest imports at init, eager:")
+        for module in eager.imports[:5]:
+            print(f"  {module.cumulative_us / 1000:8.2f} ms  {module.module}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
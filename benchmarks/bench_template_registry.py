@@ -0,0 +1,76 @@
+"""
+Benchmark: compiling the handler template for every application versus the shared template registry.
+
+apply_template used to build a new jinja2.Template from the template source on every call, so a batch
+generating the handlers of many applications compiled the same template once per application. This
+renders the API Gateway handler for a batch of applications both ways, and measures a first render in a
+new process with and without the on-disk bytecode cache.
+
+    python benchmarks/bench_template_registry.py [applications]
+"""
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from jinja2 import Template
+
+from src import template_registry
+from src.gen_aws_lambda_handler import handler_params
+from src.main_analyzer import analyze_main_source
+
+MAIN_SOURCE = '''
+def main(role_arn: str, region: str = "us-east-1"):
+    from _task import _task
+    return _task.list_s3_buckets(role_arn=role_arn, region=region)
+'''
+
+FIRST_RENDER = '''
+import sys, time
+sys.path.insert(0, sys.argv[1])
+start = time.perf_counter()
+from src import template_registry
+template_registry.get_template("api_gateway_handler")
+print(time.perf_counter() - start)
+'''
+
+
+def first_render(cache_dir: str) -> float:
+    root = os.path.join(os.path.dirname(__file__), '..')
+    output = subprocess.run([sys.executable, "-c", FIRST_RENDER, root], capture_output=True, text=True,
+                            env={**os.environ, "TEMPLATE_CACHE_DIR": cache_dir}, check=True).stdout
+    return float(output)
+
+
+def main(applications: int) -> None:
+    params = handler_params(analyze_main_source(MAIN_SOURCE))
+    source = template_registry.template_source("api_gateway_handler")
+    options = dict(trim_blocks=True, lstrip_blocks=True)
+
+    start = time.perf_counter()
+    for _ in range(applications):
+        Template(source, **options).render(**params)
+    per_call = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(applications):
+        template_registry.render("api_gateway_handler", **params)
+    registry = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory(prefix="bench_jinja_") as cache_dir:
+        cold = first_render(cache_dir)
+        warm = first_render(cache_dir)
+
+    print(f"applications:                    {applications}")
+    print(f"new Template per application:    {per_call * 1000:10.3f} ms")
+    print(f"template registry:               {registry * 1000:10.3f} ms  (compiled once)")
+    print(f"speedup:                         {per_call / registry:10.1f}x")
+    print(f"new process, no bytecode cache:  {cold * 1000:10.3f} ms")
+    print(f"new process, bytecode cache:     {warm * 1000:10.3f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 40)
@@ -0,0 +1,71 @@
+"""
+Benchmark: fingerprinting a large application tree, full read versus the stat-cached Merkle digest.
+
+A full read on one thread, without the stat cache, reads every byte of the tree on every deployment.
+_util_hash.tree_digest reads the files in a thread pool on the first run and, on later runs, only the
+files whose stat changed. The synthetic tree mimics a Lambda application with vendored packages and
+a few large model files.
+
+    python benchmarks/bench_tree_digest.py [files]
+"""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from _util import _util_file as _util_file_
+from _util import _util_hash as _util_hash_
+
+FILES_PER_PACKAGE = 100
+LARGE_FILES = 4
+LARGE_FILE_SIZE = 32 * 1024 * 1024
+
+
+def synthetic_app(root: str, files: int) -> None:
+    for package in range(max(1, files // FILES_PER_PACKAGE)):
+        dirpath = os.path.join(root, "vendor", f"package_{package:05d}")
+        os.makedirs(dirpath)
+        for index in range(FILES_PER_PACKAGE):
+            with open(os.path.join(dirpath, f"module_{index:03d}.py"), "wb") as file:
+                file.write(os.urandom(2048))
+    os.makedirs(os.path.join(root, "models"))
+    for index in range(LARGE_FILES):
+        with open(os.path.join(root, "models", f"model_{index}.bin"), "wb") as file:
+            file.write(os.urandom(LARGE_FILE_SIZE))
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main(files: int) -> None:
+    with tempfile.TemporaryDirectory(prefix="bench_tree_") as root:
+        synthetic_app(os.path.join(root, "app"), files)
+        app = os.path.join(root, "app")
+        cache_path = os.path.join(root, "hash_cache.json")
+        # Files written a moment ago are inside the racy window and would never be cached
+        _util_hash_.RACY_WINDOW_NS = 0
+
+        full, _ = timed(_util_hash_.tree_digest, app, use_cache=False, max_workers=1)
+        cold, cold_result = timed(_util_hash_.tree_digest, app, cache_path=cache_path)
+        warm, warm_result = timed(_util_hash_.tree_digest, app, cache_path=cache_path)
+        scan, _ = timed(_util_file_.scan_directory, app)
+
+        with open(os.path.join(app, "vendor", "package_00000", "module_000.py"), "ab") as file:
+            file.write(b"# changed\n")
+        one_change, changed_result = timed(_util_hash_.tree_digest, app, cache_path=cache_path)
+
+        print(f"files:                        {files + LARGE_FILES} ({LARGE_FILES} x {LARGE_FILE_SIZE >> 20} MB)")
+        print(f"full read, one thread:        {full * 1000:9.1f} ms")
+        print(f"tree_digest, cold:            {cold * 1000:9.1f} ms  ({cold_result.hashed} files read)")
+        print(f"tree_digest, warm:            {warm * 1000:9.1f} ms  ({warm_result.hashed} files read)")
+        print(f"  of which scan_directory:    {scan * 1000:9.1f} ms")
+        print(f"tree_digest, one file edited: {one_change * 1000:9.1f} ms  ({changed_result.hashed} files read)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 30000)
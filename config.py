@@ -1,10 +1,17 @@
 """
 Configuration module for Lambda Docker deployment.
+
+The configuration of a deployment is resolved once into an immutable DeployConfig and passed to every
+stage explicitly, so several deployments can run side by side in one process. Importing this module has
+no side effects: the .env file is only read by DeployConfig.from_env.
 """
 import os
 import sys
+import dataclasses
+from dataclasses import dataclass, field
 from pathlib import Path
-from dotenv import load_dotenv
+from typing import Dict, Mapping, Optional, Tuple
+from dotenv import dotenv_values
 
 # Add the project root to the Python path to import the logging module
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
@@ -12,131 +19,223 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 # Import the PGLogger
 from _logging.pg_logger import get_logger
 
-# Load environment variables from .env file
-env_file = os.environ.get("ENV_FILE", ".env")
-env_file = ".env1"
-# print(env_file)
-# with open(env_file) as f:
-#     print(f.read())
-# exit(0)
-load_dotenv(env_file)
-print(os.environ)
-print(os.environ.get("ECR_REPOSITORY_NAME"))
-
-# Configure the logger
-logger = get_logger(
-    name="deployment_config",
-    log_level=os.environ.get("LOG_LEVEL", "INFO"),
-    log_to_console=True,
-    log_to_file=True,
-    log_file_path=os.environ.get("LOG_FILE_PATH", "/tmp/lambda_deployment.log")
-)
-
-# AWS Configuration
-AWS_REGION = os.environ.get("AWS_REGION", "us-east-1")
-AWS_ACCOUNT_ID = os.environ.get("AWS_ACCOUNT_ID", "")
-AWS_PROFILE = os.environ.get("AWS_PROFILE", None)
-
-# ECR Configuration
-ECR_REPOSITORY_NAME = os.environ.get("ECR_REPOSITORY_NAME", "lambda-docker")
-ECR_IMAGE_TAG = os.environ.get("ECR_IMAGE_TAG", "latest")
-
-# Application Location Configuration
-APP_LOCATION = os.environ.get("APP_LOCATION", None)
-
-# Lambda Configuration
-LAMBDA_FUNCTION_NAME = os.environ.get("LAMBDA_FUNCTION_NAME", "lambda-docker-function")
-LAMBDA_MEMORY_SIZE = int(os.environ.get("LAMBDA_MEMORY_SIZE", "128"))
-LAMBDA_TIMEOUT = int(os.environ.get("LAMBDA_TIMEOUT", "30"))
-LAMBDA_ENVIRONMENT = {
-    "Variables": {
-        "ENVIRONMENT": os.environ.get("ENVIRONMENT", "development"),
-        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "INFO")
-    }
-}
-
 # Project paths
 PROJECT_ROOT = Path(__file__).parent.parent
 
-# Use custom application location if provided
-if APP_LOCATION:
-    APP_ROOT = Path(APP_LOCATION)
-    DOCKERFILE_PATH = APP_ROOT / "Dockerfile"
-    APP_DIR = APP_ROOT / "app"
-else:
-    APP_ROOT = PROJECT_ROOT
-    DOCKERFILE_PATH = PROJECT_ROOT / "Dockerfile"
-    APP_DIR = PROJECT_ROOT / "app"
-
-
-def get_ecr_repository_uri():
-    """Get the ECR repository URI."""
-    if not AWS_ACCOUNT_ID:
-        logger.error("AWS_ACCOUNT_ID is not set")
-        return None
-    return f"{AWS_ACCOUNT_ID}.dkr.ecr.{AWS_REGION}.amazonaws.com/{ECR_REPOSITORY_NAME}"
-
-
-def get_image_uri():
-    """Get the full image URI including tag."""
-    repo_uri = get_ecr_repository_uri()
-    if not repo_uri:
-        return None
-    return f"{repo_uri}:{ECR_IMAGE_TAG}"
-
-
-def get_boto3_session_args():
-    """Get the arguments for creating a boto3 session."""
-    session_args = {
-        'region_name': AWS_REGION
-    }
 
-    if AWS_PROFILE:
-        session_args['profile_name'] = AWS_PROFILE
-        logger.info(f"Using AWS profile: {AWS_PROFILE}")
-    else:
-        logger.info("Using default AWS credentials")
-
-    return session_args
-
-
-def validate_app_location():
-    """Validate the application location."""
-    if APP_LOCATION:
-        app_path = Path(APP_LOCATION)
+def _logger():
+    """The configuration logger, created on first use rather than at import time."""
+    return get_logger(
+        name="deployment_config",
+        log_level=os.environ.get("LOG_LEVEL", "INFO"),
+        log_to_console=True,
+        log_to_file=True,
+        log_file_path=os.environ.get("LOG_FILE_PATH", "/tmp/lambda_deployment.log")
+    )
+
+
+@dataclass(frozen=True)
+class DeployConfig:
+    """Everything one deployment needs to know, resolved once and never mutated."""
+
+    # AWS Configuration
+    aws_region: str = "us-east-1"
+    aws_account_id: str = ""
+    aws_profile: Optional[str] = None
+
+    # ECR Configuration
+    ecr_repository_name: str = "lambda-docker"
+    ecr_image_tag: str = "latest"
+    ecr_scan_on_push: bool = True
+    ecr_encryption_type: str = "AES256"
+
+    # Build cache Configuration: "" (off), "inline" or "registry", kept under build_cache_tag in the repository
+    build_cache: str = ""
+    build_cache_tag: str = "buildcache"
+    build_context_gzip: bool = False
+
+    # Application Location Configuration
+    app_location: Optional[str] = None
+
+    # Dockerfile generated for applications without one; a static template name from _artifact
+    # (e.g. Dockerfile_aws_linux_2) is copied as is instead
+    docker_base_image: str = "public.ecr.aws/lambda/python:3.11"
+    docker_multi_stage: bool = False
+    dockerfile_template: str = ""
+
+    # Template of the generated lambda_function.py, by event source: api_gateway_handler,
+    # sqs_batch_handler or scheduled_handler (src.template_registry)
+    handler_template: str = "api_gateway_handler"
+    # Response cache of the generated API Gateway handler across warm invocations, off when the TTL is 0
+    handler_cache_ttl: float = 0.0
+    handler_cache_max_entries: int = 128
+    handler_cache_max_bytes: int = 8 * 1024 * 1024
+    # Names assigned in main() to compute once during the init phase, and keep-warm pings short-circuited
+    handler_hoist: Tuple[str, ...] = ()
+    handler_keep_warm: bool = False
+    # Import the dependencies of the generated handler on first use, instead of during the init phase
+    handler_lazy_imports: bool = False
+
+    # Install the requirements offline from a local wheelhouse built for this pip platform tag
+    wheelhouse: bool = False
+    wheelhouse_platform: str = "manylinux2014_x86_64"
+
+    # Lambda Configuration
+    lambda_function_name: str = "lambda-docker-function"
+    lambda_memory_size: int = 128
+    lambda_timeout: int = 30
+    lambda_environment: Dict = field(default_factory=lambda: {
+        "Variables": {"ENVIRONMENT": "development", "LOG_LEVEL": "INFO"}
+    })
+
+    @classmethod
+    def from_env(cls, env_file: Optional[str] = None, environ: Optional[Mapping[str, str]] = None,
+                 **overrides) -> "DeployConfig":
+        """
+        Resolve a configuration from the environment.
+
+        Values from env_file (ENV_FILE, or .env when not given) fill in whatever the environment does
+        not set; os.environ itself is left untouched. Keyword arguments override the resolved fields.
+
+        Args:
+            env_file: path of the .env file to read
+            environ: environment to read instead of os.environ
+            **overrides: DeployConfig fields to set explicitly, ignored when None
+
+        Returns:
+            DeployConfig: the resolved configuration
+        """
+        environ = os.environ if environ is None else environ
+        env_file = env_file or environ.get("ENV_FILE", ".env")
+        env = {**(dotenv_values(env_file) if os.path.isfile(env_file) else {}), **environ}
+
+        config = cls(
+            aws_region=env.get("AWS_REGION", "us-east-1"),
+            aws_account_id=env.get("AWS_ACCOUNT_ID", ""),
+            aws_profile=env.get("AWS_PROFILE") or None,
+            ecr_repository_name=env.get("ECR_REPOSITORY_NAME", "lambda-docker"),
+            ecr_image_tag=env.get("ECR_IMAGE_TAG", "latest"),
+            ecr_scan_on_push=env.get("ECR_SCAN_ON_PUSH", "true").lower() == "true",
+            ecr_encryption_type=env.get("ECR_ENCRYPTION_TYPE", "AES256"),
+            build_cache=env.get("BUILD_CACHE", "").lower(),
+            build_cache_tag=env.get("BUILD_CACHE_TAG", "buildcache"),
+            build_context_gzip=env.get("BUILD_CONTEXT_GZIP", "false").lower() == "true",
+            app_location=env.get("APP_LOCATION") or None,
+            docker_base_image=env.get("DOCKER_BASE_IMAGE", "public.ecr.aws/lambda/python:3.11"),
+            docker_multi_stage=env.get("DOCKER_MULTI_STAGE", "false").lower() == "true",
+            dockerfile_template=env.get("DOCKERFILE_TEMPLATE", ""),
+            handler_template=env.get("HANDLER_TEMPLATE", "api_gateway_handler"),
+            handler_cache_ttl=float(env.get("HANDLER_CACHE_TTL", "0")),
+            handler_cache_max_entries=int(env.get("HANDLER_CACHE_MAX_ENTRIES", "128")),
+            handler_cache_max_bytes=int(float(env.get("HANDLER_CACHE_MAX_MB", "8")) * 1024 * 1024),
+            handler_hoist=tuple(name.strip() for name in env.get("HANDLER_HOIST", "").split(",") if name.strip()),
+            handler_keep_warm=env.get("HANDLER_KEEP_WARM", "false").lower() == "true",
+            handler_lazy_imports=env.get("HANDLER_LAZY_IMPORTS", "false").lower() == "true",
+            wheelhouse=env.get("WHEELHOUSE", "false").lower() == "true",
+            wheelhouse_platform=env.get("WHEELHOUSE_PLATFORM", "manylinux2014_x86_64"),
+            lambda_function_name=env.get("LAMBDA_FUNCTION_NAME", "lambda-docker-function"),
+            lambda_memory_size=int(env.get("LAMBDA_MEMORY_SIZE", "128")),
+            lambda_timeout=int(env.get("LAMBDA_TIMEOUT", "30")),
+            lambda_environment={
+                "Variables": {
+                    "ENVIRONMENT": env.get("ENVIRONMENT", "development"),
+                    "LOG_LEVEL": env.get("LOG_LEVEL", "INFO")
+                }
+            }
+        )
+        return config.replace(**overrides)
+
+    def replace(self, **overrides) -> "DeployConfig":
+        """A copy of this configuration with the given fields changed; None values are ignored."""
+        overrides = {key: value for key, value in overrides.items() if value is not None}
+        return dataclasses.replace(self, **overrides) if overrides else self
+
+    @property
+    def app_root(self) -> Path:
+        """Directory holding the application and its Dockerfile."""
+        return Path(self.app_location) if self.app_location else PROJECT_ROOT
+
+    @property
+    def dockerfile_path(self) -> Path:
+        return self.app_root / "Dockerfile"
+
+    @property
+    def app_dir(self) -> Path:
+        return self.app_root / "app"
+
+    @property
+    def local_image(self) -> str:
+        """Name of the image in the local Docker daemon."""
+        return f"{self.ecr_repository_name}:{self.ecr_image_tag}"
+
+    def get_ecr_repository_uri(self) -> Optional[str]:
+        """Get the ECR repository URI."""
+        if not self.aws_account_id:
+            _logger().error("AWS_ACCOUNT_ID is not set")
+            return None
+        return f"{self.aws_account_id}.dkr.ecr.{self.aws_region}.amazonaws.com/{self.ecr_repository_name}"
+
+    def get_image_uri(self, image_tag: Optional[str] = None) -> Optional[str]:
+        """Get the full image URI including tag (ecr_image_tag unless another tag is given)."""
+        repo_uri = self.get_ecr_repository_uri()
+        if not repo_uri:
+            return None
+        return f"{repo_uri}:{image_tag or self.ecr_image_tag}"
+
+    def get_boto3_session_args(self) -> Dict:
+        """Get the arguments for creating a boto3 session."""
+        session_args = {
+            'region_name': self.aws_region
+        }
+
+        if self.aws_profile:
+            session_args['profile_name'] = self.aws_profile
+            _logger().info(f"Using AWS profile: {self.aws_profile}")
+        else:
+            _logger().info("Using default AWS credentials")
+
+        return session_args
+
+
+def validate_app_location(config: DeployConfig):
+    """Validate the application location (a missing Dockerfile is generated later by check_artifact)."""
+    logger = _logger()
+    if config.app_location:
+        app_path = Path(config.app_location)
         if not app_path.exists():
-            logger.error(f"Application location does not exist: {APP_LOCATION}")
+            logger.error(f"Application location does not exist: {config.app_location}")
             return False
 
-        dockerfile_path = app_path / "Dockerfile"
-        if not dockerfile_path.exists():
-            logger.error(f"Dockerfile not found at: {dockerfile_path}")
-            return False
-
-        logger.info(f"Using custom application location: {APP_LOCATION}")
+        logger.info(f"Using custom application location: {config.app_location}")
     else:
         logger.info(f"Using default application location: {PROJECT_ROOT}")
 
     return True
 
 
-def validate_config():
+def validate_config(config: DeployConfig):
     """Validate the configuration."""
-    if not AWS_ACCOUNT_ID:
+    logger = _logger()
+    if not config.aws_account_id:
         logger.error("AWS_ACCOUNT_ID is not set")
         return False
 
-    if not ECR_REPOSITORY_NAME:
+    if not config.ecr_repository_name:
         logger.error("ECR_REPOSITORY_NAME is not set")
         return False
 
-    if not LAMBDA_FUNCTION_NAME:
+    if not config.lambda_function_name:
         logger.error("LAMBDA_FUNCTION_NAME is not set")
         return False
 
-    if not validate_app_location():
+    if config.build_cache not in ("", "inline", "registry"):
+        logger.error(f"BUILD_CACHE must be inline or registry, got: {config.build_cache}")
+        return False
+
+    if not validate_app_location(config):
         return False
 
     logger.info(
-        f"Configuration validated: Region={AWS_REGION}, ECR={ECR_REPOSITORY_NAME}, Lambda={LAMBDA_FUNCTION_NAME}")
+        f"Configuration validated: Region={config.aws_region}, ECR={config.ecr_repository_name}, "
+        f"Lambda={config.lambda_function_name}")
     return True
@@ -11,11 +11,12 @@ from pathlib import Path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
 # Import the deployment config and logging
-from config import validate_config
+from config import DeployConfig, validate_config
 # from lambda_docker.deployment.scripts.deploy_to_ecr import deploy_to_ecr
 # from lambda_docker.deployment.scripts.update_lambda import update_lambda
 
-from src import deploy_to_ecr
+from src import deploy_to_ecr, batch_deploy
+from src.build_cache import CACHE_MODES
 from _logging.pg_logger import get_logger, log_method, error_logger
 
 # Configure the logger
@@ -114,10 +115,23 @@ from pathlib import Path
 @click.option("--env-file", type=click.Path(exists=True), help="Path to .env file")
 @click.option("--ecr-only", is_flag=True, help="Deploy to ECR only")
 @click.option("--lambda-only", is_flag=True, help="Update Lambda only")
-@click.option("--app-location", type=click.Path(exists=True), help="Path to application directory containing Dockerfile")
+@click.option("--app-location", type=click.Path(exists=True), multiple=True,
+              help="Path to application directory containing Dockerfile (repeat to deploy several applications)")
 @click.option("--ecr-repository-name", type=str, help="Name of the ECR repository")
+@click.option("--force-build", is_flag=True, help="Build and push even if ECR already has an image for this app fingerprint")
+@click.option("--build-cache", type=click.Choice(["off", *CACHE_MODES]),
+              help="Import and export the BuildKit layer cache through a cache tag in the ECR repository "
+                   "(defaults to BUILD_CACHE)")
+@click.option("--wheelhouse/--no-wheelhouse", default=None,
+              help="Install the requirements offline from a local wheelhouse (defaults to WHEELHOUSE)")
+@click.option("--manifest", type=click.Path(exists=True), help="YAML manifest listing the applications to deploy")
+@click.option("--max-parallel-builds", type=int, default=batch_deploy.DEFAULT_MAX_PARALLEL_BUILDS, show_default=True,
+              help="Maximum number of concurrent docker builds in a batch deployment")
+@click.option("--max-parallel-pushes", type=int, default=batch_deploy.DEFAULT_MAX_PARALLEL_PUSHES, show_default=True,
+              help="Maximum number of concurrent docker pushes in a batch deployment")
 @log_method(level="info")
-def main(env_file, ecr_only, lambda_only, app_location, ecr_repository_name):
+def main(env_file, ecr_only, lambda_only, app_location, ecr_repository_name, force_build, build_cache,
+         wheelhouse, manifest, max_parallel_builds, max_parallel_pushes):
 
     """Main deployment function."""
     start_time = time.time()
@@ -125,27 +139,57 @@ def main(env_file, ecr_only, lambda_only, app_location, ecr_repository_name):
 
     # Load environment variables from .env file if provided
     if env_file:
-        os.environ["ENV_FILE"] = str(env_file)
         logger.info(f"Using environment file: {env_file}")
+    config = DeployConfig.from_env(env_file=env_file)
+    if build_cache:
+        config = config.replace(build_cache="" if build_cache == "off" else build_cache)
+    config = config.replace(wheelhouse=wheelhouse)
+
+    # Several applications, or a manifest, are deployed as a batch
+    if manifest or len(app_location) > 1:
+        # One repository per application: the name comes from the directory name or from the manifest
+        if ecr_repository_name:
+            logger.error("--ecr-repository-name applies to a single application, set ecr_repository_name "
+                         "per application in a --manifest instead")
+            sys.exit(1)
+        apps = batch_deploy.load_manifest(manifest, config) if manifest else []
+        apps += [batch_deploy.app_config(config, str(location)) for location in app_location]
+        if invalid := batch_deploy.invalid_repository_names(apps):
+            logger.error("Invalid ECR repository names:\n  " + "\n  ".join(invalid))
+            sys.exit(1)
+
+        if not validate_config(config):
+            logger.error("Configuration validation failed")
+            sys.exit(1)
+
+        results = batch_deploy.run_batch(apps,
+                                         max_parallel_builds=max_parallel_builds,
+                                         max_parallel_pushes=max_parallel_pushes,
+                                         force_build=force_build)
+        click.echo(batch_deploy.format_results(results))
+        logger.info(f"Batch deployment finished in {time.time() - start_time:.2f} seconds")
+        sys.exit(0 if all(result.success for result in results) else 1)
+
+    app_location = app_location[0] if app_location else None
 
     # Set application location if provided
     if app_location:
-        os.environ["APP_LOCATION"] = str(app_location)
         logger.info(f"Using application location: {app_location}")
         
     # Set ECR repository name if provided
     if ecr_repository_name:
-        os.environ["ECR_REPOSITORY_NAME"] = ecr_repository_name
         logger.info(f"Using ECR repository name: {ecr_repository_name}")
 
+    config = config.replace(app_location=app_location, ecr_repository_name=ecr_repository_name)
+
     # Validate configuration
-    if not validate_config():
+    if not validate_config(config):
         logger.error("Configuration validation failed")
         return False
 
 
     # Deploy to ECR
-    if not deploy_to_ecr.run(app_location, ecr_repository_name):
+    if not deploy_to_ecr.run(config, force_build=force_build):
         logger.error("Deployment to ECR failed")
         return False
 
@@ -0,0 +1,91 @@
+"""
+Shared boto3 client factory.
+
+Building a boto3 session resolves credentials and loads the endpoint and service model data again, and
+every new client opens its own connection pool. Clients are therefore created once per
+(service, region, profile) and reused by every deployment stage and every application of a batch.
+boto3 clients are thread-safe once created; only their creation is serialized here.
+"""
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+from boto3.session import Session
+from botocore.config import Config
+
+from _logging.pg_logger import get_logger
+
+# Configure the logger
+logger = get_logger(
+    name="aws_clients",
+    log_level=os.environ.get("LOG_LEVEL", "INFO"),
+    log_to_console=True,
+    log_to_file=True,
+    log_file_path=os.environ.get("LOG_FILE_PATH", "/tmp/ecr_deployment.log")
+)
+
+# Large enough for the workers of a batch deployment to share one client without waiting on the pool
+DEFAULT_MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "32"))
+DEFAULT_MAX_ATTEMPTS = int(os.environ.get("AWS_MAX_ATTEMPTS", "10"))
+
+_lock = threading.Lock()
+_sessions: Dict[Tuple[Optional[str], Optional[str]], Session] = {}
+_clients: Dict[Tuple[str, Optional[str], Optional[str]], object] = {}
+
+
+def client_config(max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS,
+                  max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> Config:
+    """botocore configuration of the shared clients: pooled, kept alive and with adaptive retries."""
+    return Config(
+        max_pool_connections=max_pool_connections,
+        retries={'max_attempts': max_attempts, 'mode': 'adaptive'},
+        tcp_keepalive=True
+    )
+
+
+def get_session(region_name: Optional[str] = None, profile_name: Optional[str] = None) -> Session:
+    """The shared boto3 session of a region and profile."""
+    key = (region_name, profile_name)
+    with _lock:
+        if key not in _sessions:
+            _sessions[key] = Session(region_name=region_name, profile_name=profile_name)
+        return _sessions[key]
+
+
+def get_client(service_name: str,
+               region_name: Optional[str] = None,
+               profile_name: Optional[str] = None,
+               max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS):
+    """
+    The shared client of a service, created on first use.
+
+    The keyword arguments match the boto3 session arguments, so a client for a deployment is obtained
+    with get_client('ecr', **config.get_boto3_session_args()).
+
+    Args:
+        service_name: AWS service, e.g. 'ecr'
+        region_name: AWS region
+        profile_name: AWS profile
+        max_pool_connections: size of the connection pool, only used when the client is created
+
+    Returns:
+        the boto3 client
+    """
+    key = (service_name, region_name, profile_name)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    session = get_session(region_name, profile_name)
+    with _lock:
+        if key not in _clients:
+            logger.info(f"Creating {service_name} client for region={region_name} profile={profile_name}")
+            _clients[key] = session.client(service_name, config=client_config(max_pool_connections))
+        return _clients[key]
+
+
+def clear_cache() -> None:
+    """Forget every shared session and client, e.g. after the credentials changed."""
+    with _lock:
+        _clients.clear()
+        _sessions.clear()
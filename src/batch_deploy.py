@@ -0,0 +1,187 @@
+"""
+Deploy many Lambda applications to ECR concurrently.
+
+Builds are CPU bound and pushes are network bound, so each stage gets its own concurrency limit
+while the applications move through check_artifact, build and push in a shared worker pool.
+"""
+import os
+import re
+import sys
+import time
+import threading
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+# Add the project root to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+from config import DeployConfig
+from _logging.pg_logger import get_logger, log_method, error_logger
+from _util import _util_file as _util_file_
+from src import deploy_to_ecr
+
+# Configure the logger
+logger = get_logger(
+    name="batch_deploy",
+    log_level=os.environ.get("LOG_LEVEL", "INFO"),
+    log_to_console=True,
+    log_to_file=True,
+    log_file_path=os.environ.get("LOG_FILE_PATH", "/tmp/ecr_deployment.log")
+)
+
+DEFAULT_MAX_PARALLEL_BUILDS = max(1, (os.cpu_count() or 2) // 2)
+DEFAULT_MAX_PARALLEL_PUSHES = 4
+
+# Repository names ECR accepts, 2 to 256 characters
+_REPOSITORY_NAME = re.compile(r"(?:[a-z0-9]+(?:[._-][a-z0-9]+)*/)*[a-z0-9]+(?:[._-][a-z0-9]+)*")
+
+
+@dataclass
+class AppResult:
+    """Outcome of the deployment of one application."""
+    app_location: str
+    ecr_repository_name: str
+    success: bool = False
+    error: str = ""
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+def default_repository_name(app_location: str) -> str:
+    """ECR repository name derived from the application directory name."""
+    return os.path.basename(os.path.normpath(app_location)).lower()
+
+
+def invalid_repository_names(apps: List[DeployConfig]) -> List[str]:
+    """The applications whose ECR repository name ECR would reject, with the reason, one line each."""
+    problems = []
+    for app in apps:
+        name = app.ecr_repository_name
+        if not (2 <= len(name) <= 256 and _REPOSITORY_NAME.fullmatch(name)):
+            problems.append(f"{app.app_location}: '{name}' is not a valid ECR repository name, "
+                            f"set ecr_repository_name for it in the manifest")
+    return problems
+
+
+def app_config(config: DeployConfig, app_location: str, ecr_repository_name: Optional[str] = None) -> DeployConfig:
+    """Configuration of one application of a batch, derived from the shared configuration."""
+    return config.replace(app_location=app_location,
+                          ecr_repository_name=ecr_repository_name or default_repository_name(app_location))
+
+
+def load_manifest(filepath: str, config: DeployConfig) -> List[DeployConfig]:
+    """
+    Load the applications to deploy from a YAML manifest.
+
+    The manifest lists the applications under `apps`, either as plain paths or as mappings with
+    `app_location` and an optional `ecr_repository_name`. Relative paths are resolved against the
+    directory of the manifest; every other setting comes from config.
+
+        apps:
+          - services/orders
+          - app_location: services/billing
+            ecr_repository_name: billing-lambda
+    """
+    manifest = _util_file_.yaml_load(filepath) or {}
+    base_dirpath = os.path.dirname(os.path.abspath(filepath))
+
+    apps = []
+    for entry in manifest.get("apps", []):
+        if isinstance(entry, str):
+            entry = {"app_location": entry}
+        app_location = os.path.join(base_dirpath, os.path.expanduser(entry["app_location"]))
+        apps.append(app_config(config, os.path.normpath(app_location), entry.get("ecr_repository_name")))
+    return apps
+
+
+def deploy_app(app: DeployConfig,
+               build_slot: threading.Semaphore,
+               push_slot: threading.Semaphore,
+               force_build: bool = False) -> AppResult:
+    """Deploy one application, never raising so a failure does not abort the rest of the batch."""
+    result = AppResult(app_location=app.app_location, ecr_repository_name=app.ecr_repository_name)
+    start_time = time.time()
+    try:
+        result.success = deploy_to_ecr.run(app,
+                                           force_build=force_build,
+                                           build_slot=build_slot,
+                                           push_slot=push_slot,
+                                           timings=result.timings)
+        if not result.success:
+            result.error = "deployment failed, see log for details"
+    except (Exception, SystemExit) as e:
+        # Helpers decorated with _common.exception_handler exit the process on error, which would end
+        # the batch without a result for the applications already deployed
+        error = f"exited with code {e.code}" if isinstance(e, SystemExit) else str(e)
+        error_logger("deploy_app", error, logger=logger, mode="error", addition_msg=app.app_location)
+        result.error = error
+    result.timings["total"] = time.time() - start_time
+    return result
+
+
+@log_method(level="info")
+def run_batch(apps: List[DeployConfig],
+              max_parallel_builds: int = DEFAULT_MAX_PARALLEL_BUILDS,
+              max_parallel_pushes: int = DEFAULT_MAX_PARALLEL_PUSHES,
+              force_build: bool = False) -> List[AppResult]:
+    """
+    Deploy applications concurrently.
+
+    Args:
+        apps: configuration of every application to deploy
+        max_parallel_builds: maximum number of docker builds running at the same time
+        max_parallel_pushes: maximum number of docker pushes running at the same time
+        force_build: build and push even when ECR already has the app fingerprint
+
+    Returns:
+        List[AppResult]: one result per application, in the order of apps
+    """
+    if not apps:
+        return []
+
+    # Log in once up front so the workers find the token cached and Docker already logged in
+    if not deploy_to_ecr.login_to_ecr(apps[0]):
+        return [AppResult(app.app_location, app.ecr_repository_name, error="Failed to login to ECR") for app in apps]
+
+    build_slot = threading.BoundedSemaphore(max_parallel_builds)
+    push_slot = threading.BoundedSemaphore(max_parallel_pushes)
+    max_workers = min(len(apps), max_parallel_builds + max_parallel_pushes)
+
+    logger.info(f"Deploying {len(apps)} applications with {max_workers} workers "
+                f"({max_parallel_builds} parallel builds, {max_parallel_pushes} parallel pushes)")
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="deploy") as executor:
+        futures = [executor.submit(deploy_app, app, build_slot, push_slot, force_build) for app in apps]
+        return [future.result() for future in futures]
+
+
+def format_results(results: List[AppResult]) -> str:
+    """Render the batch results as a plain-text table."""
+    header = ("APP", "REPOSITORY", "STATUS", "PREPARE", "BUILD", "PUSH", "TOTAL", "CACHE")
+    rows = [header]
+    for result in results:
+        rows.append((
+            os.path.basename(os.path.normpath(result.app_location)),
+            result.ecr_repository_name,
+            "ok" if result.success else "FAILED",
+            *(_format_seconds(result.timings.get(stage)) for stage in ("prepare", "build", "push", "total")),
+            _format_cache(result.timings)
+        ))
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    lines = ["  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip() for row in rows]
+    for result in results:
+        if not result.success:
+            lines.append(f"{result.app_location}: {result.error}")
+    return "\n".join(lines)
+
+
+def _format_seconds(seconds: Optional[float]) -> str:
+    return "-" if seconds is None else f"{seconds:.1f}s"
+
+
+def _format_cache(timings: Dict) -> str:
+    """Cache hit ratio of the build, with the estimated time saved when known."""
+    if timings.get("cache_hit_ratio") is None:
+        return "-"
+    saved = timings.get("cache_time_saved")
+    return f"{timings['cache_hit_ratio']:.0%}" + (f" (-{saved:.1f}s)" if saved is not None else "")
@@ -0,0 +1,168 @@
+"""
+Generate the Lambda handlers of every application of a monorepo at once.
+
+Every directory holding a main.py is an application, unless it is inside another application (a
+package of that application). The handlers are generated or brought up to date in a process pool, so
+whatever happens while one application is handled stays in its worker, and the outcome of every
+application is collected into one report.
+
+    python -m src.batch_handlers ROOT [--template sqs_batch_handler] [--max-workers 8]
+"""
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import click
+
+# Add the project root to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from _logging.pg_logger import get_logger
+from _util import _util_file as _util_file_
+from src import build_context, template_registry
+from src.gen_aws_lambda_handler import (FAILED, GENERATED, UNCHANGED, HandlerOptions, HandlerResult,
+                                        ResponseCache, refresh_lambda_handler)
+
+# Configure the logger
+logger = get_logger(
+    name="batch_handlers",
+    log_level=os.environ.get("LOG_LEVEL", "INFO"),
+    log_to_console=True,
+    log_to_file=True,
+    log_file_path=os.environ.get("LOG_FILE_PATH", "/tmp/ecr_deployment.log")
+)
+
+DEFAULT_MAX_WORKERS = os.cpu_count() or 1
+
+
+@dataclass
+class HandlerReport:
+    """Outcome of a batch generation, one result per application."""
+    root: str
+    results: List[HandlerResult] = field(default_factory=list)
+    duration: float = 0.0
+
+    def _with_status(self, status: str) -> List[HandlerResult]:
+        return [result for result in self.results if result.status == status]
+
+    @property
+    def generated(self) -> List[HandlerResult]:
+        return self._with_status(GENERATED)
+
+    @property
+    def unchanged(self) -> List[HandlerResult]:
+        return self._with_status(UNCHANGED)
+
+    @property
+    def failed(self) -> List[HandlerResult]:
+        return self._with_status(FAILED)
+
+    @property
+    def success(self) -> bool:
+        return not self.failed
+
+    def summary(self) -> str:
+        lines = [f"{len(self.results)} applications in {self.root} in {self.duration:.2f}s: "
+                 f"{len(self.generated)} generated, {len(self.unchanged)} unchanged, {len(self.failed)} failed"]
+        lines += [f"  {result.status:<9} {os.path.relpath(result.app_dir, self.root)}"
+                  + (f": {result.detail}" if result.detail else "")
+                  for result in self.results if result.status != UNCHANGED]
+        return "\n".join(lines)
+
+
+def discover_apps(root: str) -> List[str]:
+    """
+    The application directories under root: the outermost directories holding a main.py.
+
+    Directories left out of build contexts (.git, virtualenvs, node_modules, ...) are not searched.
+    """
+    try:
+        manifest = _util_file_.scan_directory(root, ignore_patterns=build_context.DEFAULT_IGNORE_PATTERNS)
+    except OSError as e:
+        logger.error(f"Could not scan {root}: {e}")
+        return []
+    app_relpaths = []
+    # The manifest lists a directory before its subdirectories, so an application precedes its packages
+    for entry in manifest.files:
+        if entry.relpath.rsplit("/", 1)[-1] != "main.py":
+            continue
+        relpath = entry.relpath.rpartition("/")[0]
+        if not any(relpath == app or relpath.startswith(f"{app}/") or app == "" for app in app_relpaths):
+            app_relpaths.append(relpath)
+    return [os.path.join(manifest.root, relpath) if relpath else manifest.root for relpath in app_relpaths]
+
+
+def _refresh(app_dir: str, template_name: str, options: Optional[HandlerOptions]) -> HandlerResult:
+    try:
+        return refresh_lambda_handler(app_dir, template_name=template_name, options=options)
+    except Exception as e:
+        # An unexpected error fails this application only, not the batch
+        return HandlerResult(app_dir, FAILED, f"{type(e).__name__}: {e}")
+
+
+def generate_handlers(root: str,
+                      template_name: str = template_registry.DEFAULT_HANDLER_TEMPLATE,
+                      max_workers: Optional[int] = None,
+                      app_dirs: Optional[List[str]] = None,
+                      options: Optional[HandlerOptions] = None) -> HandlerReport:
+    """
+    Generate or refresh the lambda_function.py of every application under root.
+
+    Args:
+        root: directory of the monorepo
+        template_name: handler template of src.template_registry, the same for every application
+        max_workers: size of the process pool, the number of CPUs when not given; 1 handles the
+                     applications in this process
+        app_dirs: the application directories, discovered under root when not given
+        options: generation options of the handlers, the same for every application
+
+    Returns:
+        HandlerReport: the generated, unchanged and failed applications, in discovery order
+    """
+    start_time = time.time()
+    app_dirs = discover_apps(root) if app_dirs is None else app_dirs
+    max_workers = min(max_workers or DEFAULT_MAX_WORKERS, len(app_dirs)) or 1
+    logger.info(f"Generating the handlers of {len(app_dirs)} applications in {root} with {max_workers} workers")
+
+    if max_workers == 1:
+        results = [_refresh(app_dir, template_name, options) for app_dir in app_dirs]
+    else:
+        # Applications are handed out in chunks, starting a task costs about as much as one generation
+        chunksize = max(1, len(app_dirs) // (max_workers * 4))
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_refresh, app_dirs, [template_name] * len(app_dirs),
+                                        [options] * len(app_dirs), chunksize=chunksize))
+
+    report = HandlerReport(root=os.path.abspath(root), results=results, duration=time.time() - start_time)
+    logger.info(report.summary())
+    return report
+
+
+@click.command()
+@click.argument("root", type=click.Path(exists=True, file_okay=False))
+@click.option("--template", "template_name", type=click.Choice(template_registry.HANDLER_TEMPLATES),
+              default=template_registry.DEFAULT_HANDLER_TEMPLATE, show_default=True,
+              help="Handler template, by the event source of the functions")
+@click.option("--max-workers", type=int, default=DEFAULT_MAX_WORKERS, show_default=True,
+              help="Number of worker processes")
+@click.option("--cache-ttl", type=float, default=0, show_default=True,
+              help="Seconds the API Gateway handlers cache a response across warm invocations, 0 for no cache")
+@click.option("--hoist", multiple=True, help="Name assigned in main() to compute once, during the init phase")
+@click.option("--keep-warm/--no-keep-warm", default=False, show_default=True,
+              help="Return at once on keep-warm pings, without calling main()")
+@click.option("--lazy-imports/--eager-imports", default=False, show_default=True,
+              help="Import the dependencies of the handlers on first use instead of during the init phase")
+def main(root, template_name, max_workers, cache_ttl, hoist, keep_warm, lazy_imports):
+    """Generate or refresh the lambda_function.py of every application under ROOT."""
+    options = HandlerOptions(response_cache=ResponseCache(ttl=cache_ttl) if cache_ttl else None,
+                             hoist=tuple(hoist), keep_warm=keep_warm, lazy_imports=lazy_imports)
+    report = generate_handlers(root, template_name=template_name, max_workers=max_workers, options=options)
+    click.echo(report.summary())
+    sys.exit(0 if report.success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+BuildKit layer cache kept in the ECR repository of the application.
+
+CI runners start with an empty Docker cache, so the cache of the previous build is imported from, and
+exported to, a cache tag of the same repository (DeployConfig.build_cache_tag):
+
+- inline: the cache metadata is embedded in the image itself and the image is pushed under the cache
+  tag as well, so the next build can import it with --cache-from.
+- registry: the cache of every stage (mode=max) is exported to the cache tag as a separate cache
+  manifest. This needs `docker buildx` with a builder that supports cache export
+  (e.g. `docker buildx create --use --driver docker-container`).
+
+Cached steps report no duration, so the time a cache hit saved is estimated from the duration of the
+same instruction the last time it actually ran. Those durations travel with the cache: they are kept in
+the same repository, as an annotation of an empty OCI manifest tagged `<build_cache_tag>-steps`, so an
+ephemeral CI runner sees the history of the build that exported the cache it imports.
+"""
+import io
+import os
+import json
+import hashlib
+import subprocess
+from typing import Dict, Iterator, List, Optional
+
+import docker
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from config import DeployConfig
+from _logging.pg_logger import get_logger
+from src.aws_clients import get_client
+from src.build_context import feed_stdin
+from src.docker_stream import BuildReport, follow_buildkit
+from src.ecr_registry import get_image_manifest
+
+# Configure the logger
+logger = get_logger(
+    name="build_cache",
+    log_level=os.environ.get("LOG_LEVEL", "INFO"),
+    log_to_console=True,
+    log_to_file=True,
+    log_file_path=os.environ.get("LOG_FILE_PATH", "/tmp/ecr_deployment.log")
+)
+
+CACHE_MODES = ("inline", "registry")
+
+OCI_MANIFEST = "application/vnd.oci.image.manifest.v1+json"
+# The empty descriptor of the OCI image spec, the config of a manifest that only carries annotations
+OCI_EMPTY = "application/vnd.oci.empty.v1+json"
+OCI_EMPTY_BLOB = b"{}"
+STEPS_ANNOTATION = "aws_ecr_deploy.build-steps"
+
+
+def cache_ref(config: DeployConfig) -> Optional[str]:
+    """Image reference the build cache is imported from and exported to."""
+    return config.get_image_uri(config.build_cache_tag)
+
+
+def pushes_cache_tag(config: DeployConfig) -> bool:
+    """Whether the image itself has to be pushed under the cache tag (inline cache)."""
+    return config.build_cache == "inline"
+
+
+def buildx_command(config: DeployConfig, context_dir: str, dockerfile: str,
+                   build_contexts: Optional[Dict[str, str]] = None) -> List[str]:
+    """
+    The `docker buildx build` command of a cached build, or of a build needing other BuildKit features.
+
+    The image is loaded into the local Docker daemon, so it is tagged and pushed like any other build.
+
+    Args:
+        config: deployment configuration; the cache is imported and exported when build_cache is set
+        context_dir: build context directory, `-` when the context is streamed to stdin
+        dockerfile: path of the Dockerfile, relative to the context when it is streamed
+        build_contexts: additional named build contexts, name -> directory (e.g. the wheelhouse)
+
+    Returns:
+        List[str]: the command arguments
+    """
+    command = ["docker", "buildx", "build", "--progress=plain", "--load",
+               "-t", config.local_image, "-f", dockerfile]
+    for name, directory in (build_contexts or {}).items():
+        command += ["--build-context", f"{name}={directory}"]
+    if config.build_cache:
+        ref = cache_ref(config)
+        command += ["--cache-from", f"type=registry,ref={ref}"]
+        if config.build_cache == "registry":
+            # ECR only accepts the cache as an OCI image manifest
+            command += ["--cache-to", f"type=registry,ref={ref},mode=max,image-manifest=true,oci-mediatypes=true"]
+        else:
+            command += ["--cache-to", "type=inline"]
+    command.append(context_dir)
+    return command
+
+
+def needs_buildx(config: DeployConfig) -> bool:
+    """Whether the Engine API build cannot do this build: registry cache export and the wheelhouse mounts."""
+    return config.build_cache == "registry" or config.wheelhouse
+
+
+def run_buildx(command: List[str], context_chunks: Optional[Iterator[bytes]] = None) -> BuildReport:
+    """Run a buildx build, following its output live, and report it.
+
+    When context_chunks is given, the build context is streamed to stdin (the context argument is `-`).
+    """
+    logger.info(f"Running command: {' '.join(command)}")
+    process = subprocess.Popen(command, stdin=subprocess.PIPE if context_chunks is not None else None,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    if context_chunks is not None:
+        feed_stdin(process, context_chunks)
+    report = follow_buildkit(io.TextIOWrapper(process.stdout, encoding="utf-8", errors="replace"),
+                             cancel=process.terminate)
+    return_code = process.wait()
+    if return_code and report.success:
+        report.error = f"docker buildx build exited with code {return_code}"
+    return report
+
+
+def pull_cache_image(client: docker.DockerClient, config: DeployConfig) -> Optional[str]:
+    """
+    Pull the image of the cache tag so the Engine API build can use it with cache_from.
+
+    Returns:
+        Optional[str]: the pulled reference, None when there is no cache yet
+    """
+    ref = cache_ref(config)
+    try:
+        client.api.pull(config.get_ecr_repository_uri(), tag=config.build_cache_tag)
+        logger.info(f"Imported build cache from {ref}")
+        return ref
+    except (docker.errors.NotFound, docker.errors.APIError) as e:
+        logger.info(f"No build cache at {ref} yet: {e}")
+        return None
+
+
+def steps_tag(config: DeployConfig) -> str:
+    """Image tag of the manifest holding the step durations of the builds that exported the cache."""
+    return f"{config.build_cache_tag}-steps"
+
+
+def load_step_history(ecr_client, config: DeployConfig) -> Dict[str, float]:
+    """
+    Step durations recorded by earlier builds, instruction -> seconds.
+
+    Returns:
+        Dict[str, float]: the history, empty when there is none yet or it cannot be read
+    """
+    try:
+        image = get_image_manifest(ecr_client, config.ecr_repository_name, steps_tag(config))
+        if image is None:
+            return {}
+        history = json.loads(image["imageManifest"]).get("annotations", {}).get(STEPS_ANNOTATION, "{}")
+        return {instruction: float(duration) for instruction, duration in json.loads(history).items()
+                if duration is not None}
+    except (BotoCoreError, ClientError, ValueError, TypeError, AttributeError) as e:
+        logger.warning(f"Could not read build step durations from "
+                       f"{config.ecr_repository_name}:{steps_tag(config)}: {e}")
+        return {}
+
+
+def _upload_empty_blob(ecr_client, repository_name: str) -> str:
+    digest = f"sha256:{hashlib.sha256(OCI_EMPTY_BLOB).hexdigest()}"
+    upload_id = ecr_client.initiate_layer_upload(repositoryName=repository_name)["uploadId"]
+    try:
+        ecr_client.upload_layer_part(repositoryName=repository_name, uploadId=upload_id, partFirstByte=0,
+                                     partLastByte=len(OCI_EMPTY_BLOB) - 1, layerPartBlob=OCI_EMPTY_BLOB)
+        ecr_client.complete_layer_upload(repositoryName=repository_name, uploadId=upload_id, layerDigests=[digest])
+    except ecr_client.exceptions.LayerAlreadyExistsException:
+        pass
+    return digest
+
+
+def save_step_history(ecr_client, config: DeployConfig, history: Dict[str, float]) -> bool:
+    """
+    Point the steps tag at a manifest annotated with the given step durations.
+
+    Returns:
+        bool: True once the tag points at the history, False when the registry refused it
+    """
+    repository_name = config.ecr_repository_name
+    try:
+        manifest = {
+            "schemaVersion": 2,
+            "mediaType": OCI_MANIFEST,
+            "config": {"mediaType": OCI_EMPTY, "digest": _upload_empty_blob(ecr_client, repository_name),
+                       "size": len(OCI_EMPTY_BLOB)},
+            "layers": [],
+            "annotations": {STEPS_ANNOTATION: json.dumps(history, sort_keys=True)},
+        }
+        ecr_client.put_image(repositoryName=repository_name, imageManifest=json.dumps(manifest),
+                             imageManifestMediaType=OCI_MANIFEST, imageTag=steps_tag(config))
+    except ecr_client.exceptions.ImageAlreadyExistsException:
+        pass
+    except (BotoCoreError, ClientError) as e:
+        logger.warning(f"Could not record build step durations in {repository_name}:{steps_tag(config)}: {e}")
+        return False
+    return True
+
+
+def record_time_saved(config: DeployConfig, report: BuildReport, ecr_client=None) -> Optional[float]:
+    """
+    Estimate the time the cache hits of a build saved and remember the steps that ran.
+
+    Args:
+        config: deployment configuration
+        report: report of the finished build
+        ecr_client: boto3 ECR client, the shared client of the configured session by default
+
+    Returns:
+        Optional[float]: seconds saved, None when none of the cached steps ever ran here before
+    """
+    if ecr_client is None:
+        ecr_client = get_client('ecr', **config.get_boto3_session_args())
+    history = load_step_history(ecr_client, config)
+
+    known = [history[step.instruction] for step in report.steps if step.cached and step.instruction in history]
+    report.time_saved = sum(known) if known else None
+
+    # Only the instructions of the current Dockerfile are kept, so the history does not grow
+    updated = {step.instruction: history[step.instruction] if step.cached else step.duration
+               for step in report.steps if not step.cached or step.instruction in history}
+    if updated != history:
+        save_step_history(ecr_client, config, updated)
+    return report.time_saved
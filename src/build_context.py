@@ -0,0 +1,247 @@
+"""
+Build context of an application, streamed to Docker as a deterministic tar.
+
+The context is the application directory minus what .dockerignore excludes and minus the files a Python
+project never needs in an image (.git, virtualenvs, caches). It is derived from the manifest of the
+application scan, so nothing is walked twice, and it is streamed chunk by chunk while the tar is being
+written: to the Engine API as the request body, and to `docker build -` through stdin. Entries are
+written in a stable order with normalized owners, modes and timestamps, so the same files always
+produce the same bytes.
+"""
+import os
+import re
+import tarfile
+import threading
+import zlib
+from collections import Counter
+from typing import Iterator, List, Optional, Tuple
+
+from _logging.pg_logger import get_logger
+from _util import _util_file as _util_file_
+
+# Configure the logger
+logger = get_logger(
+    name="build_context",
+    log_level=os.environ.get("LOG_LEVEL", "INFO"),
+    log_to_console=True,
+    log_to_file=True,
+    log_file_path=os.environ.get("LOG_FILE_PATH", "/tmp/ecr_deployment.log")
+)
+
+# File and directory names left out of every context, at any depth
+DEFAULT_IGNORE_PATTERNS = (
+    ".git", ".hg", ".svn", ".venv", "venv", "__pycache__", "*.pyc", "*.pyo", ".pytest_cache", ".mypy_cache",
+    ".ruff_cache", ".tox", ".nox", ".coverage", "htmlcov", "*.egg-info", ".idea", ".vscode", ".DS_Store",
+    "node_modules",
+)
+
+# Warn before a build whose context is larger than this
+DEFAULT_WARN_BYTES = int(os.environ.get("BUILD_CONTEXT_WARN_MB", "100")) * 1024 * 1024
+
+# Files Docker needs in the context even when .dockerignore excludes them
+_ALWAYS_INCLUDED = ("Dockerfile", ".dockerignore")
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def _pattern_regex(pattern: str) -> "re.Pattern":
+    """Translate a .dockerignore pattern (Go filepath.Match syntax plus **) into a regex."""
+    regex, index = "", 0
+    while index < len(pattern):
+        char = pattern[index]
+        if pattern.startswith("**/", index):
+            regex, index = regex + "(?:.*/)?", index + 3
+        elif pattern.startswith("**", index):
+            regex, index = regex + ".*", index + 2
+        elif char == "*":
+            regex, index = regex + "[^/]*", index + 1
+        elif char == "?":
+            regex, index = regex + "[^/]", index + 1
+        elif char == "[" and (end := pattern.find("]", index + 1)) != -1:
+            regex, index = regex + "[" + pattern[index + 1:end].replace("\\", "\\\\") + "]", end + 1
+        else:
+            regex, index = regex + re.escape(char), index + 1
+    return re.compile(regex + r"\Z")
+
+
+class DockerIgnore:
+    """The rules of a .dockerignore file; the last rule matching a path decides, `!` rules re-include."""
+
+    def __init__(self, lines: List[str] = ()):
+        self.rules: List[Tuple[bool, "re.Pattern"]] = []
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            pattern = os.path.normpath(line[1:].strip() if negate else line).replace(os.sep, "/").lstrip("/")
+            if pattern and pattern != ".":
+                self.rules.append((negate, _pattern_regex(pattern)))
+
+    @classmethod
+    def from_directory(cls, dirpath: str) -> "DockerIgnore":
+        try:
+            with open(os.path.join(dirpath, ".dockerignore")) as file:
+                return cls(file.read().splitlines())
+        except FileNotFoundError:
+            return cls()
+
+    def excluded(self, relpath: str) -> bool:
+        """Whether relpath, or one of the directories it is in, is excluded."""
+        parts = relpath.split("/")
+        prefixes = ["/".join(parts[:index]) for index in range(1, len(parts) + 1)]
+        excluded = False
+        for negate, regex in self.rules:
+            if any(regex.match(prefix) for prefix in prefixes):
+                excluded = not negate
+        return excluded
+
+
+def context_manifest(dirpath: str,
+                     manifest: _util_file_.DirectoryManifest = None) -> Optional[_util_file_.DirectoryManifest]:
+    """
+    The files of the build context of an application.
+
+    Args:
+        dirpath: application directory
+        manifest: manifest of dirpath, scanned with DEFAULT_IGNORE_PATTERNS; the directory is scanned when not given
+
+    Returns:
+        DirectoryManifest: the manifest restricted to the files sent to Docker, None when dirpath cannot be scanned
+    """
+    if manifest is None:
+        try:
+            manifest = _util_file_.scan_directory(dirpath, ignore_patterns=DEFAULT_IGNORE_PATTERNS)
+        except OSError as e:
+            logger.error(f"Could not scan {dirpath}: {e}")
+            return None
+    dockerignore = DockerIgnore.from_directory(manifest.root)
+    default_ignore = re.compile("|".join(_pattern_regex(pattern).pattern for pattern in DEFAULT_IGNORE_PATTERNS))
+
+    def included(entry: _util_file_.ManifestEntry) -> bool:
+        if entry.relpath in _ALWAYS_INCLUDED:
+            return True
+        if any(default_ignore.match(part) for part in entry.relpath.split("/")):
+            return False
+        return not dockerignore.excluded(entry.relpath)
+
+    files = [entry for entry in manifest.files if included(entry)]
+    names = {entry.relpath.rsplit("/", 1)[-1] for entry in files}
+    return _util_file_.DirectoryManifest(
+        root=manifest.root,
+        files=files,
+        targets={name: entry for name, entry in manifest.targets.items() if name in names}
+    )
+
+
+def context_size(context: _util_file_.DirectoryManifest) -> int:
+    """Size of the uncompressed tar of the context: a 512-byte header and padded content per file."""
+    return sum(512 + (0 if entry.symlink else (entry.size + 511) // 512 * 512) for entry in context.files) + 1024
+
+
+def report_context(context: _util_file_.DirectoryManifest, warn_bytes: int = DEFAULT_WARN_BYTES) -> int:
+    """Log the size and file count of a context, and warn with its largest directories when it is too large."""
+    size = context_size(context)
+    logger.info(f"Build context: {len(context.files)} files, {size / (1024 * 1024):.1f} MB")
+    if size > warn_bytes:
+        by_top_level = Counter()
+        for entry in context.files:
+            by_top_level[entry.relpath.split("/", 1)[0]] += entry.size
+        largest = ", ".join(f"{name} ({total / (1024 * 1024):.1f} MB)" for name, total in by_top_level.most_common(5))
+        logger.warning(f"Build context is larger than {warn_bytes / (1024 * 1024):.0f} MB, "
+                       f"consider a .dockerignore entry for: {largest}")
+    return size
+
+
+class _ChunkBuffer:
+    """Collects the pieces of the tar into chunks of about _CHUNK_SIZE bytes, compressed when asked."""
+
+    def __init__(self, compress: bool):
+        self._buffer = bytearray()
+        # wbits=31 writes a gzip stream whose header has no timestamp, unlike the gzip module
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def add(self, data: bytes) -> Iterator[bytes]:
+        self._buffer += self._compressor.compress(data) if self._compressor else data
+        if len(self._buffer) >= _CHUNK_SIZE:
+            yield from self.drain()
+
+    def drain(self, final: bool = False) -> Iterator[bytes]:
+        if final and self._compressor:
+            self._buffer += self._compressor.flush()
+        chunk, self._buffer = bytes(self._buffer), bytearray()
+        if chunk:
+            yield chunk
+
+
+def _tarinfo(entry: _util_file_.ManifestEntry, mtime: int) -> tarfile.TarInfo:
+    info = tarfile.TarInfo(entry.relpath)
+    info.mtime = mtime
+    if entry.symlink:
+        # A link is sent as a link, like `docker build` does, whether its target is in the context or not
+        info.type, info.linkname, info.mode = tarfile.SYMTYPE, os.readlink(entry.path), 0o777
+    else:
+        info.size = entry.size
+        info.mode = 0o755 if os.access(entry.path, os.X_OK) else 0o644
+    info.uid = info.gid = 0
+    info.uname = info.gname = ""
+    return info
+
+
+def stream_context(context: _util_file_.DirectoryManifest, gzip: bool = False,
+                   mtime: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Stream the tar of a build context, chunk by chunk while it is written.
+
+    Args:
+        context: manifest of the files to send, from context_manifest
+        gzip: compress the stream
+        mtime: timestamp of every entry, SOURCE_DATE_EPOCH (or 0) when not given
+
+    Returns:
+        Iterator[bytes]: the tar stream
+    """
+    mtime = int(os.environ.get("SOURCE_DATE_EPOCH", "0")) if mtime is None else mtime
+    # The archive is written by hand, header then content read _CHUNK_SIZE bytes at a time, because
+    # tarfile.addfile copies a whole file before control comes back to the caller
+    buffer = _ChunkBuffer(compress=gzip)
+    offset = 0
+    for entry in context.files:
+        header = _tarinfo(entry, mtime).tobuf(tarfile.PAX_FORMAT, tarfile.ENCODING, "surrogateescape")
+        yield from buffer.add(header)
+        offset += len(header)
+        if entry.symlink:
+            continue
+        with open(entry.path, "rb") as file:
+            remaining = entry.size
+            while remaining:
+                data = file.read(min(_CHUNK_SIZE, remaining))
+                if not data:
+                    raise OSError(f"{entry.path} changed size while the build context was streamed")
+                yield from buffer.add(data)
+                remaining -= len(data)
+        yield from buffer.add(tarfile.NUL * (-entry.size % tarfile.BLOCKSIZE))
+        offset += entry.size + -entry.size % tarfile.BLOCKSIZE
+    # Two empty blocks end the archive, which is padded to a whole record like tarfile does
+    offset += 2 * tarfile.BLOCKSIZE
+    yield from buffer.add(tarfile.NUL * (2 * tarfile.BLOCKSIZE + -offset % tarfile.RECORDSIZE))
+    yield from buffer.drain(final=True)
+
+
+def feed_stdin(process, chunks: Iterator[bytes]) -> threading.Thread:
+    """Write a context stream to the stdin of a `docker build -` process, alongside reading its output."""
+    def feed():
+        try:
+            for chunk in chunks:
+                process.stdin.write(chunk)
+        except BrokenPipeError:
+            logger.warning("docker build stopped reading the build context")
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    thread = threading.Thread(target=feed, name="build-context", daemon=True)
+    thread.start()
+    return thread
@@ -3,19 +3,23 @@ import sys
 import docker
 import time
 import boto3
+from contextlib import nullcontext
+from typing import Callable
 from botocore.exceptions import BotoCoreError, NoCredentialsError
-from boto3.session import Session
 
 # Add the project root to the Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
 
 # Import the deployment config and logging
-from config import (
-    AWS_REGION, ECR_REPOSITORY_NAME, ECR_IMAGE_TAG,
-    DOCKERFILE_PATH, PROJECT_ROOT, get_ecr_repository_uri, get_image_uri,
-    get_boto3_session_args
-)
+from config import DeployConfig
 from _logging.pg_logger import get_logger, log_method, error_logger
+from _util import _util_file as _util_file_
+from _util import _util_hash as _util_hash_
+from src import build_cache, build_context, wheelhouse
+from src.aws_clients import get_client
+from src.docker_stream import follow_build, follow_push
+from src.ecr_auth import get_authorization, token_from_response, docker_login
+from src.ecr_registry import ensure_repository, get_image_manifest, put_image_tag, fingerprint_tag
 
 # Configure the logger
 logger = get_logger(
@@ -26,37 +30,115 @@ logger = get_logger(
     log_file_path=os.environ.get("LOG_FILE_PATH", "/tmp/ecr_deployment.log")
 )
 
-@log_method(level="info")
-def check_artifact(checking_dirpath: str, generate_flg: bool = True) -> bool:
-    from _util import _util_file as _util_file_
+# Files check_artifact looks for at the top of the application directory
+ARTIFACT_FILES = ("Dockerfile", "lambda_function.py", "requirements.txt", "main.py")
+
+
+def generation_options(config: DeployConfig):
+    """Generation options of the handler, the response cache is off when config.handler_cache_ttl is 0."""
+    from src.gen_aws_lambda_handler import HandlerOptions, ResponseCache
+
+    response_cache = None
+    if config.handler_cache_ttl:
+        response_cache = ResponseCache(ttl=config.handler_cache_ttl, max_entries=config.handler_cache_max_entries,
+                                       max_bytes=config.handler_cache_max_bytes)
+    return HandlerOptions(response_cache=response_cache, hoist=config.handler_hoist,
+                          keep_warm=config.handler_keep_warm, lazy_imports=config.handler_lazy_imports)
+
+
+def response_closer(api_client) -> Callable[[], None]:
+    """
+    Record the HTTP responses of a docker APIClient from now on; the returned function closes them.
+
+    Closing the streamed response of a build closes its connection. APIClient.close() would only close
+    the idle connections of the pool, not the one the build is streamed on.
+    """
+    responses = []
+    api_client.hooks["response"].append(lambda response, *args, **kwargs: responses.append(response))
+
+    def close() -> None:
+        for response in responses:
+            response.close()
 
+    return close
 
 
+@log_method(level="info")
+def check_artifact(checking_dirpath: str,
+                   generate_flg: bool = True,
+                   base_image: str = None,
+                   multi_stage: bool = False,
+                   static_template: str = None,
+                   use_wheelhouse: bool = False,
+                   handler_template: str = "api_gateway_handler",
+                   handler_options=None,
+                   manifest: _util_file_.DirectoryManifest = None) -> bool:
+    # One scan of the application answers every check below; generated files are added to it
+    if manifest is None:
+        try:
+            manifest = _util_file_.scan_directory(checking_dirpath, targets=ARTIFACT_FILES, max_depth=0)
+        except OSError as e:
+            logger.error(f"Could not scan {checking_dirpath}: {e}")
+            return False
+
     """whether Dockerfile exists in the directory"""
-    if file := _util_file_.find_file(starting_directory=checking_dirpath, filename="Dockerfile", max_depth=0):
+    if file := manifest.find("Dockerfile", max_depth=0):
         logger.info(f"Dockerfile found in {checking_dirpath}")
+        from src.gen_dockerfile import check_wheelhouse, generate_dockerfile
+
+        # A generated Dockerfile is generated again when its options changed since, e.g. WHEELHOUSE;
+        # a hand-written one is kept but has to agree with WHEELHOUSE
+        if generate_flg and not static_template:
+            if not generate_dockerfile(checking_dirpath, base_image=base_image, multi_stage=multi_stage,
+                                       wheelhouse=use_wheelhouse):
+                return False
+            manifest.add(file)
+        elif not check_wheelhouse(file, use_wheelhouse):
+            return False
     else:
         logger.info(f"Dockerfile is not found in {checking_dirpath}")
         if generate_flg:
             logger.info(f"generating Dockerfile...")
-            _util_file_.write_file(os.path.join(checking_dirpath, "Dockerfile"), _util_file_.load_file(
-                _util_file_.find_file(starting_directory=sys.prefix, filename="Dockerfile")))
+            if static_template:
+                from _artifact import _artifact_registry as _artifact_registry_
+
+                if (template := _artifact_registry_.load_template(static_template)) is None:
+                    logger.error(f"Dockerfile template {static_template} not found")
+                    return False
+                _util_file_.write_file(os.path.join(checking_dirpath, "Dockerfile"), template)
+            else:
+                from src.gen_dockerfile import generate_dockerfile
+
+                if not generate_dockerfile(checking_dirpath, base_image=base_image, multi_stage=multi_stage,
+                                           wheelhouse=use_wheelhouse):
+                    return False
+            manifest.add(os.path.join(checking_dirpath, "Dockerfile"))
             logger.info(f"Dockerfile is generated.")
         else:
             logger.error(f"please create a Dockerfile in {checking_dirpath}")
             return False
 
     """whether lambda_function.py exists in the directory"""
-    if file := _util_file_.find_file(starting_directory=checking_dirpath, filename="lambda_function.py", max_depth=0):
+    if file := manifest.find("lambda_function.py", max_depth=0):
         logger.info(f"lambda_function.py found in {checking_dirpath}")
+        if generate_flg:
+            from src.gen_aws_lambda_handler import generate_lambda_handler
+
+            # A generated handler is regenerated when main.py or the template changed since
+            if not generate_lambda_handler(checking_dirpath, manifest=manifest,
+                                           template_name=handler_template,
+                                           options=handler_options):
+                logger.error("Convert lambda handler failed")
+                return False
     else:
         logger.info(f"lambda_function.py is not found in {checking_dirpath}")
         if generate_flg:
             logger.info(f"generating lambda_function.py...")
             from src.gen_aws_lambda_handler import generate_lambda_handler
-            print(os.environ["APP_LOCATION"])
 
-            if not generate_lambda_handler(os.environ["APP_LOCATION"]):
+            if not generate_lambda_handler(checking_dirpath, manifest=manifest,
+                                           template_name=handler_template,
+                                           options=handler_options):
                 logger.error("Convert lambda handler failed")
                 return False
             logger.info(f"lambda_function.py is generated.")
@@ -66,7 +148,7 @@ def check_artifact(checking_dirpath: str, generate_flg: bool = True) -> bool:
 
 
     """whether requirements.txt exists in the directory"""
-    if file := _util_file_.find_file(starting_directory=checking_dirpath, filename="requirements.txt", max_depth=0):
+    if file := manifest.find("requirements.txt", max_depth=0):
         logger.info(f"requirements.txt found in {checking_dirpath}")
     else:
         logger.error(f"requirements.txt not found in {checking_dirpath}")
@@ -78,37 +160,20 @@ def check_artifact(checking_dirpath: str, generate_flg: bool = True) -> bool:
 
 
 @log_method(level="info")
-def create_ecr_repository(fail_if_exists=False):
-    """Create the ECR repository, deleting it first if it already exists unless fail_if_exists is True."""
+def create_ecr_repository(config: DeployConfig, fail_if_exists=False, recreate=False):
+    """Ensure the ECR repository exists, reusing it and its layers unless recreate is True."""
     try:
-        # Create a session with the profile if specified
-        session = Session(**get_boto3_session_args())
-        ecr_client = session.client('ecr')
-
-        # Check if repository exists
-        try:
-            ecr_client.describe_repositories(repositoryNames=[ECR_REPOSITORY_NAME])
-
-            if fail_if_exists:
-                logger.error(f"ECR repository {ECR_REPOSITORY_NAME} already exists. Failing as requested.")
-                return False
-
-            logger.info(f"ECR repository {ECR_REPOSITORY_NAME} already exists. Deleting it first.")
-
-            # Delete repository (force delete including images)
-            ecr_client.delete_repository(repositoryName=ECR_REPOSITORY_NAME, force=True)
-            logger.info(f"Deleted ECR repository: {ECR_REPOSITORY_NAME}")
-        except ecr_client.exceptions.RepositoryNotFoundException:
-            logger.info(f"ECR repository {ECR_REPOSITORY_NAME} does not exist, proceeding with creation.")
-
-        # Create repository
-        response = ecr_client.create_repository(
-            repositoryName=ECR_REPOSITORY_NAME,
-            imageScanningConfiguration={'scanOnPush': True},
-            encryptionConfiguration={'encryptionType': 'AES256'}
+        # Shared client of the profile and region, reused across stages and deployments
+        ecr_client = get_client('ecr', **config.get_boto3_session_args())
+
+        return ensure_repository(
+            ecr_client,
+            config.ecr_repository_name,
+            scan_on_push=config.ecr_scan_on_push,
+            encryption_type=config.ecr_encryption_type,
+            fail_if_exists=fail_if_exists,
+            recreate=recreate
         )
-        logger.info(f"Created ECR repository: {ECR_REPOSITORY_NAME}")
-        return True
 
     except Exception as e:
         error_logger(
@@ -120,63 +185,62 @@ def create_ecr_repository(fail_if_exists=False):
         return False
 
 @log_method(level="info")
-def login_to_ecr():
-    """Login to AWS ECR using Docker SDK."""
+def reuse_existing_build(config: DeployConfig, fingerprint: str) -> bool:
+    """Point the image tag at the image already pushed for this app fingerprint, if there is one."""
+    try:
+        ecr_client = get_client('ecr', **config.get_boto3_session_args())
+
+        image = get_image_manifest(ecr_client, config.ecr_repository_name, fingerprint_tag(fingerprint))
+        if image is None:
+            logger.info(f"No image found for fingerprint {fingerprint}, building it.")
+            return False
+
+        logger.info(f"Image for fingerprint {fingerprint} already in ECR, skipping build and push.")
+        return put_image_tag(ecr_client, config.ecr_repository_name, image, config.ecr_image_tag)
+    except Exception as e:
+        error_logger("reuse_existing_build", str(e), logger=logger, mode="error")
+        return False
+
+
+@log_method(level="info")
+def login_to_ecr(config: DeployConfig):
+    """Login to AWS ECR, reusing the cached authorization token and Docker login while they are valid."""
     try:
-        import base64
-        # session = Session(**get_boto3_session_args())
-        # ecr_client = session.client('ecr')
-        # token = ecr_client.get_authorization_token()
-        #
-        # username = "AWS"
-        # password = token['authorizationData'][0]['authorizationToken']
-        # decoded_token = base64.b64decode(password).decode("utf-8")
-        # registry_url = token['authorizationData'][0]['proxyEndpoint'].replace("https://", "")
-        #
-        # client = docker.from_env()
-        # print(client, decoded_token, registry_url)
-        # # registry_url = "717435123117.dkr.ecr.us-east-1.amazonaws.com"
-        #
-        # client.login(username=username, password=decoded_token, registry=registry_url)
-        # print(f"Successfully logged in to ECR: {registry_url}")
-        # exit(0)
-        #
-        # logger.info(f"Successfully logged in to ECR: {registry_url}")
-        import subprocess
-        session = Session(**get_boto3_session_args())
-        ecr_client = session.client('ecr')
-        token = ecr_client.get_authorization_token()
-
-        # Decode Base64-encoded token
-        encoded_token = token['authorizationData'][0]['authorizationToken']
-        decoded_token = base64.b64decode(encoded_token).decode("utf-8")
-        username, password = decoded_token.split(":")
-
-        # Extract the registry URL and remove `https://`
-        registry_url = token['authorizationData'][0]['proxyEndpoint'].replace("https://", "")
-
-        # Use subprocess to execute `docker login`
-        login_command = f"echo {password} | docker login --username {username} --password-stdin {registry_url}"
-        process = subprocess.run(login_command, shell=True, capture_output=True, text=True)
-
-        if process.returncode != 0:
-            raise Exception(f"Docker login failed: {process.stderr}")
-
-        logger.info(f"Successfully logged in to ECR: {registry_url}")
+        def fetch_token():
+            ecr_client = get_client('ecr', **config.get_boto3_session_args())
+            return token_from_response(ecr_client.get_authorization_token())
+
+        token = get_authorization(config.aws_account_id, config.aws_region, config.aws_profile, fetch_token)
+        docker_login(token)
+
+        logger.info(f"Successfully logged in to ECR: {token['registry']}")
 
         return True
-    except (BotoCoreError, NoCredentialsError) as e:
+    except Exception as e:
         error_logger("login_to_ecr", str(e), logger=logger, mode="error")
         return False
 
 
 @log_method(level="info")
-def build_docker_image():
-    """Build the Docker image using Docker SDK and show detailed logs."""
+def build_docker_image(config: DeployConfig, timings: dict = None,
+                       context: _util_file_.DirectoryManifest = None):
+    """Build the Docker image using Docker SDK and show detailed logs.
+
+    The build context (build_context.context_manifest, computed when not given) is streamed to the
+    daemon as a tar while it is written, gzipped when config.build_context_gzip is set.
+
+    With config.build_cache set, the layer cache is imported from the cache tag in ECR: the inline
+    cache through the Engine API (cache_from), the registry cache through `docker buildx`, since the
+    Engine API cannot export a BuildKit cache. When timings is given, the cache hit ratio and the
+    estimated time saved are recorded in it.
+
+    With config.wheelhouse set, the requirements are installed offline from the local wheelhouse
+    (src.wheelhouse), mounted from a named build context, which also needs `docker buildx`.
+    """
     try:
-        image_name = f"{ECR_REPOSITORY_NAME}:{ECR_IMAGE_TAG}"
-        dockerfile_dir = os.environ.get("APP_LOCATION", ".")
-        dockerfile_path = os.path.join(dockerfile_dir, "Dockerfile")
+        image_name = config.local_image
+        dockerfile_dir = str(config.app_root)
+        dockerfile_path = str(config.dockerfile_path)
 
         # Print Dockerfile content if exists
         if os.path.exists(dockerfile_path):
@@ -188,45 +252,94 @@ def build_docker_image():
 
 
 
+        # Only the files of the context are sent, .dockerignore and the Python defaults applied
+        if context is None:
+            context = build_context.context_manifest(dockerfile_dir)
+        build_context.report_context(context)
+        context_chunks = build_context.stream_context(context, gzip=config.build_context_gzip)
+
+        build_contexts = None
+        if config.wheelhouse:
+            if (wheelhouse_dir := wheelhouse.ensure_wheelhouse(config)) is None:
+                error_logger("build_docker_image", "the wheelhouse of requirements.txt is not available",
+                             logger=logger, mode="error")
+                return False
+            build_contexts = wheelhouse.build_contexts(wheelhouse_dir)
+
+        # The low-level API yields the build output while the daemon produces it
         client = docker.from_env()
 
         logger.info(f"Starting Docker build for image: {image_name}")
 
-        image, build_logs = client.images.build(path=dockerfile_dir, tag=image_name, dockerfile=dockerfile_path)
-
-        # Print detailed logs from build process
-        for log in build_logs:
-            if 'stream' in log:
-                logger.info(log['stream'].strip())
-            elif 'error' in log:
-                logger.error(log['error'].strip())
+        if build_cache.needs_buildx(config):
+            report = build_cache.run_buildx(build_cache.buildx_command(config, "-", "Dockerfile", build_contexts),
+                                            context_chunks=context_chunks)
+        else:
+            cache_from = None
+            if config.build_cache == "inline":
+                cache_image = build_cache.pull_cache_image(client, config)
+                cache_from = [cache_image] if cache_image else None
+
+            close_responses = response_closer(client.api)
+            chunks = client.api.build(fileobj=context_chunks, custom_context=True,
+                                      encoding="gzip" if config.build_context_gzip else None,
+                                      tag=image_name, dockerfile="Dockerfile",
+                                      rm=True, decode=True, cache_from=cache_from)
+
+            def cancel():
+                # Dropping the connection of the build request makes the daemon abort the build
+                close_responses()
+                chunks.close()
+
+            report = follow_build(chunks, cancel=cancel)
+
+        if config.build_cache and report.success:
+            build_cache.record_time_saved(config, report)
+        if timings is not None:
+            timings["cache_hit_ratio"] = report.cache_hit_ratio
+            timings["cache_time_saved"] = report.time_saved
+        logger.info(report.summary())
+
+        if not report.success:
+            error_logger("build_docker_image", report.error, logger=logger, mode="error")
+            return False
 
         logger.info(f"Docker image built successfully: {image_name}")
         return True
-    except docker.errors.BuildError as e:
+    except (docker.errors.BuildError, docker.errors.APIError) as e:
         error_logger("build_docker_image", str(e), logger=logger, mode="error")
         return False
 
 @log_method(level="info")
-def tag_and_push_image():
-    """Tag and push the Docker image to ECR using Docker SDK."""
+def tag_and_push_image(config: DeployConfig, extra_tags: list = None):
+    """Tag and push the Docker image to ECR using Docker SDK, along with any extra tags."""
     try:
-        ecr_image_uri = get_image_uri()
+        ecr_image_uri = config.get_image_uri()
         if not ecr_image_uri:
             logger.error("Failed to get ECR image URI")
             return False
 
-        local_image = f"{ECR_REPOSITORY_NAME}:{ECR_IMAGE_TAG}"
+        local_image = config.local_image
 
         client = docker.from_env()
         image = client.images.get(local_image)
-        image.tag(ecr_image_uri)
+        repository_uri = config.get_ecr_repository_uri()
 
-        logger.info(f"Tagged image: {local_image} -> {ecr_image_uri}")
+        # Extra tags only add a manifest, every layer is already in the registry after the first push
+        for tag in [config.ecr_image_tag] + list(extra_tags or []):
+            image_uri = config.get_image_uri(tag)
+            image.tag(repository_uri, tag=tag)
+            logger.info(f"Tagged image: {local_image} -> {image_uri}")
 
-        push_result = client.images.push(ecr_image_uri)
-        print(push_result)
-        logger.info(f"Pushed image to ECR: {ecr_image_uri}\n{push_result}")
+            # The daemon reports push failures inside the stream, the call itself still succeeds
+            report = follow_push(client.api.push(repository_uri, tag=tag, stream=True, decode=True))
+            logger.info(report.summary())
+
+            if not report.success:
+                error_logger("tag_and_push_image", report.error, logger=logger, mode="error")
+                return False
+
+            logger.info(f"Pushed image to ECR: {image_uri} ({report.digest or 'digest unknown'})")
 
         return True
     except (docker.errors.ImageNotFound, docker.errors.APIError) as e:
@@ -236,41 +349,95 @@ def tag_and_push_image():
 
 
 @log_method(level="info")
-def run(app_location: str, ecr_repository_name: str = None):
-    """Main function to deploy the Docker image to ECR."""
+def run(config: DeployConfig,
+        force_build: bool = False,
+        build_slot=None,
+        push_slot=None,
+        timings: dict = None):
+    """Main function to deploy the Docker image to ECR.
+
+    Unless force_build is True, the build and push are skipped when ECR already holds an image for
+    the fingerprint of the application; the image tag is then only moved onto that image.
+
+    build_slot and push_slot are optional context managers (e.g. semaphores) held around the build
+    and the push, so concurrent deployments can bound each stage separately. When timings is given,
+    the wall-clock duration of every stage is recorded in it.
+    """
     start_time = time.time()
-    
-    # Override ECR_REPOSITORY_NAME if provided
-    if ecr_repository_name:
-        os.environ["ECR_REPOSITORY_NAME"] = ecr_repository_name
-        logger.info(f"Overriding ECR repository name: {ecr_repository_name}")
-        
-    logger.info(f"Starting deployment to ECR: {ECR_REPOSITORY_NAME}")
+    timings = timings if timings is not None else {}
+    app_location = str(config.app_root)
+
+    logger.info(f"Starting deployment to ECR: {config.ecr_repository_name}")
 
     # Create repository if it doesn't exist
-    if not create_ecr_repository():
+    stage_start = time.time()
+    if not create_ecr_repository(config):
         logger.error("Failed to create ECR repository")
         return False
 
-    # Login to ECR
-    if not login_to_ecr():
-        logger.error("Failed to login to ECR")
+    # The application is traversed once; the checks and the fingerprint share the manifest
+    try:
+        manifest = _util_file_.scan_directory(app_location, targets=ARTIFACT_FILES,
+                                              ignore_patterns=build_context.DEFAULT_IGNORE_PATTERNS)
+    except OSError as e:
+        logger.error(f"Failed to scan {app_location}: {e}")
         return False
-
-    if not check_artifact(app_location):
+    if not check_artifact(app_location,
+                          base_image=config.docker_base_image,
+                          multi_stage=config.docker_multi_stage,
+                          use_wheelhouse=config.wheelhouse,
+                          handler_template=config.handler_template,
+                          handler_options=generation_options(config),
+                          static_template=config.dockerfile_template or None,
+                          manifest=manifest):
         logger.error("Required files do not exist")
         return False
 
+    # Skip the build entirely when this exact build context was pushed before
+    # The fingerprint covers what is sent to Docker; only the files that changed since the last
+    # deployment of this directory are read again
+    context = build_context.context_manifest(app_location, manifest)
+    try:
+        tree = _util_hash_.tree_digest(app_location, manifest=context)
+    except OSError as e:
+        logger.error(f"Failed to fingerprint {app_location}: {e}")
+        return False
+    fingerprint = tree.digest
+    logger.info(f"Application fingerprint: {fingerprint} "
+                f"({tree.hashed} files hashed, {tree.cached} from the stat cache)")
+    reused = not force_build and reuse_existing_build(config, fingerprint)
+    timings["prepare"] = time.time() - stage_start
+    if reused:
+        timings["total"] = time.time() - start_time
+        logger.info(f"Deployment to ECR completed without a build in {timings['total']:.2f} seconds")
+        return True
+
+    # Login to ECR
+    if not login_to_ecr(config):
+        logger.error("Failed to login to ECR")
+        return False
+
     # Build Docker image
-    if not build_docker_image():
+    with build_slot or nullcontext():
+        stage_start = time.time()
+        built = build_docker_image(config, timings=timings, context=context)
+        timings["build"] = time.time() - stage_start
+    if not built:
         logger.error("Failed to build Docker image")
         return False
 
     # Tag and push image
-    if not tag_and_push_image():
+    with push_slot or nullcontext():
+        stage_start = time.time()
+        extra_tags = [fingerprint_tag(fingerprint)]
+        if build_cache.pushes_cache_tag(config):
+            extra_tags.append(config.build_cache_tag)
+        pushed = tag_and_push_image(config, extra_tags=extra_tags)
+        timings["push"] = time.time() - stage_start
+    if not pushed:
         logger.error("Failed to tag and push image")
         return False
 
-    elapsed_time = time.time() - start_time
-    logger.info(f"Deployment to ECR completed successfully in {elapsed_time:.2f} seconds")
+    timings["total"] = time.time() - start_time
+    logger.info(f"Deployment to ECR completed successfully in {timings['total']:.2f} seconds")
     return True
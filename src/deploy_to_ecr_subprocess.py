@@ -1,23 +1,25 @@
 """
 Script to build and deploy Docker image to ECR.
 """
+import io
 import os
 import sys
 import subprocess
 import boto3
 import time
-from boto3.session import Session
 
 # Add the project root to the Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
 
 # Import the deployment config and logging
-from config import (
-    AWS_REGION, ECR_REPOSITORY_NAME, ECR_IMAGE_TAG,
-    DOCKERFILE_PATH, PROJECT_ROOT, get_ecr_repository_uri, get_image_uri,
-    get_boto3_session_args
-)
+from config import DeployConfig
 from _logging.pg_logger import get_logger, log_method, error_logger
+from _util import _util_file as _util_file_
+from _util import _util_hash as _util_hash_
+from src import build_cache, build_context, wheelhouse
+from src.aws_clients import get_client
+from src.ecr_auth import get_authorization, docker_login
+from src.ecr_registry import ensure_repository, get_image_manifest, put_image_tag, fingerprint_tag
 
 # Configure the logger
 logger = get_logger(
@@ -57,6 +59,18 @@ def run_command_progress(command: str):
         #                       ignore_flag=False)
 
 
+@log_method(level="info")
+def run_command_stdin(command: list, chunks) -> int:
+    """Run a command with chunks streamed to its stdin, log its output as it comes and return its exit code."""
+    logger.info(f"running {' '.join(command)} ...")
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    build_context.feed_stdin(process, chunks)
+    for line in io.TextIOWrapper(process.stdout, encoding="utf-8", errors="replace"):
+        if line.strip():
+            logger.info(line.rstrip())
+    return process.wait()
+
+
 @log_method(level="info")
 def run_command(command, cwd=None):
     """Run a shell command and return the output."""
@@ -83,41 +97,46 @@ def run_command(command, cwd=None):
 
 
 @log_method(level="info")
-def create_ecr_repository(fail_if_exists=False):
-    """Create the ECR repository, deleting it first if it already exists unless fail_if_exists is True."""
+def create_ecr_repository(config: DeployConfig, fail_if_exists=False, recreate=False):
+    """Ensure the ECR repository exists, reusing it and its layers unless recreate is True."""
     try:
-        # Create a session with the profile if specified
-        session = Session(**get_boto3_session_args())
-        ecr_client = session.client('ecr')
-
-        # Check if repository exists
-        try:
-            ecr_client.describe_repositories(repositoryNames=[ECR_REPOSITORY_NAME])
-
-            if fail_if_exists:
-                logger.error(f"ECR repository {ECR_REPOSITORY_NAME} already exists. Failing as requested.")
-                return False
+        # Shared client of the profile and region, reused across stages and deployments
+        ecr_client = get_client('ecr', **config.get_boto3_session_args())
+
+        return ensure_repository(
+            ecr_client,
+            config.ecr_repository_name,
+            scan_on_push=config.ecr_scan_on_push,
+            encryption_type=config.ecr_encryption_type,
+            fail_if_exists=fail_if_exists,
+            recreate=recreate
+        )
 
-            logger.info(f"ECR repository {ECR_REPOSITORY_NAME} already exists. Deleting it first.")
+    except Exception as e:
+        error_logger(
+            "create_ecr_repository",
+            str(e),
+            logger=logger,
+            mode="error"
+        )
+        return False
 
-            # Delete repository (force delete including images)
-            ecr_client.delete_repository(repositoryName=ECR_REPOSITORY_NAME, force=True)
-            logger.info(f"Deleted ECR repository: {ECR_REPOSITORY_NAME}")
-        except ecr_client.exceptions.RepositoryNotFoundException:
-            logger.info(f"ECR repository {ECR_REPOSITORY_NAME} does not exist, proceeding with creation.")
+@log_method(level="info")
+def reuse_existing_build(config: DeployConfig, fingerprint: str) -> bool:
+    """Point the image tag at the image already pushed for this app fingerprint, if there is one."""
+    try:
+        ecr_client = get_client('ecr', **config.get_boto3_session_args())
 
-        # Create repository
-        response = ecr_client.create_repository(
-            repositoryName=ECR_REPOSITORY_NAME,
-            imageScanningConfiguration={'scanOnPush': True},
-            encryptionConfiguration={'encryptionType': 'AES256'}
-        )
-        logger.info(f"Created ECR repository: {ECR_REPOSITORY_NAME}")
-        return True
+        image = get_image_manifest(ecr_client, config.ecr_repository_name, fingerprint_tag(fingerprint))
+        if image is None:
+            logger.info(f"No image found for fingerprint {fingerprint}, building it.")
+            return False
 
+        logger.info(f"Image for fingerprint {fingerprint} already in ECR, skipping build and push.")
+        return put_image_tag(ecr_client, config.ecr_repository_name, image, config.ecr_image_tag)
     except Exception as e:
         error_logger(
-            "create_ecr_repository",
+            "reuse_existing_build",
             str(e),
             logger=logger,
             mode="error"
@@ -157,12 +176,11 @@ def create_ecr_repository(fail_if_exists=False):
 
 
 @log_method(level="info")
-def get_ecr_login_command():
+def get_ecr_login_command(config: DeployConfig):
     """Get the ECR login command."""
     try:
-        # Create a session with the profile if specified
-        session = Session(**get_boto3_session_args())
-        ecr_client = session.client('ecr')
+        # Shared client of the profile and region, reused across stages and deployments
+        ecr_client = get_client('ecr', **config.get_boto3_session_args())
         token = ecr_client.get_authorization_token()
 
         # print(token['authorizationData'][0]['authorizationToken'])
@@ -199,33 +217,26 @@ def get_ecr_login_command():
 
 
 @log_method(level="info")
-def login_to_ecr():
-    """Login to ECR."""
+def login_to_ecr(config: DeployConfig):
+    """Login to ECR, reusing the cached authorization token and Docker login while they are valid."""
     try:
-        aws_region = os.getenv("AWS_REGION", "us-east-1")
-        ecr_registry = os.getenv("ECR_REGISTRY", "717435123117.dkr.ecr.us-east-1.amazonaws.com")
-
-        # Construct the AWS ECR login command
-        login_command = f"aws ecr get-login-password --region {aws_region} | docker login --username AWS --password-stdin {ecr_registry}"
-
-        # Execute the command
-        process = subprocess.Popen(
-            login_command,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        stdout, stderr = process.communicate()
-
-        if process.returncode != 0:
-            error_logger(
-                "login_to_ecr",
-                f"ECR login failed: {stderr}",
-                logger=logger,
-                mode="error"
-            )
-            return False
+        aws_region = config.aws_region
+        ecr_registry = os.getenv("ECR_REGISTRY", f"{config.aws_account_id}.dkr.ecr.{aws_region}.amazonaws.com")
+
+        def fetch_token():
+            # get-login-password does not report the expiry, ECR tokens are valid for 12 hours
+            password_command = f"aws ecr get-login-password --region {aws_region}"
+            if config.aws_profile:
+                password_command += f" --profile {config.aws_profile}"
+            return {
+                "username": "AWS",
+                "password": run_command(password_command),
+                "registry": ecr_registry,
+                "expires_at": time.time() + 12 * 60 * 60,
+            }
+
+        token = get_authorization(config.aws_account_id, aws_region, config.aws_profile, fetch_token)
+        docker_login(token)
 
         logger.info("Successfully logged in to ECR")
         return True
@@ -278,27 +289,54 @@ def login_to_ecr():
 #         return False
 
 @log_method(level="info")
-def build_docker_image():
-    """Build the Docker image."""
+def build_docker_image(config: DeployConfig, context: _util_file_.DirectoryManifest = None):
+    """Build the Docker image, streaming the build context to `docker build -` through stdin."""
     try:
-        image_name = f"{ECR_REPOSITORY_NAME}:{ECR_IMAGE_TAG}"
+        image_name = config.local_image
         print(image_name)
 
 
         # Get the directory containing the Dockerfile
-        dockerfile_dir = DOCKERFILE_PATH.parent
-        # print(dockerfile_dir)
-        # exit(0)
-
-        dockerfile_dir = os.environ.get("APP_LOCATION")
+        dockerfile_dir = str(config.dockerfile_path.parent)
         print(dockerfile_dir)
 
+        # Only the files of the context are sent, .dockerignore and the Python defaults applied
+        if context is None:
+            context = build_context.context_manifest(dockerfile_dir)
+        build_context.report_context(context)
+        context_chunks = build_context.stream_context(context, gzip=config.build_context_gzip)
+
+        build_contexts = None
+        if config.wheelhouse:
+            if (wheelhouse_dir := wheelhouse.ensure_wheelhouse(config)) is None:
+                error_logger("build_docker_image", "the wheelhouse of requirements.txt is not available",
+                             logger=logger, mode="error")
+                return False
+            build_contexts = wheelhouse.build_contexts(wheelhouse_dir)
+
+        # With a build cache the build runs through buildx, which imports and exports the cache in ECR;
+        # the wheelhouse is mounted from a named build context, which needs buildx as well
+        if config.build_cache or config.wheelhouse:
+            report = build_cache.run_buildx(build_cache.buildx_command(config, "-", "Dockerfile", build_contexts),
+                                            context_chunks=context_chunks)
+            if report.success and config.build_cache:
+                build_cache.record_time_saved(config, report)
+            logger.info(report.summary())
+            if not report.success:
+                error_logger("build_docker_image", report.error, logger=logger, mode="error")
+                return False
+            logger.info(f"Docker image built successfully: {image_name}")
+            return True
 
-        # Build the Docker image from the directory containing the Dockerfile
-        build_command = f"docker build -t {image_name} -f {os.path.join(dockerfile_dir, 'Dockerfile')} {dockerfile_dir}"
+        # Build the Docker image from the context streamed to stdin
+        build_command = ["docker", "build", "-t", image_name, "-f", "Dockerfile", "-"]
 
-        print(build_command)
-        output = run_command_progress(build_command)
+        print(" ".join(build_command))
+        return_code = run_command_stdin(build_command, context_chunks)
+        if return_code:
+            error_logger("build_docker_image", f"docker build exited with code {return_code}",
+                         logger=logger, mode="error")
+            return False
         logger.info(f"Docker image built successfully: {image_name}")
         return True
     except Exception as e:
@@ -311,29 +349,46 @@ def build_docker_image():
         return False
 
 
+def _succeeded(command: str) -> bool:
+    """Run a command with run_command_progress, False with the error logged when it did not exit with 0."""
+    process = run_command_progress(command)
+    if process is None or process.returncode:
+        error_logger("tag_and_push_image",
+                     f"{command} exited with code {process.returncode if process else 'unknown'}",
+                     logger=logger, mode="error")
+        return False
+    return True
+
+
 @log_method(level="info")
-def tag_and_push_image():
-    """Tag and push the Docker image to ECR."""
+def tag_and_push_image(config: DeployConfig, extra_tags: list = None):
+    """Tag and push the Docker image to ECR, along with any extra tags."""
     try:
-        local_image = f"{ECR_REPOSITORY_NAME}:{ECR_IMAGE_TAG}"
-        ecr_image_uri = get_image_uri()
+        local_image = config.local_image
+        ecr_image_uri = config.get_image_uri()
 
         if not ecr_image_uri:
             logger.error("Failed to get ECR image URI")
             return False
 
         # Tag the image
-        tag_command = f"docker tag {local_image} {ecr_image_uri}"
-        run_command_progress(tag_command)
-        # run_command(tag_command)
+        if not _succeeded(f"docker tag {local_image} {ecr_image_uri}"):
+            return False
         logger.info(f"Tagged image: {local_image} -> {ecr_image_uri}")
 
-        # Push the image
-        push_command = f"docker push {ecr_image_uri}"
-        run_command_progress(push_command)
-        # run_command(push_command)
+        # Push the image; the extra tags (the fingerprint tag among them) are only pushed after it
+        if not _succeeded(f"docker push {ecr_image_uri}"):
+            return False
         logger.info(f"Pushed image to ECR: {ecr_image_uri}")
 
+        # Extra tags only add a manifest, every layer is already in the registry at this point
+        for extra_tag in extra_tags or []:
+            extra_image_uri = config.get_image_uri(extra_tag)
+            if not (_succeeded(f"docker tag {local_image} {extra_image_uri}")
+                    and _succeeded(f"docker push {extra_image_uri}")):
+                return False
+            logger.info(f"Pushed image to ECR: {extra_image_uri}")
+
         return True
     except Exception as e:
         error_logger(
@@ -346,28 +401,53 @@ def tag_and_push_image():
 
 
 @log_method(level="info")
-def run():
-    """Main function to deploy the Docker image to ECR."""
+def run(config: DeployConfig, force_build: bool = False):
+    """Main function to deploy the Docker image to ECR.
+
+    Unless force_build is True, the build and push are skipped when ECR already holds an image for
+    the fingerprint of the application; the image tag is then only moved onto that image.
+    """
     start_time = time.time()
-    logger.info(f"Starting deployment to ECR: {ECR_REPOSITORY_NAME}")
+    logger.info(f"Starting deployment to ECR: {config.ecr_repository_name}")
 
     # Create repository if it doesn't exist
-    if not create_ecr_repository():
+    if not create_ecr_repository(config):
         logger.error("Failed to create ECR repository")
         return False
 
+    # Skip the build entirely when this exact build context was pushed before
+    context = build_context.context_manifest(str(config.app_root))
+    if context is None:
+        logger.error(f"Failed to scan {config.app_root}")
+        return False
+    try:
+        tree = _util_hash_.tree_digest(str(config.app_root), manifest=context)
+    except OSError as e:
+        logger.error(f"Failed to fingerprint {config.app_root}: {e}")
+        return False
+    fingerprint = tree.digest
+    logger.info(f"Application fingerprint: {fingerprint} "
+                f"({tree.hashed} files hashed, {tree.cached} from the stat cache)")
+    if not force_build and reuse_existing_build(config, fingerprint):
+        elapsed_time = time.time() - start_time
+        logger.info(f"Deployment to ECR completed without a build in {elapsed_time:.2f} seconds")
+        return True
+
     # Login to ECR
-    if not login_to_ecr():
+    if not login_to_ecr(config):
         logger.error("Failed to login to ECR")
         return False
 
     # Build Docker image
-    if not build_docker_image():
+    if not build_docker_image(config, context=context):
         logger.error("Failed to build Docker image")
         return False
 
     # Tag and push image
-    if not tag_and_push_image():
+    extra_tags = [fingerprint_tag(fingerprint)]
+    if build_cache.pushes_cache_tag(config):
+        extra_tags.append(config.build_cache_tag)
+    if not tag_and_push_image(config, extra_tags=extra_tags):
         logger.error("Failed to tag and push image")
         return False
 
@@ -0,0 +1,303 @@
+"""
+Follow the JSON progress stream of the Docker Engine API as it is produced.
+
+The build stream is consumed chunk by chunk: every line is logged as soon as the daemon emits it,
+each Dockerfile step is timed and marked as a cache hit or miss, and only a bounded tail of the
+output is kept in memory for the error report, however long the build runs. BuildKit builds run
+through `docker buildx build --progress=plain` are followed the same way from their text output.
+The push stream is followed per layer, to report what was uploaded, what the registry already had
+and the upload throughput.
+"""
+import os
+import re
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, Iterable, List, Optional
+
+from _logging.pg_logger import get_logger
+
+# Configure the logger
+logger = get_logger(
+    name="docker_stream",
+    log_level=os.environ.get("LOG_LEVEL", "INFO"),
+    log_to_console=True,
+    log_to_file=True,
+    log_file_path=os.environ.get("LOG_FILE_PATH", "/tmp/ecr_deployment.log")
+)
+
+# Number of output lines kept for the error report of a build
+DEFAULT_TAIL_LINES = 200
+
+_STEP_PATTERN = re.compile(r"^Step (\d+)/(\d+) : (.*)$")
+
+# BuildKit plain progress: "#6 [builder 3/4] RUN pip install ...", "#6 CACHED", "#6 DONE 12.3s", "#6 ERROR: ..."
+_BUILDKIT_STEP_PATTERN = re.compile(r"^#(\d+) \[(?:[\w.-]+ )?(\d+)/(\d+)\] (.*)$")
+_BUILDKIT_CACHED_PATTERN = re.compile(r"^#(\d+) CACHED$")
+_BUILDKIT_DONE_PATTERN = re.compile(r"^#(\d+) DONE (\d+(?:\.\d+)?)s$")
+_BUILDKIT_ERROR_PATTERN = re.compile(r"^(?:#\d+ )?ERROR: (.*)$")
+
+
+@dataclass
+class BuildStep:
+    """One Dockerfile instruction of a build."""
+    number: int
+    instruction: str
+    started_at: float
+    duration: float = 0.0
+    cached: bool = False
+
+
+@dataclass
+class BuildReport:
+    """What happened during a build: per-step timings and cache hits, the image id and any error."""
+    steps: List[BuildStep] = field(default_factory=list)
+    image_id: Optional[str] = None
+    error: Optional[str] = None
+    duration: float = 0.0
+    time_saved: Optional[float] = None
+    tail: Deque[str] = field(default_factory=lambda: deque(maxlen=DEFAULT_TAIL_LINES))
+
+    @property
+    def success(self) -> bool:
+        return self.error is None
+
+    @property
+    def cache_hits(self) -> int:
+        return sum(1 for step in self.steps if step.cached)
+
+    @property
+    def cache_hit_ratio(self) -> float:
+        return self.cache_hits / len(self.steps) if self.steps else 0.0
+
+    def start_step(self, number: int, instruction: str, now: float) -> None:
+        self.finish_step(now)
+        self.steps.append(BuildStep(number=number, instruction=instruction, started_at=now))
+
+    def finish_step(self, now: float) -> None:
+        if self.steps and not self.steps[-1].duration:
+            self.steps[-1].duration = now - self.steps[-1].started_at
+
+    def summary(self) -> str:
+        lines = [f"Build {'succeeded' if self.success else 'failed'} in {self.duration:.1f}s, "
+                 f"{self.cache_hits}/{len(self.steps)} steps from cache ({self.cache_hit_ratio:.0%})"
+                 + (f", about {self.time_saved:.1f}s saved" if self.time_saved is not None else "")]
+        for step in self.steps:
+            lines.append(f"  step {step.number:>2} {step.duration:7.2f}s {'CACHED' if step.cached else '      '} "
+                         f"{step.instruction[:80]}")
+        return "\n".join(lines)
+
+
+def follow_build(chunks: Iterable[Dict],
+                 cancel: Optional[Callable[[], None]] = None,
+                 on_line: Callable[[str], None] = logger.info,
+                 tail_lines: int = DEFAULT_TAIL_LINES) -> BuildReport:
+    """
+    Consume a decoded build stream (APIClient.build(decode=True)) while the build is running.
+
+    Args:
+        chunks: decoded JSON chunks of the build stream
+        cancel: called as soon as an error chunk arrives, to abort the build instead of draining it
+        on_line: receives every output line as it arrives
+        tail_lines: number of output lines kept for the error report
+
+    Returns:
+        BuildReport: the report of the build
+    """
+    report = BuildReport(tail=deque(maxlen=tail_lines))
+    start_time = time.time()
+
+    for chunk in chunks:
+        now = time.time()
+        if "errorDetail" in chunk or "error" in chunk:
+            report.error = chunk.get("errorDetail", {}).get("message") or chunk.get("error", "")
+            report.tail.append(report.error)
+            logger.error(report.error)
+            if cancel is not None:
+                cancel()
+            break
+
+        if "aux" in chunk and "ID" in chunk["aux"]:
+            report.image_id = chunk["aux"]["ID"]
+
+        for line in chunk.get("stream", "").splitlines():
+            line = line.rstrip()
+            if not line:
+                continue
+            report.tail.append(line)
+            on_line(line)
+
+            if match := _STEP_PATTERN.match(line):
+                report.start_step(int(match.group(1)), match.group(3), now)
+            elif line.strip() == "---> Using cache" and report.steps:
+                report.steps[-1].cached = True
+
+    report.finish_step(time.time())
+    report.duration = time.time() - start_time
+    return report
+
+
+def follow_buildkit(lines: Iterable[str],
+                    cancel: Optional[Callable[[], None]] = None,
+                    on_line: Callable[[str], None] = logger.info,
+                    tail_lines: int = DEFAULT_TAIL_LINES) -> BuildReport:
+    """
+    Consume the plain progress output of a BuildKit build (docker buildx build --progress=plain).
+
+    Only the Dockerfile instructions ("[2/4] RUN ...") count as steps; the internal vertices that load
+    the build definition, the context or the cache are logged but not reported. Durations are the
+    ones BuildKit prints when a step is DONE.
+
+    Args:
+        lines: output lines of the build
+        cancel: called as soon as an error line arrives, to abort the build instead of draining it
+        on_line: receives every output line as it arrives
+        tail_lines: number of output lines kept for the error report
+
+    Returns:
+        BuildReport: the report of the build
+    """
+    report = BuildReport(tail=deque(maxlen=tail_lines))
+    steps: Dict[str, BuildStep] = {}
+    start_time = time.time()
+
+    for line in lines:
+        line = line.rstrip()
+        if not line:
+            continue
+        report.tail.append(line)
+        on_line(line)
+
+        if match := _BUILDKIT_STEP_PATTERN.match(line):
+            if match.group(1) not in steps:
+                steps[match.group(1)] = BuildStep(number=int(match.group(2)), instruction=match.group(4),
+                                                  started_at=time.time())
+                report.steps.append(steps[match.group(1)])
+        elif match := _BUILDKIT_CACHED_PATTERN.match(line):
+            if match.group(1) in steps:
+                steps[match.group(1)].cached = True
+        elif match := _BUILDKIT_DONE_PATTERN.match(line):
+            if match.group(1) in steps:
+                steps[match.group(1)].duration = float(match.group(2))
+        elif match := _BUILDKIT_ERROR_PATTERN.match(line):
+            report.error = match.group(1)
+            logger.error(report.error)
+            if cancel is not None:
+                cancel()
+            break
+
+    report.duration = time.time() - start_time
+    return report
+
+
+@dataclass
+class LayerPush:
+    """Upload progress of one image layer."""
+    layer_id: str
+    status: str = ""
+    uploaded: int = 0
+    total: int = 0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def skipped(self) -> bool:
+        return self.status in ("Layer already exists", "Mounted from")
+
+
+@dataclass
+class PushReport:
+    """What happened during a push: per-layer uploads, skipped layers, throughput and any error."""
+    layers: Dict[str, LayerPush] = field(default_factory=dict)
+    digest: Optional[str] = None
+    error: Optional[str] = None
+    duration: float = 0.0
+
+    @property
+    def success(self) -> bool:
+        return self.error is None
+
+    @property
+    def bytes_uploaded(self) -> int:
+        return sum(layer.uploaded for layer in self.layers.values() if not layer.skipped)
+
+    @property
+    def skipped_layers(self) -> List[str]:
+        return [layer.layer_id for layer in self.layers.values() if layer.skipped]
+
+    @property
+    def megabytes_per_second(self) -> float:
+        return self.bytes_uploaded / (1024 * 1024) / self.duration if self.duration else 0.0
+
+    def summary(self) -> str:
+        pushed = [layer for layer in self.layers.values() if not layer.skipped]
+        lines = [f"Push {'succeeded' if self.success else 'failed'} in {self.duration:.1f}s: "
+                 f"{len(pushed)} layers uploaded ({self.bytes_uploaded / (1024 * 1024):.1f} MB, "
+                 f"{self.megabytes_per_second:.2f} MB/s), {len(self.skipped_layers)} already in the registry"]
+        for layer in pushed:
+            elapsed = (layer.finished_at or 0) - (layer.started_at or 0)
+            lines.append(f"  layer {layer.layer_id} {layer.uploaded / (1024 * 1024):8.1f} MB "
+                         f"{max(elapsed, 0.0):7.2f}s {layer.status}")
+        for layer_id in self.skipped_layers:
+            lines.append(f"  layer {layer_id} skipped, {self.layers[layer_id].status}")
+        return "\n".join(lines)
+
+
+def follow_push(chunks: Iterable[Dict],
+                on_line: Callable[[str], None] = logger.info) -> PushReport:
+    """
+    Consume a decoded push stream (APIClient.push(stream=True, decode=True)) while the push is running.
+
+    Progress chunks only update the layer counters; a line is emitted when a layer changes status.
+    The push fails as soon as an error chunk arrives, even though the stream itself ends normally.
+
+    Args:
+        chunks: decoded JSON chunks of the push stream
+        on_line: receives a line for every layer status change
+
+    Returns:
+        PushReport: the report of the push
+    """
+    report = PushReport()
+    start_time = time.time()
+
+    for chunk in chunks:
+        now = time.time()
+        if "errorDetail" in chunk or "error" in chunk:
+            report.error = chunk.get("errorDetail", {}).get("message") or chunk.get("error", "")
+            logger.error(report.error)
+            break
+
+        if "aux" in chunk and "Digest" in chunk["aux"]:
+            report.digest = chunk["aux"]["Digest"]
+
+        # Status lines without a layer id: "The push refers to repository [...]" and "<tag>: digest: ..."
+        layer_id = chunk.get("id")
+        status = chunk.get("status", "")
+        if not layer_id:
+            if status:
+                on_line(status)
+            continue
+
+        layer = report.layers.setdefault(layer_id, LayerPush(layer_id=layer_id))
+        if status == "Pushing":
+            progress = chunk.get("progressDetail") or {}
+            layer.started_at = layer.started_at or now
+            layer.uploaded = max(layer.uploaded, progress.get("current", 0))
+            layer.total = progress.get("total") or layer.total
+            if layer.status == "Pushing":
+                continue
+        elif status.startswith("Mounted from"):
+            status = "Mounted from"
+
+        if status == layer.status:
+            continue
+        if status in ("Pushed", "Layer already exists", "Mounted from"):
+            layer.finished_at = now
+        if status == "Pushed":
+            layer.uploaded = max(layer.uploaded, layer.total)
+        layer.status = status
+        on_line(f"{layer_id}: {chunk['status']}")
+
+    report.duration = time.time() - start_time
+    return report
@@ -0,0 +1,169 @@
+"""
+On-disk cache of ECR authorization tokens shared by the Docker SDK and the CLI deployment backends.
+
+ECR tokens stay valid for 12 hours, so back-to-back deployments to the same registry can reuse one
+token, and skip `docker login` altogether while the Docker credential store still holds it.
+"""
+import os
+import json
+import time
+import base64
+import hashlib
+import threading
+import subprocess
+from typing import Callable, Dict, Optional
+
+from _logging.pg_logger import get_logger
+
+# Configure the logger
+logger = get_logger(
+    name="ecr_auth",
+    log_level=os.environ.get("LOG_LEVEL", "INFO"),
+    log_to_console=True,
+    log_to_file=True,
+    log_file_path=os.environ.get("LOG_FILE_PATH", "/tmp/ecr_deployment.log")
+)
+
+# Refresh a cached token this many seconds before ECR expires it
+DEFAULT_REFRESH_MARGIN = int(os.environ.get("ECR_TOKEN_REFRESH_MARGIN", "1800"))
+
+_lock = threading.Lock()
+
+
+def cache_dir() -> str:
+    """Directory holding the cached tokens (ECR_TOKEN_CACHE_DIR, defaults to ~/.cache/aws_ecr_deploy)."""
+    return os.environ.get("ECR_TOKEN_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "aws_ecr_deploy"))
+
+
+def cache_filepath(account_id: str, region: str, profile: Optional[str]) -> str:
+    """Cache file of the token for one account, region and profile."""
+    key = hashlib.sha256(f"{account_id}|{region}|{profile or ''}".encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir(), f"ecr_token_{key}.json")
+
+
+def load_token(filepath: str, refresh_margin: int = DEFAULT_REFRESH_MARGIN) -> Optional[Dict]:
+    """Return the cached token if it is still valid for at least refresh_margin seconds."""
+    try:
+        with open(filepath) as file:
+            token = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    if token.get("expires_at", 0) - refresh_margin <= time.time():
+        logger.info("Cached ECR authorization token is expired or about to expire")
+        return None
+    return token
+
+
+def save_token(filepath: str, token: Dict) -> None:
+    """Write a token to the cache, readable by the current user only."""
+    os.makedirs(os.path.dirname(filepath), mode=0o700, exist_ok=True)
+    temp_filepath = f"{filepath}.{os.getpid()}.tmp"
+    fd = os.open(temp_filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as file:
+        json.dump(token, file)
+    os.replace(temp_filepath, filepath)
+
+
+def get_authorization(account_id: str,
+                      region: str,
+                      profile: Optional[str],
+                      fetch: Callable[[], Dict],
+                      refresh_margin: int = DEFAULT_REFRESH_MARGIN) -> Dict:
+    """
+    Get an ECR authorization token, calling fetch only when the cached one is missing or expiring.
+
+    Args:
+        account_id: AWS account id of the registry
+        region: AWS region of the registry
+        profile: AWS profile the token is obtained with
+        fetch: callable returning a fresh token as {"username", "password", "registry", "expires_at"}
+        refresh_margin: seconds before expiry at which a cached token is refreshed
+
+    Returns:
+        Dict: the token
+    """
+    filepath = cache_filepath(account_id, region, profile)
+    with _lock:
+        token = load_token(filepath, refresh_margin)
+        if token is not None:
+            logger.info(f"Using cached ECR authorization token for {token['registry']}")
+            return token
+
+        token = fetch()
+        save_token(filepath, token)
+        logger.info(f"Cached ECR authorization token for {token['registry']}")
+        return token
+
+
+def token_from_response(response: Dict) -> Dict:
+    """Convert a get_authorization_token response into a cacheable token."""
+    authorization_data = response["authorizationData"][0]
+    username, password = base64.b64decode(authorization_data["authorizationToken"]).decode("utf-8").split(":", 1)
+    return {
+        "username": username,
+        "password": password,
+        "registry": authorization_data["proxyEndpoint"].replace("https://", ""),
+        "expires_at": authorization_data["expiresAt"].timestamp(),
+    }
+
+
+def _docker_config() -> Dict:
+    docker_config_dir = os.environ.get("DOCKER_CONFIG", os.path.join(os.path.expanduser("~"), ".docker"))
+    try:
+        with open(os.path.join(docker_config_dir, "config.json")) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _stored_docker_secret(docker_config: Dict, registry: str) -> Optional[str]:
+    """Password the Docker credential store currently holds for a registry, if any."""
+    auth = docker_config.get("auths", {}).get(registry) or docker_config.get("auths", {}).get(f"https://{registry}")
+    if auth and auth.get("auth"):
+        return base64.b64decode(auth["auth"]).decode("utf-8").split(":", 1)[-1]
+
+    if creds_store := docker_config.get("credsStore"):
+        try:
+            process = subprocess.run([f"docker-credential-{creds_store}", "get"], input=registry,
+                                     capture_output=True, text=True, timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        if process.returncode == 0:
+            try:
+                return json.loads(process.stdout).get("Secret")
+            except ValueError:
+                return None
+    return None
+
+
+def docker_login_is_current(token: Dict) -> bool:
+    """
+    Whether `docker login` can be skipped because Docker already holds this token for the registry.
+
+    A registry served by the amazon-ecr-credential-helper never needs a login.
+    """
+    docker_config = _docker_config()
+    registry = token["registry"]
+
+    if docker_config.get("credHelpers", {}).get(registry) == "ecr-login":
+        logger.info(f"{registry} is served by the ECR credential helper, skipping docker login")
+        return True
+
+    if _stored_docker_secret(docker_config, registry) == token["password"]:
+        logger.info(f"Docker already holds a valid login for {registry}, skipping docker login")
+        return True
+    return False
+
+
+def docker_login(token: Dict) -> None:
+    """Run `docker login` for a token unless Docker already holds it."""
+    if docker_login_is_current(token):
+        return
+
+    process = subprocess.run(
+        ["docker", "login", "--username", token["username"], "--password-stdin", token["registry"]],
+        input=token["password"], capture_output=True, text=True
+    )
+    if process.returncode != 0:
+        raise Exception(f"Docker login failed: {process.stderr}")
@@ -0,0 +1,153 @@
+"""
+Registry-side ECR operations shared by the Docker SDK and the CLI deployment backends.
+"""
+import os
+
+from _logging.pg_logger import get_logger
+
+# Configure the logger
+logger = get_logger(
+    name="ecr_registry",
+    log_level=os.environ.get("LOG_LEVEL", "INFO"),
+    log_to_console=True,
+    log_to_file=True,
+    log_file_path=os.environ.get("LOG_FILE_PATH", "/tmp/ecr_deployment.log")
+)
+
+
+def ensure_repository(ecr_client,
+                      repository_name: str,
+                      scan_on_push: bool = True,
+                      encryption_type: str = "AES256",
+                      fail_if_exists: bool = False,
+                      recreate: bool = False) -> bool:
+    """
+    Make sure an ECR repository exists without throwing away the layers it already holds.
+
+    An existing repository is reused and its scanning configuration is reconciled in place, so a
+    following push only uploads the layers the registry is missing. ECR does not allow the encryption
+    configuration of a repository to change after creation; a mismatch is reported and only resolved
+    when recreate is True, which force-deletes the repository (and every image in it) first.
+
+    Args:
+        ecr_client: boto3 ECR client
+        repository_name: name of the repository
+        scan_on_push: desired imageScanningConfiguration.scanOnPush value
+        encryption_type: desired encryption type (AES256 or KMS)
+        fail_if_exists: return False when the repository already exists
+        recreate: delete and create the repository again when it already exists
+
+    Returns:
+        bool: True when the repository is ready to receive pushes, False otherwise
+    """
+    try:
+        repository = ecr_client.describe_repositories(repositoryNames=[repository_name])["repositories"][0]
+    except ecr_client.exceptions.RepositoryNotFoundException:
+        repository = None
+
+    if repository is not None:
+        if fail_if_exists:
+            logger.error(f"ECR repository {repository_name} already exists. Failing as requested.")
+            return False
+
+        if not recreate:
+            logger.info(f"ECR repository {repository_name} already exists, reusing it.")
+            reconcile_repository_settings(ecr_client, repository,
+                                          scan_on_push=scan_on_push,
+                                          encryption_type=encryption_type)
+            return True
+
+        logger.info(f"ECR repository {repository_name} already exists. Deleting it first.")
+        ecr_client.delete_repository(repositoryName=repository_name, force=True)
+        logger.info(f"Deleted ECR repository: {repository_name}")
+    else:
+        logger.info(f"ECR repository {repository_name} does not exist, proceeding with creation.")
+
+    ecr_client.create_repository(
+        repositoryName=repository_name,
+        imageScanningConfiguration={'scanOnPush': scan_on_push},
+        encryptionConfiguration={'encryptionType': encryption_type}
+    )
+    logger.info(f"Created ECR repository: {repository_name}")
+    return True
+
+
+def reconcile_repository_settings(ecr_client,
+                                  repository: dict,
+                                  scan_on_push: bool = True,
+                                  encryption_type: str = "AES256") -> None:
+    """
+    Bring the settings of an existing repository in line with the desired ones where ECR allows it.
+
+    Args:
+        ecr_client: boto3 ECR client
+        repository: repository description as returned by describe_repositories
+        scan_on_push: desired imageScanningConfiguration.scanOnPush value
+        encryption_type: desired encryption type (AES256 or KMS)
+    """
+    repository_name = repository["repositoryName"]
+
+    current_scan_on_push = repository.get("imageScanningConfiguration", {}).get("scanOnPush", False)
+    if current_scan_on_push != scan_on_push:
+        ecr_client.put_image_scanning_configuration(
+            repositoryName=repository_name,
+            imageScanningConfiguration={'scanOnPush': scan_on_push}
+        )
+        logger.info(f"Updated scanOnPush of ECR repository {repository_name} to {scan_on_push}")
+
+    current_encryption_type = repository.get("encryptionConfiguration", {}).get("encryptionType", "AES256")
+    if current_encryption_type != encryption_type:
+        logger.warning(f"ECR repository {repository_name} is encrypted with {current_encryption_type}, "
+                       f"expected {encryption_type}. ECR cannot change encryption in place, "
+                       f"recreate the repository to apply it.")
+
+
+def get_image_manifest(ecr_client, repository_name: str, image_tag: str) -> dict | None:
+    """
+    Look up an image by tag with a single batch_get_image round trip.
+
+    Args:
+        ecr_client: boto3 ECR client
+        repository_name: name of the repository
+        image_tag: tag to look up
+
+    Returns:
+        dict | None: the image (imageManifest, imageManifestMediaType, imageId) or None when the tag is absent
+    """
+    response = ecr_client.batch_get_image(repositoryName=repository_name,
+                                          imageIds=[{'imageTag': image_tag}])
+    images = response.get("images", [])
+    return images[0] if images else None
+
+
+def put_image_tag(ecr_client, repository_name: str, image: dict, image_tag: str) -> bool:
+    """
+    Point another tag at an image that is already in the registry, without pulling or pushing any layer.
+
+    Args:
+        ecr_client: boto3 ECR client
+        repository_name: name of the repository
+        image: image as returned by get_image_manifest
+        image_tag: tag to apply
+
+    Returns:
+        bool: True once the tag points at the image
+    """
+    kwargs = {}
+    if image.get("imageManifestMediaType"):
+        kwargs["imageManifestMediaType"] = image["imageManifestMediaType"]
+    try:
+        ecr_client.put_image(repositoryName=repository_name,
+                             imageManifest=image["imageManifest"],
+                             imageTag=image_tag,
+                             **kwargs)
+    except ecr_client.exceptions.ImageAlreadyExistsException:
+        logger.info(f"{repository_name}:{image_tag} already points at {image['imageId'].get('imageDigest')}")
+        return True
+    logger.info(f"Tagged {image['imageId'].get('imageDigest')} as {repository_name}:{image_tag}")
+    return True
+
+
+def fingerprint_tag(fingerprint: str) -> str:
+    """Image tag under which the build of a given app fingerprint is stored."""
+    return f"fp-{fingerprint[:32]}"
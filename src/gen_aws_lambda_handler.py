@@ -1,11 +1,17 @@
 import os
-import inspect
 import re
-import importlib
-from inspect import currentframe
-from jinja2 import Template
+import ast
+import json
+import hashlib
+import builtins
+import dataclasses
+from dataclasses import asdict, dataclass
+from typing import List, Optional, Set, Tuple
 
 from _logging.pg_logger import get_logger, log_method, error_logger
+from src import template_registry
+from src.template_registry import DEFAULT_HANDLER_TEMPLATE
+from src.main_analyzer import MainAssignment, MainFunction, POSITIONAL_ONLY, analyze_main_source
 
 # Configure the logger
 logger = get_logger(
@@ -16,6 +22,17 @@ logger = get_logger(
     log_file_path=os.environ.get("LOG_FILE_PATH", "/tmp/ecr_deployment.log")
 )
 
+# Bump when the generated code changes in a way the template text does not show, e.g. in handler_params
+HANDLER_FORMAT_VERSION = 2
+
+HEADER_PREFIX = "# Generated from main.py by aws_ecr_deploy"
+_HEADER_DIGESTS = re.compile(r"^# main\.py sha256: ([0-9a-f]{64}), template: ([0-9a-f]+)$")
+
+# Outcomes of refresh_lambda_handler
+GENERATED = "generated"
+UNCHANGED = "unchanged"
+FAILED = "failed"
+
 
 """
 
@@ -36,58 +53,6 @@ if __name__ == "__main__":
 """
 
 
-def generic_lambda_handler_template():
-    template = """import json
-{{ from_imports }}
-
-def lambda_handler(event, context):
-
-{{ declare_variables }}
-    try:
-        query_params = event.get('queryStringParameters', {})
-        print(query_params)
-{% if variables_extraction %}
-        if query_params:
-{{ variables_extraction }}
-{% endif %}
-
-{% if check_variables %}
-{{ check_variables }}
-            return {
-                    'statusCode': 404,
-                    'headers': {
-                        'Access-Control-Allow-Headers': '*',
-                        'Access-Control-Allow-Origin': '*',
-                        'Access-Control-Allow-Methods': 'OPTIONS,POST,GET'
-                    },
-                    'body': json.dumps("input variable is missing")
-            }
-{% endif %}
-
-
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Headers': '*',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'OPTIONS,POST,GET'
-            },
-            'body': json.dumps({{ return_statement }})
-        }
-
-    except Exception as err:
-        return {
-            'statusCode': 404,
-            'headers': {
-                'Access-Control-Allow-Headers': '*',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'OPTIONS,POST,GET'
-            },
-            'body': json.dumps(f"Something is error while processing, {err}")
-        }
-    """
-    return template
-
 def write_file(filepath: str, data: any) -> bool:
     """
     Writes data to a file and returns a success flag.
@@ -108,149 +73,302 @@ def write_file(filepath: str, data: any) -> bool:
         file.write(data)
     return True
 
-def extract_returned_function_name_with_inspect(function: callable) -> str:
-    """
-    Extracts the function name that is returned in the provided function using inspect.
-    """
-    # Get the source code of the provided function using inspect
-    source_code = inspect.getsource(function)
-
-    # Use a regular expression to search for a return statement that calls a function
-    pattern = re.compile(r'return\s+(.+)')  # Adjust this if needed for different cases
-    match = pattern.findall(source_code)
-
-    if match:
-        # Return the function name (the second part of the matched group)
-        return match[0]  # Group 2 contains the method/function name after the dot
-    return "No function returned in the main function."
+def convert_lambda_function(template_name: str = DEFAULT_HANDLER_TEMPLATE, **params) -> str:
+    """Render a handler template of src.template_registry with the parameters from handler_params."""
+    return template_registry.render(template_name, **params)
 
-def extract_main_param_with_inspect(function: callable) -> list:
-    # Get the signature of the function
-    signature = inspect.signature(function)
-
-    # Extract parameter names
-    return list(signature.parameters.keys())
 
+def hoisted_assignments(main_function: MainFunction, hoist: Tuple[str, ...]) -> List[MainAssignment]:
+    """
+    The assignments of main() to run at module scope, during the init phase of the function.
 
-def get_function(function_name: str):
+    Hoisting applies when main() only imports, assigns the names of hoist and returns, and when none of
+    the assigned values depends on the request: they may only read imported names, names hoisted before
+    them and builtins. Otherwise nothing is hoisted and the reason is logged.
     """
-    Dynamically load a function from a module.
+    if not hoist:
+        return []
+    assigned = [assignment.name for assignment in main_function.assignments]
+    parameters = {parameter.name for parameter in main_function.parameters}
+    if not main_function.inlinable_when_hoisted or not assigned:
+        reason = "main() is called from main.py, only a main() made of imports, assignments and a return is inlined"
+    elif not_hoisted := [name for name in assigned if name not in hoist]:
+        reason = f"{', '.join(not_hoisted)} assigned in main() but not hoisted"
+    elif len(set(assigned)) < len(assigned) or parameters & set(assigned):
+        reason = "a name is assigned twice in main(), or is a parameter"
+    else:
+        available = set(main_function.imported_names) | set(dir(builtins))
+        reason = None
+        for assignment in main_function.assignments:
+            if unknown := [name for name in assignment.reads if name not in available and "*" not in available]:
+                reason = f"{assignment.name} reads {', '.join(unknown)}, which is not imported nor hoisted before it"
+                break
+            available.add(assignment.name)
+    if reason:
+        logger.warning(f"Not hoisting {', '.join(hoist)} to the init phase: {reason}")
+        return []
+    return main_function.assignments
+
+
+def _proxy_unsafe_names(expressions: List[str]) -> Set[str]:
+    """Names the expressions use other than by attribute access or call, which a LazyImport cannot stand for."""
+    unsafe = set()
+    for expression in expressions:
+        tree = ast.parse(expression, mode="eval")
+        proxied = {id(node.value) for node in ast.walk(tree) if isinstance(node, ast.Attribute)}
+        proxied |= {id(node.func) for node in ast.walk(tree) if isinstance(node, ast.Call)}
+        unsafe |= {node.id for node in ast.walk(tree)
+                   if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and id(node) not in proxied}
+    return unsafe
+
+
+def lazy_imports(imports: List[str], expressions: List[str]) -> List[str]:
     """
-    # module = importlib.import_module("_code._generate_template")
-    # if hasattr(module, function_name):
-    #     return getattr(module, function_name)()
-    # else:
-    #     print(f"No function named {function_name} found in the module.", "FunctionNotFoundError")
-    return generic_lambda_handler_template()
-
-def load_module_from_path(module_name, filepath):
+    The import statements as LazyImport proxies (src/templates/_lazy_imports.py.j2), run on first use.
+
+    A statement stays as it is when one of the names it binds is used by expressions other than by
+    attribute access or call, e.g. passed to isinstance(), and for relative and star imports. Dotted
+    imports of one package (import a.b, import a.c) bind a single proxy of the package, which imports
+    all of its listed submodules when it resolves.
     """
-    Dynamically load a module from the given file path.
+    unsafe = _proxy_unsafe_names(expressions)
+    eager, proxies, submodules = [], {}, {}
+    for statement in imports:
+        node = ast.parse(statement).body[0]
+        bound, dotted = {}, {}
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                root = alias.name.partition(".")[0]
+                bound[alias.asname or root] = repr(alias.name if alias.asname else root)
+                if alias.asname is None and root != alias.name:
+                    dotted[alias.name] = root
+        elif node.level == 0 and all(alias.name != "*" for alias in node.names):
+            bound = {alias.asname or alias.name: f"{node.module!r}, {alias.name!r}" for alias in node.names}
+        if bound and not unsafe & set(bound):
+            proxies.update(bound)
+            for module, binding in dotted.items():
+                submodules.setdefault(binding, []).append(module)
+        else:
+            eager.append(statement)
+    lines = [f"{binding} = LazyImport({binding!r}, {arguments}"
+             + (f", submodules={tuple(submodules[binding])!r})" if binding in submodules else ")")
+             for binding, arguments in proxies.items()]
+    return eager + lines
+
+
+def handler_params(main_function: MainFunction, hoist: Tuple[str, ...] = (), lazy: bool = False) -> dict:
     """
+    The template parameters of the handler of a main() function.
 
-    spec = importlib.util.spec_from_file_location(module_name, filepath)
-
-    print(filepath)
+    When main() only imports and returns, its return expression is evaluated in the handler itself with
+    the imports it needs, as before; so it is when main() also assigns names, all of them in hoist, with
+    the assignments moved to module scope (hoisted_assignments). With lazy, these imports only run when
+    the request uses them (lazy_imports). Otherwise the handler imports main() from main.py and calls it,
+    passing the optional parameters only when the request sets them so main() applies its own defaults.
+    """
+    parameters = [parameter for parameter in main_function.parameters if not parameter.variadic]
+    required = [parameter.name for parameter in parameters if parameter.required]
+    hoisted = hoisted_assignments(main_function, hoist)
+    inline = main_function.inlinable or bool(hoisted)
+
+    imports = main_function.imports
+    if inline and lazy:
+        imports = lazy_imports(imports, [main_function.return_expression]
+                                        + [assignment.value for assignment in hoisted])
+    elif lazy:
+        logger.info("main() is called from main.py, which imports its dependencies itself: no lazy import")
+
+    if inline:
+        from_imports = "\n".join(imports)
+        if hoisted:
+            from_imports += ("\n\n# Initializers of main(), run once per execution environment\n"
+                             + "\n".join(f"{assignment.name} = {assignment.value}" for assignment in hoisted))
+        return_statement = main_function.return_expression
+    else:
+        from_imports = f"from main import {main_function.name}"
+        arguments = [parameter.name if parameter.kind == POSITIONAL_ONLY else f"{parameter.name}={parameter.name}"
+                     for parameter in parameters if parameter.required]
+        if optional := [parameter.name for parameter in parameters if not parameter.required]:
+            pairs = ", ".join(f"'{name}': {name}" for name in optional)
+            arguments.append(f"**{{key: value for key, value in {{{pairs}}}.items() if value is not None}}")
+        return_statement = f"{main_function.name}({', '.join(arguments)})"
+
+    return {
+        "from_imports": from_imports,
+        # Inlined, the literal defaults of main() are copied into the handler
+        "parameters": [{"name": parameter.name,
+                        "initial": parameter.default if inline and not parameter.required else "None",
+                        "fallback": f", {parameter.default}" if inline and not parameter.required else ""}
+                       for parameter in parameters],
+        "required": required,
+        "required_check": " or ".join(f"{name} is None" for name in required),
+        "return_statement": return_statement,
+        "is_async": main_function.is_async,
+        "inline": inline,
+        "lazy_imports": inline and imports != main_function.imports
+    }
 
 
-    if spec is None:
-        raise ImportError(f"Cannot load the module from the path: {filepath}")
+def template_digest(template_name: str = DEFAULT_HANDLER_TEMPLATE, options: Optional[dict] = None) -> str:
+    """Version of the generated code: the template, the generation options and HANDLER_FORMAT_VERSION."""
+    template = (f"{HANDLER_FORMAT_VERSION}\0{template_name}\0{template_registry.versioned_source(template_name)}"
+                f"\0{json.dumps(options or {}, sort_keys=True)}")
+    return hashlib.sha256(template.encode("utf-8")).hexdigest()[:16]
 
-    module = importlib.util.module_from_spec(spec)
 
-    spec.loader.exec_module(module)
-    return module
+def handler_header(main_digest: str, template_version: str) -> str:
+    """The header of a generated handler, recording what it was generated from."""
+    return (f"{HEADER_PREFIX}, overwritten when main.py or the template changes\n"
+            f"# main.py sha256: {main_digest}, template: {template_version}\n")
 
-def apply_template(template: str, params: dict) -> str:
-    return Template(template).render(params)
 
-def extract_from_statements(source_code: str):
+def read_handler_header(handler_filepath: str) -> Optional[Tuple[str, str]]:
     """
-    Extracts all lines from the source code that start with the keyword 'from'.
-    """
-
-    # Regular expression to match lines that start with 'from', ignoring leading spaces
-    from_pattern = re.compile(r'^\s*from\s+.+', re.MULTILINE)
-
-    # Find all matches in the source code
-    matches = from_pattern.findall(source_code)
+    The (main.py digest, template version) a handler was generated from.
 
-    return matches
-
-def convert_lambda_function(declare_variables: str,
-                            variables_extraction: str,
-                            return_statement: str,
-                            check_variables: str,
-                            from_imports: str = "",
-                            template_name: str = "generic_lambda_handler") -> str:
-    lambda_handler_template = get_function(template_name)
-
-    _params = {
-        "from_imports": from_imports,
-        "declare_variables": declare_variables,
-        "variables_extraction": variables_extraction,
-        "check_variables": check_variables,
-        "return_statement": return_statement
-    }
-    print("variables_extraction!!!!", variables_extraction.strip())
-    print("check_variables!!!!!", check_variables.strip())
-    if check_variables.strip() == "if:":
-        _params["check_variables"] = None
+    Returns:
+        Optional[Tuple[str, str]]: None when the handler was not generated, i.e. written by hand
+    """
+    try:
+        with open(handler_filepath, encoding="utf-8") as file:
+            first_line, second_line = file.readline(), file.readline()
+    except (OSError, UnicodeDecodeError):
+        return None
+    if not first_line.startswith(HEADER_PREFIX) or not (match := _HEADER_DIGESTS.match(second_line)):
+        return None
+    return match.group(1), match.group(2)
 
-    return apply_template(lambda_handler_template, _params)
 
+def generated_before_headers(handler_filepath: str) -> bool:
+    """
+    Whether a handler without the header is the output of the generator from before headers existed.
 
-def generate_lambda_handler(filepath: str) -> bool:
+    That generator read the query string parameters with a 'default_value_if_missing' fallback and
+    printed them; a hand-written handler does neither.
     """
-    Generate a lambda handler function from a given Python file.
+    try:
+        with open(handler_filepath, encoding="utf-8") as file:
+            handler = file.read()
+    except (OSError, UnicodeDecodeError):
+        return False
+    return ("query_params = event.get('queryStringParameters', {})" in handler
+            and ("'default_value_if_missing'" in handler or "print(query_params)" in handler))
+
+
+@dataclass(frozen=True)
+class ResponseCache:
+    """Options of the response cache of a generated API Gateway handler, off unless given."""
+    # Seconds a response body is served from the cache
+    ttl: float = 60.0
+    # Least recently used entries are evicted beyond either limit
+    max_entries: int = 128
+    max_bytes: int = 8 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class HandlerOptions:
+    """Generation options of a handler; they are part of its template version, changing them regenerates it."""
+    # API Gateway handler only: response bodies of main() by request parameters, across warm invocations
+    response_cache: Optional[ResponseCache] = None
+    # Names assigned in main() to compute once, at module scope, during the init phase (hoisted_assignments)
+    hoist: Tuple[str, ...] = ()
+    # Return at once on keep-warm pings: {"keep_warm": true} or serverless-plugin-warmup events
+    keep_warm: bool = False
+    # Import the dependencies of an inlined main() on first use, each import logged, instead of during init
+    lazy_imports: bool = False
+
+
+@dataclass
+class HandlerResult:
+    """Outcome of the generation of the handler of one application."""
+    app_dir: str
+    status: str
+    detail: str = ""
+
+
+def _failed(app_dir: str, message: str) -> HandlerResult:
+    error_logger("generate_lambda_handler", message, logger=logger, mode="error")
+    return HandlerResult(app_dir, FAILED, message)
+
+
+def refresh_lambda_handler(filepath: str, manifest=None,
+                           template_name: str = DEFAULT_HANDLER_TEMPLATE,
+                           options: Optional[HandlerOptions] = None) -> HandlerResult:
     """
+    Generate, or bring up to date, the lambda handler of an application, see generate_lambda_handler.
 
-    lambda_handler_filepath = os.path.join(filepath, "lambda_function.py")
-    if os.path.isfile(lambda_handler_filepath):
-        print(f"lambda_function.py found in {filepath}")
-        return True
-    else:
-        print(f"lambda_function.py does not exists in {filepath}, generating it...")
-
-    module_name = 'main'
-    print(os.path.join(filepath, "main.py"))
+    The handler header records the hash of main.py and the template version. A handler without it is
+    hand-written, unless generated_before_headers recognizes it. With a manifest, files are looked up in it.
 
+    Returns:
+        HandlerResult: GENERATED when lambda_function.py was written, UNCHANGED when it was up to date or
+                       written by hand, FAILED with the reason otherwise
+    """
+    if template_name not in template_registry.HANDLER_TEMPLATES:
+        return _failed(filepath, f"Unknown handler template {template_name}, expected one of: "
+                                 f"{', '.join(template_registry.HANDLER_TEMPLATES)}")
+    options = options or HandlerOptions()
+    if options.response_cache is not None and template_name != "api_gateway_handler":
+        logger.warning(f"The response cache is only generated into api_gateway_handler, not {template_name}")
+        options = dataclasses.replace(options, response_cache=None)
+
+    handler_filepath = os.path.join(filepath, "lambda_function.py")
+    if manifest is not None:
+        handler_exists = manifest.find("lambda_function.py", max_depth=0) is not None
+        main_filepath = manifest.find("main.py", max_depth=0)
+    else:
+        handler_exists = os.path.isfile(handler_filepath)
+        main_filepath = os.path.join(filepath, "main.py")
+        main_filepath = main_filepath if os.path.isfile(main_filepath) else None
+
+    generated_from = read_handler_header(handler_filepath) if handler_exists else None
+    if handler_exists and generated_from is None:
+        if not generated_before_headers(handler_filepath):
+            logger.info(f"lambda_function.py found in {filepath}")
+            return HandlerResult(filepath, UNCHANGED, "written by hand")
+        logger.info(f"lambda_function.py in {filepath} was generated before handlers had a header")
+
+    if main_filepath is None:
+        if handler_exists:
+            logger.warning(f"main.py not found in {filepath}, keeping the generated lambda_function.py")
+            return HandlerResult(filepath, UNCHANGED, "main.py not found")
+        return _failed(filepath, f"main.py not found in {filepath}")
 
-    module = load_module_from_path(module_name, os.path.join(filepath, "main.py"))
-
-    returned_function_name = ""
-    _declare_variables = ""
-    _variables_extraction=""
-    _from_imports =""
-    main_function = None
-
-    # Assuming 'main' is defined in the loaded module
-    if hasattr(module, 'main'):
-        main_function = getattr(module, 'main')
-
-        # Extract and print the function name returned by the 'main' function
-        returned_function_name = extract_returned_function_name_with_inspect(main_function)
-
-        print(f"The function returned in main() is: {returned_function_name}")
+    try:
+        with open(main_filepath, "rb") as file:
+            main_source = file.read()
+        current = (hashlib.sha256(main_source).hexdigest(), template_digest(template_name, asdict(options)))
+        if generated_from == current:
+            logger.info(f"Generated lambda_function.py in {filepath} is up to date")
+            return HandlerResult(filepath, UNCHANGED)
+        logger.info(f"lambda_function.py {'is stale' if handler_exists else 'does not exists'} in {filepath}, "
+                    f"generating it...")
+        main_function = analyze_main_source(main_source.decode("utf-8"), filename=main_filepath)
+    except (OSError, SyntaxError, UnicodeDecodeError) as e:
+        return _failed(filepath, f"Could not analyze {main_filepath}: {e}")
+
+    if main_function is None:
+        return _failed(filepath, f"No 'main' function found in {main_filepath}")
+
+    params = handler_params(main_function, hoist=options.hoist, lazy=options.lazy_imports)
+    logger.info(f"Handler for main({', '.join(parameter.name for parameter in main_function.parameters)}) "
+                f"{'returns ' + params['return_statement'] if params['inline'] else 'calls main.py'}")
+
+    handler = convert_lambda_function(template_name, **params, keep_warm=options.keep_warm,
+                                      response_cache=asdict(options.response_cache) if options.response_cache else None)
+    write_file(handler_filepath, handler_header(*current) + handler)
+    if manifest is not None:
+        manifest.add(handler_filepath)
+    return HandlerResult(filepath, GENERATED, "stale" if handler_exists else "")
+
+
+def generate_lambda_handler(filepath: str, manifest=None, template_name: str = DEFAULT_HANDLER_TEMPLATE,
+                            options: Optional[HandlerOptions] = None) -> bool:
+    """
+    Generate a lambda handler function from a given Python file.
 
-    else:
-        print(f"No 'main' function found in {filepath}", "MainFunctionNotFoundError")
-
-    _function_params = extract_main_param_with_inspect(main_function)
-    print(_function_params)
-
-    _declare_variables = '\n'.join([f"    {param} = None" for param in _function_params])
-    _variables_extraction = '\n'.join([f"            {param} = query_params.get('{param}', 'default_value_if_missing')" for param in _function_params])
-    _check_variables = "        if" + ' or'.join([f" {param} is None" for param in _function_params]) + ":"
-
-    _from_imports = '\n'.join(extract_from_statements(inspect.getsource(main_function)))
-    print(_from_imports)
-
-    write_file(os.path.join(filepath, "lambda_function.py"),
-                           convert_lambda_function(declare_variables=_declare_variables,
-                                                   variables_extraction=_variables_extraction,
-                                                   return_statement=returned_function_name,
-                                                   check_variables=_check_variables,
-                                                   from_imports=_from_imports.strip())
-                           )
-    return True
\ No newline at end of file
+    main.py is analyzed statically, never imported. A generated handler is rewritten only when main.py, the
+    template or the options changed, a hand-written one never; see refresh_lambda_handler.
+    """
+    return refresh_lambda_handler(filepath, manifest=manifest, template_name=template_name,
+                                  options=options).status != FAILED
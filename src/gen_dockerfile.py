@@ -0,0 +1,189 @@
+"""
+Generate the Dockerfile of an application that does not ship one.
+
+The layers are ordered for the build cache: requirements.txt is copied and installed on its own, before
+the application code, so editing the code only rebuilds the last layer and the dependency layer is
+reused for as long as requirements.txt does not change. The multi-stage variant installs the
+dependencies in a builder stage and only copies the installed packages into the final image. The
+wheelhouse variant installs them offline from a local wheelhouse (src.wheelhouse) with BuildKit mounts.
+The template, src/templates/Dockerfile.j2, is compiled once per process by src.template_registry.
+
+A generated Dockerfile records the options it was generated with in a header, and is generated again
+when they change; a Dockerfile without the header was written by hand and is never overwritten.
+"""
+import os
+import json
+from typing import Optional
+
+from _logging.pg_logger import get_logger
+from src import template_registry
+
+# Configure the logger
+logger = get_logger(
+    name="gen_dockerfile",
+    log_level=os.environ.get("LOG_LEVEL", "INFO"),
+    log_to_console=True,
+    log_to_file=True,
+    log_file_path=os.environ.get("LOG_FILE_PATH", "/tmp/ecr_deployment.log")
+)
+
+DEFAULT_BASE_IMAGE = "public.ecr.aws/lambda/python:3.11"
+DEFAULT_HANDLER = "lambda_function.lambda_handler"
+
+# Build context the wheelhouse is mounted from, see src.wheelhouse
+WHEELHOUSE_CONTEXT = "wheelhouse"
+
+HEADER_PREFIX = "# Generated by aws_ecr_deploy, overwritten when its options change"
+_HEADER_OPTIONS = "# options: "
+
+# Line of every Dockerfile generated before the header existed, which are generated again as well
+_UNVERSIONED_MARKER = "# Copy the application code last, a code change only rebuilds this layer"
+
+# Short names accepted for the base image, anything else is used as an image reference
+BASE_IMAGES = {
+    f"python{version}": f"public.ecr.aws/lambda/python:{version}"
+    for version in ("3.8", "3.9", "3.10", "3.11", "3.12", "3.13")
+}
+
+
+def lambda_dockerfile_template():
+    return template_registry.template_source("dockerfile")
+
+
+def resolve_base_image(base_image: Optional[str]) -> str:
+    """The image reference of a base image given by short name (e.g. python3.12) or reference."""
+    if not base_image:
+        return DEFAULT_BASE_IMAGE
+    return BASE_IMAGES.get(base_image, base_image)
+
+
+def render_dockerfile(base_image: Optional[str] = None,
+                      multi_stage: bool = False,
+                      build_image: Optional[str] = None,
+                      handler: str = DEFAULT_HANDLER,
+                      workdir: str = "/var/task",
+                      wheelhouse: bool = False) -> str:
+    """
+    Render the Dockerfile of a Lambda application.
+
+    Args:
+        base_image: base image of the final image, a short name from BASE_IMAGES or an image reference
+        multi_stage: install the dependencies in a separate builder stage
+        build_image: base image of the builder stage, defaults to the base image
+        handler: Lambda handler the image runs
+        workdir: directory the application is copied to (the Lambda task root of the AWS base images)
+        wheelhouse: install the dependencies offline from the wheelhouse build context (src.wheelhouse),
+                    which needs BuildKit
+
+    Returns:
+        str: the Dockerfile
+    """
+    base_image = resolve_base_image(base_image)
+    return template_registry.render(
+        "dockerfile",
+        base_image=base_image,
+        build_image=resolve_base_image(build_image) if build_image else base_image,
+        multi_stage=multi_stage,
+        handler=handler,
+        workdir=workdir,
+        wheelhouse=wheelhouse,
+        wheelhouse_context=WHEELHOUSE_CONTEXT
+    )
+
+
+def dockerfile_options(base_image: Optional[str] = None, multi_stage: bool = False,
+                       wheelhouse: bool = False) -> dict:
+    """The options a generated Dockerfile depends on, as recorded in its header."""
+    return {"base_image": resolve_base_image(base_image), "multi_stage": multi_stage, "wheelhouse": wheelhouse}
+
+
+def with_header(dockerfile: str, options: dict) -> str:
+    """The Dockerfile with its header, after the parser directives that have to stay on the first lines."""
+    lines = dockerfile.splitlines(keepends=True)
+    directives = 0
+    while directives < len(lines) and lines[directives].startswith("# syntax="):
+        directives += 1
+    header = f"{HEADER_PREFIX}\n{_HEADER_OPTIONS}{json.dumps(options, sort_keys=True)}\n"
+    return "".join(lines[:directives]) + header + "".join(lines[directives:])
+
+
+def read_dockerfile_options(dockerfile: str) -> Optional[dict]:
+    """
+    The options a Dockerfile was generated with.
+
+    Returns:
+        Optional[dict]: the options of its header, {} for a Dockerfile generated before the header existed,
+                        None for a hand-written Dockerfile
+    """
+    lines = dockerfile.splitlines()
+    for index, line in enumerate(lines[:3]):
+        if line == HEADER_PREFIX and index + 1 < len(lines) and lines[index + 1].startswith(_HEADER_OPTIONS):
+            try:
+                return json.loads(lines[index + 1][len(_HEADER_OPTIONS):])
+            except ValueError:
+                return {}
+    return {} if _UNVERSIONED_MARKER in lines else None
+
+
+def uses_wheelhouse(dockerfile: str) -> bool:
+    """Whether a Dockerfile mounts the wheelhouse build context."""
+    return f"from={WHEELHOUSE_CONTEXT}," in dockerfile
+
+
+def generate_dockerfile(dirpath: str, base_image: Optional[str] = None, multi_stage: bool = False,
+                        wheelhouse: bool = False) -> bool:
+    """
+    Write the generated Dockerfile into dirpath, unless the application already has an up-to-date one.
+
+    A generated Dockerfile is generated again when it was generated with other options. A hand-written
+    one is kept, but it has to agree with the wheelhouse option: a Dockerfile mounting the wheelhouse
+    cannot be built without it.
+
+    Args:
+        dirpath: application directory
+        base_image: base image, a short name from BASE_IMAGES or an image reference
+        multi_stage: install the dependencies in a separate builder stage
+        wheelhouse: install the dependencies offline from the wheelhouse build context
+
+    Returns:
+        bool: True once dirpath holds a Dockerfile that can be built with these options
+    """
+    dockerfile_path = os.path.join(dirpath, "Dockerfile")
+    options = dockerfile_options(base_image=base_image, multi_stage=multi_stage, wheelhouse=wheelhouse)
+    if os.path.isfile(dockerfile_path):
+        with open(dockerfile_path) as file:
+            dockerfile = file.read()
+        generated_with = read_dockerfile_options(dockerfile)
+        if generated_with is None:
+            logger.info(f"Dockerfile found in {dirpath}")
+            return check_wheelhouse(dockerfile_path, wheelhouse)
+        if generated_with == options:
+            logger.info(f"Generated Dockerfile in {dirpath} is up to date")
+            return True
+        logger.info(f"Dockerfile in {dirpath} was generated with other options, generating it again")
+
+    with open(dockerfile_path, "w") as file:
+        file.write(with_header(render_dockerfile(base_image=base_image, multi_stage=multi_stage,
+                                                 wheelhouse=wheelhouse), options))
+    logger.info(f"Generated {'multi-stage ' if multi_stage else ''}Dockerfile for {resolve_base_image(base_image)} "
+                f"in {dirpath}")
+    return True
+
+
+def check_wheelhouse(dockerfile_path: str, wheelhouse: bool) -> bool:
+    """
+    Whether a Dockerfile agrees with the wheelhouse option.
+
+    Returns:
+        bool: False when the Dockerfile mounts the wheelhouse build context and the wheelhouse is off
+    """
+    with open(dockerfile_path) as file:
+        mounted = uses_wheelhouse(file.read())
+    if mounted and not wheelhouse:
+        logger.error(f"{dockerfile_path} mounts the {WHEELHOUSE_CONTEXT} build context, which only exists with "
+                     f"WHEELHOUSE enabled: enable it, or delete the Dockerfile to have it generated again")
+        return False
+    if wheelhouse and not mounted:
+        logger.warning(f"WHEELHOUSE is enabled but {dockerfile_path} does not mount the {WHEELHOUSE_CONTEXT} "
+                       f"build context, its dependencies are downloaded during the build")
+    return True
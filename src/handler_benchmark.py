@@ -0,0 +1,343 @@
+"""
+Cold-start and warm-latency benchmark of the lambda_function.lambda_handler of an application.
+
+Every cold run imports lambda_function in a fresh interpreter started with `-X importtime`, which gives
+the init time and how it splits over the modules the handler imports. The first run then replays the
+events through lambda_handler with a fake context and records the latency of every invocation, the
+peak RSS, the memory blocks left allocated and the peak traced allocation of an invocation.
+
+Results are written as JSON together with the Python version, the platform and the hash of the handler,
+and can be compared with the results of an earlier commit, failing when a metric regressed:
+
+    python -m src.handler_benchmark APP_DIR [--events events.jsonl] [-n 200] [--output result.json]
+                                            [--baseline previous.json --max-regression 20]
+"""
+import os
+import sys
+import json
+import hashlib
+import platform
+import statistics
+import subprocess
+import tempfile
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+import click
+
+# Add the project root to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from _logging.pg_logger import get_logger
+
+# Configure the logger
+logger = get_logger(
+    name="handler_benchmark",
+    log_level=os.environ.get("LOG_LEVEL", "INFO"),
+    log_to_console=True,
+    log_to_file=True,
+    log_file_path=os.environ.get("LOG_FILE_PATH", "/tmp/ecr_deployment.log")
+)
+
+DEFAULT_ITERATIONS = 100
+DEFAULT_COLD_RUNS = 5
+DEFAULT_MAX_REGRESSION = 20.0
+
+# Metrics compared with a baseline, lower is better for all of them
+COMPARED_METRICS = ("init_ms", "p50_ms", "p95_ms", "p99_ms", "peak_rss_kb")
+
+_IMPORT_START = "handler-benchmark: import start"
+_IMPORT_END = "handler-benchmark: import end"
+
+# Runs in the fresh interpreter: nothing but the standard library is imported before lambda_function
+_RUNNER = r'''
+import sys, time
+
+app_dir, events_path, iterations, result_path = sys.argv[1], sys.argv[2], int(sys.argv[3]), sys.argv[4]
+sys.path.insert(0, app_dir)
+
+
+def rss_kb():
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+class Context:
+    function_name = "lambda-benchmark"
+    function_version = "$LATEST"
+    invoked_function_arn = "arn:aws:lambda:us-east-1:123456789012:function:lambda-benchmark"
+    memory_limit_in_mb = 128
+    aws_request_id = "00000000-0000-0000-0000-000000000000"
+    log_group_name = "/aws/lambda/lambda-benchmark"
+    log_stream_name = "benchmark"
+
+    def get_remaining_time_in_millis(self):
+        return 30000
+
+
+sys.stderr.write("%s\n" % IMPORT_START)
+sys.stderr.flush()
+start = time.perf_counter()
+import lambda_function
+init_ms = (time.perf_counter() - start) * 1000
+sys.stderr.write("%s\n" % IMPORT_END)
+sys.stderr.flush()
+
+# Imported after the handler, so that its own imports of these modules are measured
+import json, tracemalloc
+
+result = {"init_ms": init_ms, "rss_after_init_kb": rss_kb()}
+if iterations:
+    with open(events_path) as file:
+        events = json.load(file)
+    handler, context = lambda_function.lambda_handler, Context()
+    latencies, errors = [], 0
+    blocks = sys.getallocatedblocks()
+    for index in range(iterations):
+        event = events[index % len(events)]
+        start = time.perf_counter_ns()
+        try:
+            handler(event, context)
+        except Exception:
+            errors += 1
+        latencies.append((time.perf_counter_ns() - start) / 1e6)
+    result.update(latencies_ms=latencies, errors=errors, allocated_blocks_delta=sys.getallocatedblocks() - blocks)
+
+    # Traced separately, tracemalloc slows every allocation down
+    tracemalloc.start()
+    traced_peak = 0
+    for event in events[:10]:
+        tracemalloc.reset_peak()
+        try:
+            handler(event, context)
+        except Exception:
+            pass
+        traced_peak = max(traced_peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+    result["traced_peak_bytes"] = traced_peak
+result["peak_rss_kb"] = rss_kb()
+
+with open(result_path, "w") as file:
+    json.dump(result, file)
+'''.replace("IMPORT_START", repr(_IMPORT_START)).replace("IMPORT_END", repr(_IMPORT_END))
+
+
+@dataclass
+class ModuleImport:
+    """A module imported by the handler, from -X importtime."""
+    module: str
+    self_us: int
+    cumulative_us: int
+
+
+@dataclass
+class BenchmarkResult:
+    """Result of a handler benchmark; every metric is comparable across commits on the same host."""
+    app_dir: str
+    handler_sha256: str
+    python: str
+    platform: str
+    cold_runs: int
+    iterations: int
+    init_ms: float = 0.0
+    init_ms_runs: List[float] = field(default_factory=list)
+    # Modules imported by lambda_function itself, by cumulative import time
+    imports: List[ModuleImport] = field(default_factory=list)
+    # Modules spending the most import time on their own code, anywhere in the import tree
+    slowest_modules: List[ModuleImport] = field(default_factory=list)
+    p50_ms: float = 0.0
+    p95_ms: float = 0.0
+    p99_ms: float = 0.0
+    mean_ms: float = 0.0
+    max_ms: float = 0.0
+    errors: int = 0
+    rss_after_init_kb: int = 0
+    peak_rss_kb: int = 0
+    allocated_blocks_delta: int = 0
+    traced_peak_bytes: int = 0
+
+    def summary(self) -> str:
+        lines = [f"Handler of {self.app_dir} (Python {self.python}, {self.platform})",
+                 f"  init:     {self.init_ms:.1f} ms (median of {self.cold_runs} cold runs), "
+                 f"RSS {self.rss_after_init_kb / 1024:.1f} MB after init"]
+        lines += [f"    {module.cumulative_us / 1000:8.1f} ms  {module.module}" for module in self.imports[:10]]
+        lines += [f"  latency:  p50 {self.p50_ms:.3f} ms, p95 {self.p95_ms:.3f} ms, p99 {self.p99_ms:.3f} ms, "
+                  f"max {self.max_ms:.3f} ms over {self.iterations} invocations ({self.errors} errors)",
+                  f"  memory:   peak RSS {self.peak_rss_kb / 1024:.1f} MB, "
+                  f"{self.allocated_blocks_delta:+d} blocks left allocated, "
+                  f"{self.traced_peak_bytes / 1024:.1f} KB traced peak per invocation"]
+        return "\n".join(lines)
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Nearest-rank percentile, 0.0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+def load_events(filepath: Optional[str]) -> List[Dict]:
+    """
+    The events to replay: a JSON file holding one event or a list of events, or a JSONL file.
+
+    Without a file, the event is an empty one.
+    """
+    if not filepath:
+        return [{}]
+    with open(filepath) as file:
+        if filepath.endswith(".jsonl"):
+            return [json.loads(line) for line in file if line.strip()]
+        events = json.load(file)
+    return events if isinstance(events, list) else [events]
+
+
+def parse_importtime(stderr: str) -> List[ModuleImport]:
+    """
+    The -X importtime records of the import of lambda_function, with their nesting depth.
+
+    Returns:
+        List[ModuleImport]: the records, the module name keeping the indentation that gives its depth
+    """
+    records, inside = [], False
+    for line in stderr.splitlines():
+        if line == _IMPORT_START:
+            inside = True
+        elif line == _IMPORT_END:
+            break
+        elif inside and line.startswith("import time:") and "|" in line:
+            self_us, cumulative_us, module = line[len("import time:"):].split("|", 2)
+            if self_us.strip().isdigit():
+                records.append(ModuleImport(module.rstrip()[1:], int(self_us), int(cumulative_us)))
+    return records
+
+
+def _run_cold(app_dir: str, events_path: str, iterations: int) -> Dict:
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as result_file:
+        result_path = result_file.name
+    try:
+        # The handler output is not part of the benchmark, stdout is discarded
+        process = subprocess.run([sys.executable, "-X", "importtime", "-c", _RUNNER,
+                                  app_dir, events_path, str(iterations), result_path],
+                                 cwd=app_dir, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if process.returncode:
+            raise RuntimeError(f"Importing lambda_function failed:\n{process.stderr.strip()[-2000:]}")
+        with open(result_path) as file:
+            result = json.load(file)
+        result["imports"] = parse_importtime(process.stderr)
+        return result
+    finally:
+        os.unlink(result_path)
+
+
+def run_benchmark(app_dir: str,
+                  events_path: Optional[str] = None,
+                  iterations: int = DEFAULT_ITERATIONS,
+                  cold_runs: int = DEFAULT_COLD_RUNS) -> BenchmarkResult:
+    """
+    Benchmark the lambda_function.lambda_handler of an application.
+
+    Args:
+        app_dir: application directory holding lambda_function.py
+        events_path: events to replay (JSON or JSONL), event.json of the application when it has one
+        iterations: number of invocations replayed in the first cold run
+        cold_runs: number of fresh interpreters importing the handler, init time is their median
+
+    Returns:
+        BenchmarkResult: init time and its breakdown, latency percentiles and memory
+    """
+    app_dir = os.path.abspath(app_dir)
+    handler_filepath = os.path.join(app_dir, "lambda_function.py")
+    if events_path is None and os.path.isfile(os.path.join(app_dir, "event.json")):
+        events_path = os.path.join(app_dir, "event.json")
+    with open(handler_filepath, "rb") as file:
+        handler_sha256 = hashlib.sha256(file.read()).hexdigest()
+
+    with tempfile.TemporaryDirectory(prefix="handler_benchmark_") as tmp_dir:
+        replay_path = os.path.join(tmp_dir, "events.json")
+        with open(replay_path, "w") as file:
+            json.dump(load_events(events_path), file)
+        logger.info(f"Benchmarking {handler_filepath}: {cold_runs} cold runs, {iterations} invocations")
+        runs = [_run_cold(app_dir, replay_path, iterations if index == 0 else 0) for index in range(cold_runs)]
+
+    first = runs[0]
+    direct = {}
+    for run in runs:
+        for record in run["imports"]:
+            # Two spaces of indentation per level, lambda_function itself is the only top-level import
+            if len(record.module) - len(record.module.lstrip()) == 2:
+                direct.setdefault(record.module.strip(), []).append(record)
+    latencies = first.get("latencies_ms", [])
+
+    return BenchmarkResult(
+        app_dir=app_dir,
+        handler_sha256=handler_sha256,
+        python=platform.python_version(),
+        platform=f"{platform.system()}-{platform.machine()}",
+        cold_runs=cold_runs,
+        iterations=iterations,
+        init_ms=statistics.median(run["init_ms"] for run in runs),
+        init_ms_runs=[run["init_ms"] for run in runs],
+        imports=sorted((ModuleImport(module,
+                                     int(statistics.median(record.self_us for record in records)),
+                                     int(statistics.median(record.cumulative_us for record in records)))
+                        for module, records in direct.items()), key=lambda record: -record.cumulative_us),
+        slowest_modules=[ModuleImport(record.module.strip(), record.self_us, record.cumulative_us)
+                         for record in sorted(first["imports"], key=lambda record: -record.self_us)[:10]],
+        p50_ms=percentile(latencies, 50),
+        p95_ms=percentile(latencies, 95),
+        p99_ms=percentile(latencies, 99),
+        mean_ms=statistics.fmean(latencies) if latencies else 0.0,
+        max_ms=max(latencies, default=0.0),
+        errors=first.get("errors", 0),
+        rss_after_init_kb=first["rss_after_init_kb"],
+        peak_rss_kb=first["peak_rss_kb"],
+        allocated_blocks_delta=first.get("allocated_blocks_delta", 0),
+        traced_peak_bytes=first.get("traced_peak_bytes", 0)
+    )
+
+
+def regressions(result: BenchmarkResult, baseline: Dict, max_regression: float = DEFAULT_MAX_REGRESSION) -> List[str]:
+    """The metrics of result worse than in baseline (a saved result) by more than max_regression percent."""
+    messages = []
+    for metric in COMPARED_METRICS:
+        before, after = baseline.get(metric), getattr(result, metric)
+        if before and after > before * (1 + max_regression / 100):
+            messages.append(f"{metric}: {before:.3f} -> {after:.3f} (+{(after / before - 1) * 100:.0f}%)")
+    return messages
+
+
+@click.command()
+@click.argument("app_dir", type=click.Path(exists=True, file_okay=False))
+@click.option("--events", "events_path", type=click.Path(exists=True, dir_okay=False),
+              help="Events to replay, a JSON file (one event or a list) or a JSONL file [default: APP_DIR/event.json]")
+@click.option("-n", "--iterations", type=int, default=DEFAULT_ITERATIONS, show_default=True,
+              help="Number of invocations")
+@click.option("--cold-runs", type=int, default=DEFAULT_COLD_RUNS, show_default=True,
+              help="Number of fresh interpreters importing the handler")
+@click.option("--output", type=click.Path(dir_okay=False), help="Write the result as JSON to this file")
+@click.option("--baseline", type=click.Path(exists=True, dir_okay=False),
+              help="Result of an earlier run to compare with, the command fails when a metric regressed")
+@click.option("--max-regression", type=float, default=DEFAULT_MAX_REGRESSION, show_default=True,
+              help="Percentage a metric may grow over the baseline")
+def main(app_dir, events_path, iterations, cold_runs, output, baseline, max_regression):
+    """Benchmark the cold start and the warm latency of the lambda_handler of APP_DIR."""
+    result = run_benchmark(app_dir, events_path=events_path, iterations=iterations, cold_runs=max(1, cold_runs))
+    click.echo(result.summary())
+    if output:
+        with open(output, "w") as file:
+            json.dump(asdict(result), file, indent=2)
+
+    if baseline:
+        with open(baseline) as file:
+            worse = regressions(result, json.load(file), max_regression)
+        if worse:
+            click.echo(f"Regressions over {baseline}:\n  " + "\n  ".join(worse))
+            sys.exit(1)
+        click.echo(f"No regression over {baseline} beyond {max_regression:.0f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Static analysis of the main() function a Lambda handler is generated from.
+
+main.py is parsed with `ast`, never imported: none of its top-level code runs, analyzing it costs the
+same however heavy the dependencies of the application are, and it works on hosts where those
+dependencies are not installed at all.
+"""
+import ast
+import builtins
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Set
+
+# Parameter kinds, named after inspect.Parameter kinds
+POSITIONAL_ONLY = "positional_only"
+POSITIONAL_OR_KEYWORD = "positional_or_keyword"
+VAR_POSITIONAL = "var_positional"
+KEYWORD_ONLY = "keyword_only"
+VAR_KEYWORD = "var_keyword"
+
+
+@dataclass
+class MainParameter:
+    """A parameter of main(); default and annotation are source code, None when absent."""
+    name: str
+    kind: str = POSITIONAL_OR_KEYWORD
+    default: Optional[str] = None
+    annotation: Optional[str] = None
+
+    @property
+    def variadic(self) -> bool:
+        return self.kind in (VAR_POSITIONAL, VAR_KEYWORD)
+
+    @property
+    def required(self) -> bool:
+        return self.default is None and not self.variadic
+
+    @property
+    def literal_default(self) -> bool:
+        """Whether the default is a literal, which can be copied into the handler as is."""
+        if self.default is None:
+            return False
+        try:
+            ast.literal_eval(self.default)
+            return True
+        except (ValueError, SyntaxError):
+            return False
+
+
+@dataclass
+class MainAssignment:
+    """A `name = value` statement of the body of main(); value is source code."""
+    name: str
+    value: str
+    # Names the value reads, the ones it binds itself (comprehension variables, lambda arguments) excluded
+    reads: List[str] = field(default_factory=list)
+
+
+@dataclass
+class MainFunction:
+    """What the handler generator needs to know about main()."""
+    name: str
+    lineno: int
+    is_async: bool = False
+    parameters: List[MainParameter] = field(default_factory=list)
+    # Import statements main() depends on: its own, then the module-level ones it uses
+    imports: List[str] = field(default_factory=list)
+    # Names bound by the import statements above
+    imported_names: List[str] = field(default_factory=list)
+    # Expressions of the return statements of main(), nested functions excluded
+    returns: List[str] = field(default_factory=list)
+    # main() only imports, assigns names and returns, so its return expression can stand in for a call
+    simple_body: bool = False
+    # The assignments of a simple body, in order
+    assignments: List[MainAssignment] = field(default_factory=list)
+    # Names the return expression reads, the ones it binds itself excluded
+    return_reads: List[str] = field(default_factory=list)
+
+    @property
+    def return_expression(self) -> Optional[str]:
+        """The return expression, when main() has exactly one return statement with a value."""
+        return self.returns[0] if len(self.returns) == 1 and self.returns[0] else None
+
+    @property
+    def inlinable(self) -> bool:
+        """Whether the handler can evaluate the return expression itself instead of calling main()."""
+        return not self.assignments and self.inlinable_when_hoisted
+
+    @property
+    def inlinable_when_hoisted(self) -> bool:
+        """
+        Whether the handler can evaluate the return expression once the assignments run at module scope.
+
+        The expression may only read parameters, imported names, assigned names and builtins: anything
+        else, a helper function or a constant of main.py, only exists in main.py.
+        """
+        available = ({parameter.name for parameter in self.parameters} | set(self.imported_names)
+                     | {assignment.name for assignment in self.assignments} | set(dir(builtins)))
+        return (self.simple_body and not self.is_async and self.return_expression is not None
+                and all(not parameter.variadic for parameter in self.parameters)
+                and all(parameter.literal_default for parameter in self.parameters if not parameter.required)
+                and ("*" in available or set(self.return_reads) <= available))
+
+
+def _own_nodes(function: ast.AST) -> Iterator[ast.AST]:
+    """The nodes of a function in source order, without descending into nested functions, lambdas and classes."""
+    pending = list(reversed(list(ast.iter_child_nodes(function))))
+    while pending:
+        node = pending.pop()
+        yield node
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)):
+            pending.extend(reversed(list(ast.iter_child_nodes(node))))
+
+
+def _bound_names(node: ast.AST) -> Set[str]:
+    """Names an import statement binds, "*" for a star import."""
+    if isinstance(node, ast.Import):
+        return {alias.asname or alias.name.split(".", 1)[0] for alias in node.names}
+    return {alias.asname or alias.name for alias in node.names}
+
+
+def _source(node: Optional[ast.AST]) -> Optional[str]:
+    return ast.unparse(node) if node is not None else None
+
+
+def _parameters(arguments: ast.arguments) -> List[MainParameter]:
+    positional = arguments.posonlyargs + arguments.args
+    # Defaults belong to the last positional parameters
+    defaults = [None] * (len(positional) - len(arguments.defaults)) + list(arguments.defaults)
+
+    parameters = [MainParameter(argument.arg,
+                                POSITIONAL_ONLY if index < len(arguments.posonlyargs) else POSITIONAL_OR_KEYWORD,
+                                _source(default), _source(argument.annotation))
+                  for index, (argument, default) in enumerate(zip(positional, defaults))]
+    if arguments.vararg:
+        parameters.append(MainParameter(arguments.vararg.arg, VAR_POSITIONAL,
+                                        annotation=_source(arguments.vararg.annotation)))
+    parameters += [MainParameter(argument.arg, KEYWORD_ONLY, _source(default), _source(argument.annotation))
+                   for argument, default in zip(arguments.kwonlyargs, arguments.kw_defaults)]
+    if arguments.kwarg:
+        parameters.append(MainParameter(arguments.kwarg.arg, VAR_KEYWORD,
+                                        annotation=_source(arguments.kwarg.annotation)))
+    return parameters
+
+
+def _is_assignment(statement: ast.stmt) -> bool:
+    return (isinstance(statement, ast.Assign) and len(statement.targets) == 1
+            and isinstance(statement.targets[0], ast.Name))
+
+
+def _is_simple(body: List[ast.stmt]) -> bool:
+    *statements, last = body
+    for index, statement in enumerate(statements):
+        is_docstring = (index == 0 and isinstance(statement, ast.Expr)
+                        and isinstance(statement.value, ast.Constant) and isinstance(statement.value.value, str))
+        if not is_docstring and not isinstance(statement, (ast.Import, ast.ImportFrom)) and not _is_assignment(statement):
+            return False
+    return isinstance(last, ast.Return) and last.value is not None
+
+
+def _reads(expression: ast.AST) -> List[str]:
+    """Names an expression reads, without the ones it binds itself: comprehension variables and lambda arguments."""
+    names = [node for node in ast.walk(expression) if isinstance(node, ast.Name)]
+    bound = {node.id for node in names if isinstance(node.ctx, ast.Store)}
+    bound |= {node.arg for node in ast.walk(expression) if isinstance(node, ast.arg)}
+    return sorted({node.id for node in names if isinstance(node.ctx, ast.Load)} - bound)
+
+
+def _assignment(statement: ast.Assign) -> MainAssignment:
+    return MainAssignment(statement.targets[0].id, ast.unparse(statement.value), _reads(statement.value))
+
+
+def analyze_main_source(source: str, filename: str = "main.py", function_name: str = "main") -> Optional[MainFunction]:
+    """
+    Analyze the main() function of a module from its source.
+
+    Args:
+        source: source code of the module
+        filename: file name reported in syntax errors
+        function_name: name of the module-level function to analyze
+
+    Returns:
+        Optional[MainFunction]: the analysis, None when the module defines no such function
+
+    Raises:
+        SyntaxError: when the source does not parse
+    """
+    module = ast.parse(source, filename=filename)
+    # The last definition wins, as it would at import time
+    function = None
+    for node in module.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == function_name:
+            function = node
+    if function is None:
+        return None
+
+    own_nodes = list(_own_nodes(function))
+    # Nested functions and lambdas use the module-level imports too
+    used_names = {node.id for node in ast.walk(function) if isinstance(node, ast.Name)}
+    import_nodes = [node for node in own_nodes if isinstance(node, (ast.Import, ast.ImportFrom))]
+    import_nodes += [node for node in module.body
+                     if isinstance(node, (ast.Import, ast.ImportFrom)) and _bound_names(node) & (used_names | {"*"})]
+    simple_body = _is_simple(function.body)
+    return_nodes = [node for node in own_nodes if isinstance(node, ast.Return)]
+
+    return MainFunction(
+        name=function.name,
+        lineno=function.lineno,
+        is_async=isinstance(function, ast.AsyncFunctionDef),
+        parameters=_parameters(function.args),
+        imports=[ast.unparse(node) for node in import_nodes],
+        imported_names=sorted(set().union(*(_bound_names(node) for node in import_nodes))),
+        returns=[ast.unparse(node.value) if node.value is not None else "" for node in return_nodes],
+        simple_body=simple_body,
+        assignments=[_assignment(statement) for statement in function.body if _is_assignment(statement)]
+                    if simple_body else [],
+        return_reads=_reads(return_nodes[0].value) if len(return_nodes) == 1 and return_nodes[0].value else []
+    )
+
+
+def analyze_main(filepath: str, function_name: str = "main") -> Optional[MainFunction]:
+    """Analyze the main() function of a file, see analyze_main_source."""
+    with open(filepath, encoding="utf-8") as file:
+        return analyze_main_source(file.read(), filename=filepath, function_name=function_name)
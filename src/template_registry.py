@@ -0,0 +1,91 @@
+"""
+Registry of the Jinja templates the handlers and Dockerfiles are generated from.
+
+Every template is compiled once per process by a shared jinja2.Environment, whatever the number of
+applications generated in it, and the compiled bytecode is kept on disk (TEMPLATE_CACHE_DIR), so a
+new process loads it instead of compiling the template again. The templates live in src/templates;
+the ones whose file name starts with an underscore are only included by the others.
+"""
+import os
+from functools import lru_cache
+from typing import Dict
+
+import jinja2
+import jinja2.meta
+
+# Template name -> file in src/templates
+TEMPLATES: Dict[str, str] = {
+    "api_gateway_handler": "api_gateway_handler.py.j2",
+    "sqs_batch_handler": "sqs_batch_handler.py.j2",
+    "scheduled_handler": "scheduled_handler.py.j2",
+    "dockerfile": "Dockerfile.j2",
+}
+
+HANDLER_TEMPLATES = tuple(name for name in TEMPLATES if name.endswith("_handler"))
+DEFAULT_HANDLER_TEMPLATE = "api_gateway_handler"
+
+
+def cache_dir() -> str:
+    """Directory holding the compiled templates (TEMPLATE_CACHE_DIR, defaults to ~/.cache/aws_ecr_deploy/jinja)."""
+    return os.environ.get("TEMPLATE_CACHE_DIR",
+                          os.path.join(os.path.expanduser("~"), ".cache", "aws_ecr_deploy", "jinja"))
+
+
+@lru_cache(maxsize=None)
+def environment() -> jinja2.Environment:
+    """The shared environment; templates are loaded once, and not checked for changes afterwards."""
+    bytecode_cache = None
+    try:
+        os.makedirs(cache_dir(), exist_ok=True)
+        bytecode_cache = jinja2.FileSystemBytecodeCache(cache_dir())
+    except OSError:
+        pass
+    return jinja2.Environment(
+        loader=jinja2.PackageLoader("src", "templates"),
+        bytecode_cache=bytecode_cache,
+        auto_reload=False,
+        trim_blocks=True,
+        lstrip_blocks=True,
+        undefined=jinja2.StrictUndefined
+    )
+
+
+def get_template(name: str) -> jinja2.Template:
+    """
+    The compiled template of a name from TEMPLATES.
+
+    Raises:
+        ValueError: when no template has this name
+    """
+    if name not in TEMPLATES:
+        raise ValueError(f"Unknown template {name}, expected one of: {', '.join(TEMPLATES)}")
+    return environment().get_template(TEMPLATES[name])
+
+
+@lru_cache(maxsize=None)
+def template_source(name: str) -> str:
+    """The source of a template, e.g. to version what was generated from it."""
+    if name not in TEMPLATES:
+        raise ValueError(f"Unknown template {name}, expected one of: {', '.join(TEMPLATES)}")
+    source, _, _ = environment().loader.get_source(environment(), TEMPLATES[name])
+    return source
+
+
+@lru_cache(maxsize=None)
+def versioned_source(name: str) -> str:
+    """The source of a template followed by the sources of the templates it includes, to version its output."""
+    if name not in TEMPLATES:
+        raise ValueError(f"Unknown template {name}, expected one of: {', '.join(TEMPLATES)}")
+    sources, pending = {}, [TEMPLATES[name]]
+    while pending:
+        filename = pending.pop(0)
+        if filename not in sources:
+            sources[filename], _, _ = environment().loader.get_source(environment(), filename)
+            referenced = jinja2.meta.find_referenced_templates(environment().parse(sources[filename]))
+            pending += [included for included in referenced if included]
+    return "\0".join(sources.values())
+
+
+def render(name: str, **params) -> str:
+    """Render a template of TEMPLATES."""
+    return get_template(name).render(**params)
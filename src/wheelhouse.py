@@ -0,0 +1,154 @@
+"""
+Local wheelhouse of the requirements of an application, installed offline during the build.
+
+When the dependency layer misses the build cache, `pip install -r requirements.txt` downloads, and
+often compiles, the same packages again on every runner. With DeployConfig.wheelhouse set, the wheels
+are resolved once on the host into a content-addressed directory keyed by requirements.txt and the
+target platform:
+
+- `pip download --only-binary=:all:` fetches the wheels of the target platform and Python version;
+- when a requirement has no wheel for the target, the wheels are built by `pip wheel` in a container
+  of the base image instead, so compiled extensions match the Lambda runtime.
+
+The wheelhouse is handed to BuildKit as a named build context (`--build-context wheelhouse=...`) and
+the generated Dockerfile installs from it with `--no-index` through a bind mount, with the pip cache
+kept in a cache mount, so the wheels never end up in the image or in the streamed application context.
+"""
+import os
+import re
+import sys
+import shutil
+import hashlib
+import tempfile
+import subprocess
+from typing import List, Optional
+
+from config import DeployConfig
+from _logging.pg_logger import get_logger
+from src.gen_dockerfile import WHEELHOUSE_CONTEXT, resolve_base_image
+
+# Configure the logger
+logger = get_logger(
+    name="wheelhouse",
+    log_level=os.environ.get("LOG_LEVEL", "INFO"),
+    log_to_console=True,
+    log_to_file=True,
+    log_file_path=os.environ.get("LOG_FILE_PATH", "/tmp/ecr_deployment.log")
+)
+
+# Written last into a wheelhouse, a directory without it is an interrupted download
+COMPLETE_MARKER = ".complete"
+
+DEFAULT_PYTHON_VERSION = "3.11"
+
+
+def wheelhouse_root() -> str:
+    """Directory holding the wheelhouses (WHEELHOUSE_DIR, defaults to ~/.cache/aws_ecr_deploy/wheelhouse)."""
+    return os.environ.get("WHEELHOUSE_DIR",
+                          os.path.join(os.path.expanduser("~"), ".cache", "aws_ecr_deploy", "wheelhouse"))
+
+
+def python_version(base_image: str) -> str:
+    """Python version of a Lambda base image (public.ecr.aws/lambda/python:3.12 -> 3.12)."""
+    match = re.search(r"python:?(\d+\.\d+)", base_image or "")
+    return match.group(1) if match else DEFAULT_PYTHON_VERSION
+
+
+def docker_platform(platform: str) -> str:
+    """Docker platform of a pip platform tag (manylinux2014_aarch64 -> linux/arm64)."""
+    return "linux/arm64" if "aarch64" in platform else "linux/amd64"
+
+
+def requirements_key(requirements: bytes, platform: str, version: str) -> str:
+    """
+    Key of the wheelhouse of a requirements file for a platform and Python version.
+
+    Comments, blank lines and surrounding whitespace do not change the key.
+    """
+    lines = [line.split(" #", 1)[0].strip() for line in requirements.decode("utf-8").splitlines()]
+    normalized = "\n".join(line for line in lines if line and not line.startswith("#"))
+    return hashlib.sha256(f"{platform}|{version}|{normalized}".encode("utf-8")).hexdigest()[:32]
+
+
+def _download_command(requirements_path: str, dest: str, platform: str, version: str) -> List[str]:
+    return [sys.executable, "-m", "pip", "download", "--disable-pip-version-check", "--quiet",
+            "--only-binary=:all:", "--platform", platform, "--python-version", version,
+            "--implementation", "cp", "--dest", dest, "-r", requirements_path]
+
+
+def _wheel_command(requirements_path: str, dest: str, platform: str, base_image: str) -> List[str]:
+    requirements_dir, requirements_name = os.path.split(os.path.abspath(requirements_path))
+    return ["docker", "run", "--rm", "--platform", docker_platform(platform), "--entrypoint", "pip",
+            "-v", f"{requirements_dir}:/requirements:ro", "-v", f"{os.path.abspath(dest)}:/wheelhouse", base_image,
+            "wheel", "--disable-pip-version-check", "--quiet", "--wheel-dir", "/wheelhouse",
+            "-r", f"/requirements/{requirements_name}"]
+
+
+def _run(command: List[str]) -> bool:
+    logger.info(f"Running command: {' '.join(command)}")
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    if result.returncode:
+        logger.warning(f"Command exited with code {result.returncode}:\n{result.stdout.strip()}")
+    return result.returncode == 0
+
+
+def ensure_wheelhouse(config: DeployConfig, requirements_path: Optional[str] = None) -> Optional[str]:
+    """
+    The wheelhouse of the requirements of an application, downloaded or built when not there yet.
+
+    Args:
+        config: deployment configuration, the target is wheelhouse_platform and the Python version
+                of docker_base_image
+        requirements_path: requirements file, requirements.txt of the application when not given
+
+    Returns:
+        Optional[str]: the wheelhouse directory, None when the wheels could not be fetched nor built
+    """
+    requirements_path = requirements_path or str(config.app_root / "requirements.txt")
+    base_image = resolve_base_image(config.docker_base_image)
+    version = python_version(base_image)
+    try:
+        with open(requirements_path, "rb") as file:
+            key = requirements_key(file.read(), config.wheelhouse_platform, version)
+    except OSError as e:
+        logger.error(f"Could not read {requirements_path}: {e}")
+        return None
+
+    wheelhouse = os.path.join(wheelhouse_root(), key)
+    if os.path.isfile(os.path.join(wheelhouse, COMPLETE_MARKER)):
+        logger.info(f"Using wheelhouse {wheelhouse}")
+        return wheelhouse
+
+    # Filled in a temporary directory and renamed, so concurrent deployments never see a partial wheelhouse
+    os.makedirs(wheelhouse_root(), exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f"{key}.", suffix=".tmp", dir=wheelhouse_root())
+    try:
+        logger.info(f"Fetching wheels of {requirements_path} for {config.wheelhouse_platform}, Python {version}")
+        if not _run(_download_command(requirements_path, staging, config.wheelhouse_platform, version)):
+            logger.info(f"Not every requirement has a wheel for {config.wheelhouse_platform}, "
+                        f"building the wheels in {base_image}")
+            for name in os.listdir(staging):
+                os.unlink(os.path.join(staging, name))
+            if not _run(_wheel_command(requirements_path, staging, config.wheelhouse_platform, base_image)):
+                logger.error(f"Could not fetch nor build the wheels of {requirements_path}")
+                return None
+
+        open(os.path.join(staging, COMPLETE_MARKER), "w").close()
+        try:
+            os.replace(staging, wheelhouse)
+        except OSError:
+            # Another deployment completed the same wheelhouse first
+            if not os.path.isfile(os.path.join(wheelhouse, COMPLETE_MARKER)):
+                raise
+        logger.info(f"Wheelhouse ready: {wheelhouse}")
+        return wheelhouse
+    except OSError as e:
+        logger.error(f"Could not create the wheelhouse {wheelhouse}: {e}")
+        return None
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def build_contexts(wheelhouse: str) -> dict:
+    """Named build contexts of a build installing from wheelhouse, for build_cache.buildx_command."""
+    return {WHEELHOUSE_CONTEXT: wheelhouse}
@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+import pytest
+
+"""
+moto intercepts every AWS call, but botocore still resolves credentials before signing a request.
+Point it at a throwaway profile so the tests never touch (or depend on) the developer's ~/.aws.
+"""
+
+_aws_dir = tempfile.mkdtemp(prefix="aws_ecr_deploy_tests_")
+_credentials_file = os.path.join(_aws_dir, "credentials")
+with open(_credentials_file, "w") as file:
+    file.write("[moto]\naws_access_key_id = testing\naws_secret_access_key = testing\n")
+
+os.environ["AWS_SHARED_CREDENTIALS_FILE"] = _credentials_file
+os.environ["AWS_CONFIG_FILE"] = os.path.join(_aws_dir, "config")
+os.environ["AWS_PROFILE"] = "moto"
+os.environ["AWS_REGION"] = "us-east-1"
+os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+os.environ["AWS_ACCOUNT_ID"] = "123456789012"
+os.environ["HASH_CACHE_DIR"] = os.path.join(_aws_dir, "hash_cache")
+os.environ["TEMPLATE_CACHE_DIR"] = os.path.join(_aws_dir, "jinja")
+
+
+@pytest.fixture(autouse=True)
+def _fresh_aws_clients():
+    """Shared clients must not leak moto state or registered event handlers from one test to the next."""
+    from src import aws_clients
+    aws_clients.clear_cache()
+    yield
+    aws_clients.clear_cache()
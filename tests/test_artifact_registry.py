@@ -0,0 +1,25 @@
+from _artifact import _artifact_registry as _artifact_registry_
+
+
+def test_packaged_templates_exclude_code():
+    templates = _artifact_registry_.packaged_templates()
+
+    assert {"Dockerfile", "Dockerfile_aws_linux_2"} <= set(templates)
+    assert not any(name.endswith(".py") for name in templates)
+    assert _artifact_registry_.load_template("Dockerfile").startswith("FROM ")
+
+
+def test_user_directory_is_indexed_once(tmp_path, monkeypatch):
+    (tmp_path / "nested").mkdir()
+    (tmp_path / "nested" / "Dockerfile_custom").write_text("FROM custom\n")
+    _artifact_registry_.clear_index_cache()
+    monkeypatch.setenv("ARTIFACT_TEMPLATE_PATH", str(tmp_path))
+
+    assert _artifact_registry_.load_template("Dockerfile_custom") == "FROM custom\n"
+
+    # Templates added after the first lookup are only seen once the index is cleared
+    (tmp_path / "Dockerfile_later").write_text("FROM later\n")
+    assert _artifact_registry_.load_template("Dockerfile_later") is None
+    _artifact_registry_.clear_index_cache()
+    assert _artifact_registry_.load_template("Dockerfile_later") == "FROM later\n"
+    assert _artifact_registry_.load_template("Dockerfile_missing") is None
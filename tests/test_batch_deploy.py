@@ -0,0 +1,86 @@
+import time
+import threading
+
+from config import DeployConfig
+from src import batch_deploy
+
+CONFIG = DeployConfig.from_env()
+
+
+def test_load_manifest(tmp_path):
+    manifest = tmp_path / "deploy.yaml"
+    manifest.write_text("apps:\n"
+                        "  - services/Orders\n"
+                        "  - app_location: services/billing\n"
+                        "    ecr_repository_name: billing-lambda\n")
+
+    apps = batch_deploy.load_manifest(str(manifest), CONFIG)
+
+    assert [(app.app_location, app.ecr_repository_name) for app in apps] == [
+        (str(tmp_path / "services" / "Orders"), "orders"),
+        (str(tmp_path / "services" / "billing"), "billing-lambda"),
+    ]
+    assert all(app.aws_region == CONFIG.aws_region for app in apps)
+    assert batch_deploy.invalid_repository_names(apps) == []
+
+    invalid = [batch_deploy.app_config(CONFIG, str(tmp_path / name)) for name in ("My App", "x", "_build")]
+    assert len(batch_deploy.invalid_repository_names(invalid)) == 3
+
+
+def test_run_batch_bounds_builds_and_pushes(monkeypatch):
+    lock = threading.Lock()
+    running = {"build": 0, "push": 0}
+    peak = {"build": 0, "push": 0}
+
+    def occupy(stage):
+        with lock:
+            running[stage] += 1
+            peak[stage] = max(peak[stage], running[stage])
+        time.sleep(0.02)
+        with lock:
+            running[stage] -= 1
+
+    def fake_run(config, force_build, build_slot, push_slot, timings):
+        with build_slot:
+            occupy("build")
+        with push_slot:
+            occupy("push")
+        return not config.app_location.endswith("broken")
+
+    monkeypatch.setattr(batch_deploy.deploy_to_ecr, "login_to_ecr", lambda config: True)
+    monkeypatch.setattr(batch_deploy.deploy_to_ecr, "run", fake_run)
+    apps = [batch_deploy.app_config(CONFIG, f"apps/app{i}") for i in range(8)]
+    apps.append(batch_deploy.app_config(CONFIG, "apps/broken"))
+
+    results = batch_deploy.run_batch(apps, max_parallel_builds=2, max_parallel_pushes=3)
+
+    assert [result.ecr_repository_name for result in results] == [app.ecr_repository_name for app in apps]
+    assert [result.success for result in results] == [True] * 8 + [False]
+    assert peak["build"] <= 2
+    assert peak["push"] <= 3
+    assert "FAILED" in batch_deploy.format_results(results)
+
+
+def test_run_batch_reports_a_failed_row_per_broken_app(tmp_path, monkeypatch):
+    for name in ("linked", "exits"):
+        app = tmp_path / name
+        app.mkdir()
+        (app / "main.py").write_text("def main(name):\n    return name\n")
+        (app / "requirements.txt").write_text("")
+    (tmp_path / "linked" / "data.csv").symlink_to(tmp_path / "missing.csv")
+
+    def reuse_existing_build(config, fingerprint):
+        if config.app_location.endswith("exits"):
+            raise SystemExit(99)
+        return True
+
+    monkeypatch.setattr(batch_deploy.deploy_to_ecr, "login_to_ecr", lambda config: True)
+    monkeypatch.setattr(batch_deploy.deploy_to_ecr, "create_ecr_repository", lambda config: True)
+    monkeypatch.setattr(batch_deploy.deploy_to_ecr, "reuse_existing_build", reuse_existing_build)
+    apps = [batch_deploy.app_config(CONFIG, str(tmp_path / name)) for name in ("linked", "missing", "exits")]
+
+    results = batch_deploy.run_batch(apps)
+
+    assert [result.success for result in results] == [True, False, False]
+    assert results[2].error == "exited with code 99"
+    assert "exits" in batch_deploy.format_results(results)
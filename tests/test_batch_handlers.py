@@ -0,0 +1,30 @@
+from src import batch_handlers
+
+MAIN = "def main(name):\n    return name\n"
+
+
+def test_generate_handlers_reports_each_app(tmp_path):
+    for app in ("orders", "billing", "services/search"):
+        (tmp_path / app).mkdir(parents=True)
+        (tmp_path / app / "main.py").write_text(MAIN)
+    (tmp_path / "orders" / "pkg").mkdir()
+    (tmp_path / "orders" / "pkg" / "main.py").write_text(MAIN)
+    (tmp_path / ".venv" / "tool").mkdir(parents=True)
+    (tmp_path / ".venv" / "tool" / "main.py").write_text(MAIN)
+    (tmp_path / "broken").mkdir()
+    (tmp_path / "broken" / "main.py").write_text("def main(:\n")
+
+    assert batch_handlers.discover_apps(str(tmp_path)) == [
+        str(tmp_path / app) for app in ("billing", "broken", "orders", "services/search")]
+
+    report = batch_handlers.generate_handlers(str(tmp_path), max_workers=2)
+
+    assert [result.app_dir for result in report.generated] == [
+        str(tmp_path / app) for app in ("billing", "orders", "services/search")]
+    assert [result.app_dir for result in report.failed] == [str(tmp_path / "broken")]
+    assert "Could not analyze" in report.failed[0].detail
+    assert not (tmp_path / "orders" / "pkg" / "lambda_function.py").exists()
+
+    again = batch_handlers.generate_handlers(str(tmp_path), max_workers=1)
+    assert len(again.unchanged) == 3 and not again.generated
+    assert "3 unchanged, 1 failed" in again.summary()
@@ -0,0 +1,51 @@
+import boto3
+from moto import mock_aws
+
+from config import DeployConfig
+from src import build_cache
+from src.docker_stream import BuildReport, BuildStep
+
+CONFIG = DeployConfig.from_env(ecr_repository_name="test-repo")
+CACHE_REF = "123456789012.dkr.ecr.us-east-1.amazonaws.com/test-repo:buildcache"
+
+
+def test_buildx_command_per_cache_mode():
+    inline = build_cache.buildx_command(CONFIG.replace(build_cache="inline"), "/app", "/app/Dockerfile")
+    registry = build_cache.buildx_command(CONFIG.replace(build_cache="registry"), "/app", "/app/Dockerfile")
+
+    assert inline[:3] == ["docker", "buildx", "build"]
+    assert inline[-1] == "/app"
+    assert f"type=registry,ref={CACHE_REF}" in inline
+    assert inline[inline.index("--cache-to") + 1] == "type=inline"
+    assert registry[registry.index("--cache-to") + 1].startswith(f"type=registry,ref={CACHE_REF},mode=max")
+    assert build_cache.pushes_cache_tag(CONFIG.replace(build_cache="inline"))
+    assert not build_cache.pushes_cache_tag(CONFIG.replace(build_cache="registry"))
+
+
+@mock_aws
+def test_record_time_saved_uses_durations_of_previous_builds():
+    client = boto3.client("ecr", region_name="us-east-1")
+    client.create_repository(repositoryName="test-repo")
+    config = CONFIG.replace(build_cache="registry")
+
+    cold = BuildReport(steps=[BuildStep(1, "RUN pip install -r requirements.txt", 0, duration=40.0),
+                              BuildStep(2, "COPY . .", 0, duration=1.0)])
+    assert build_cache.record_time_saved(config, cold) is None
+
+    warm = BuildReport(steps=[BuildStep(1, "RUN pip install -r requirements.txt", 0, cached=True),
+                              BuildStep(2, "COPY . .", 0, duration=1.2)])
+    assert build_cache.record_time_saved(config, warm) == 40.0
+    assert "40.0s saved" in warm.summary()
+    # The history lives in the repository, next to the cache, not on the runner
+    assert build_cache.load_step_history(client, config) == {"RUN pip install -r requirements.txt": 40.0,
+                                                             "COPY . .": 1.2}
+
+
+def test_buildx_command_without_cache_passes_build_contexts():
+    command = build_cache.buildx_command(CONFIG.replace(wheelhouse=True), "-", "Dockerfile",
+                                         build_contexts={"wheelhouse": "/cache/wheelhouse/abc"})
+
+    assert "--cache-from" not in command and "--cache-to" not in command
+    assert command[command.index("--build-context") + 1] == "wheelhouse=/cache/wheelhouse/abc"
+    assert build_cache.needs_buildx(CONFIG.replace(wheelhouse=True))
+    assert not build_cache.needs_buildx(CONFIG.replace(build_cache="inline"))
@@ -0,0 +1,81 @@
+import gzip
+import io
+import tarfile
+
+from src import build_context
+
+
+def _write_app(root):
+    for relpath in ("Dockerfile", "main.py", "lambda_function.py", "data/big.csv", "data/keep.csv",
+                    "tests/test_main.py", ".git/HEAD", ".venv/bin/python", "pkg/__pycache__/x.pyc",
+                    "docs/notes/readme.md"):
+        path = root / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(relpath)
+    (root / ".dockerignore").write_text("# comment\nDockerfile\ndata\n!data/keep.csv\n**/*.md\n/tests\n")
+
+
+def test_dockerignore_rules():
+    dockerignore = build_context.DockerIgnore(["*.log", "build/", "!build/keep", "**/tmp", "/secrets?.txt"])
+
+    assert dockerignore.excluded("app.log")
+    assert not dockerignore.excluded("logs/app.log")
+    assert dockerignore.excluded("build/out.bin")
+    assert not dockerignore.excluded("build/keep")
+    assert dockerignore.excluded("a/b/tmp/file")
+    assert dockerignore.excluded("secrets1.txt")
+    assert not dockerignore.excluded("main.py")
+
+
+def test_context_applies_dockerignore_and_python_defaults(tmp_path):
+    _write_app(tmp_path)
+
+    context = build_context.context_manifest(str(tmp_path))
+
+    assert [entry.relpath for entry in context.files] == [
+        ".dockerignore", "Dockerfile", "lambda_function.py", "main.py", "data/keep.csv"]
+    assert build_context.report_context(context, warn_bytes=0) == build_context.context_size(context)
+
+
+def test_stream_is_deterministic_tar(tmp_path):
+    _write_app(tmp_path)
+    context = build_context.context_manifest(str(tmp_path))
+
+    plain = b"".join(build_context.stream_context(context))
+    compressed = b"".join(build_context.stream_context(context, gzip=True))
+
+    assert plain == b"".join(build_context.stream_context(context))
+    assert gzip.decompress(compressed) == plain
+    assert compressed == b"".join(build_context.stream_context(context, gzip=True))
+    with tarfile.open(fileobj=io.BytesIO(plain)) as tar:
+        members = tar.getmembers()
+        assert [member.name for member in members] == [entry.relpath for entry in context.files]
+        assert {(member.mtime, member.uid, member.uname) for member in members} == {(0, 0, "")}
+        assert tar.extractfile("main.py").read() == b"main.py"
+
+
+def test_stream_does_not_buffer_whole_files(tmp_path):
+    (tmp_path / "model.bin").write_bytes(b"\x01" * (5 * build_context._CHUNK_SIZE + 3))
+    context = build_context.context_manifest(str(tmp_path))
+
+    chunks = list(build_context.stream_context(context))
+
+    assert len(chunks) > 4
+    assert max(len(chunk) for chunk in chunks) < 2 * build_context._CHUNK_SIZE
+    with tarfile.open(fileobj=io.BytesIO(b"".join(chunks))) as tar:
+        assert tar.extractfile("model.bin").read() == b"\x01" * (5 * build_context._CHUNK_SIZE + 3)
+
+
+def test_symlinks_are_sent_as_symlinks(tmp_path):
+    (tmp_path / "config.json").write_text("{}")
+    (tmp_path / "current.json").symlink_to("config.json")
+    (tmp_path / "dangling.json").symlink_to("missing.json")
+    context = build_context.context_manifest(str(tmp_path))
+
+    plain = b"".join(build_context.stream_context(context))
+
+    assert len(plain) >= build_context.context_size(context)
+    with tarfile.open(fileobj=io.BytesIO(plain)) as tar:
+        links = {member.name: member.linkname for member in tar.getmembers() if member.issym()}
+        assert links == {"current.json": "config.json", "dangling.json": "missing.json"}
+        assert tar.getmember("config.json").isfile()
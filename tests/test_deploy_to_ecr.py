@@ -18,7 +18,7 @@
 #     mock_ecr_client.create_repository.return_value = {}
 #
 #     from lambda_docker.aws_deployment.src.deploy_to_ecr import create_ecr_repository
-#     result = create_ecr_repository()
+#     result = create_ecr_repository(CONFIG)
 #
 #     assert result is True
 #     mock_ecr_client.create_repository.assert_called_once()
@@ -33,7 +33,7 @@
 #     mock_ecr_client.describe_repositories.return_value = {}
 #
 #     from lambda_docker.aws_deployment.src.deploy_to_ecr import create_ecr_repository
-#     result = create_ecr_repository(fail_if_exists=True)
+#     result = create_ecr_repository(CONFIG, fail_if_exists=True)
 #
 #     assert result is False
 #     mock_logger.error.assert_called_with(f"ECR repository {ECR_REPOSITORY_NAME} already exists. Failing as requested.")
@@ -50,7 +50,7 @@
 #     mock_ecr_client.create_repository.return_value = {}
 #
 #     from lambda_docker.aws_deployment.src.deploy_to_ecr import create_ecr_repository
-#     result = create_ecr_repository()
+#     result = create_ecr_repository(CONFIG)
 #
 #     assert result is True
 #     mock_ecr_client.delete_repository.assert_called_once_with(repositoryName=ECR_REPOSITORY_NAME, force=True)
@@ -67,7 +67,7 @@
 #     mock_ecr_client.create_repository.side_effect = Exception("Some error")
 #
 #     from lambda_docker.aws_deployment.src.deploy_to_ecr import create_ecr_repository
-#     result = create_ecr_repository()
+#     result = create_ecr_repository(CONFIG)
 #
 #     assert result is False
 #     mock_error_logger.assert_called()
@@ -76,9 +76,37 @@
 
 import pytest
 import os
+import hashlib
 from moto import mock_aws
 import boto3
-from src.deploy_to_ecr import create_ecr_repository, ECR_REPOSITORY_NAME
+from config import DeployConfig
+from src import deploy_to_ecr
+from src.deploy_to_ecr import create_ecr_repository
+from _util import _util_file as _util_file_
+from _util import _util_hash as _util_hash_
+from src.aws_clients import get_client
+
+CONFIG = DeployConfig.from_env(ecr_repository_name="test-repo")
+ECR_REPOSITORY_NAME = CONFIG.ecr_repository_name
+
+
+def _push_layers(ecr_client, layers: list) -> int:
+    """Push layer blobs the way docker push does and return the number of bytes uploaded."""
+    digests = [f"sha256:{hashlib.sha256(layer).hexdigest()}" for layer in layers]
+    available = {layer["layerDigest"] for layer in ecr_client.batch_check_layer_availability(
+        repositoryName=ECR_REPOSITORY_NAME, layerDigests=digests)["layers"]}
+
+    uploaded = 0
+    for layer, digest in zip(layers, digests):
+        if digest in available:
+            continue
+        upload_id = ecr_client.initiate_layer_upload(repositoryName=ECR_REPOSITORY_NAME)["uploadId"]
+        ecr_client.upload_layer_part(repositoryName=ECR_REPOSITORY_NAME, uploadId=upload_id,
+                                     partFirstByte=0, partLastByte=len(layer) - 1, layerPartBlob=layer)
+        ecr_client.complete_layer_upload(repositoryName=ECR_REPOSITORY_NAME, uploadId=upload_id,
+                                         layerDigests=[digest])
+        uploaded += len(layer)
+    return uploaded
 
 
 
@@ -86,7 +114,7 @@ from src.deploy_to_ecr import create_ecr_repository, ECR_REPOSITORY_NAME
 def test_create_repository_when_not_exists():
     client = boto3.client("ecr", region_name="us-east-1")
 
-    result = create_ecr_repository()
+    result = create_ecr_repository(CONFIG)
 
     assert result is True
     response = client.describe_repositories(repositoryNames=[ECR_REPOSITORY_NAME])
@@ -98,21 +126,37 @@ def test_fail_if_repository_exists():
     client = boto3.client("ecr", region_name="us-east-1")
     client.create_repository(repositoryName=ECR_REPOSITORY_NAME)
 
-    result = create_ecr_repository(fail_if_exists=True)
+    result = create_ecr_repository(CONFIG, fail_if_exists=True)
 
     assert result is False
 
 
 @mock_aws
-def test_delete_and_create_repository_if_exists():
+def test_reuse_repository_if_exists():
     client = boto3.client("ecr", region_name="us-east-1")
-    client.create_repository(repositoryName=ECR_REPOSITORY_NAME)
+    client.create_repository(repositoryName=ECR_REPOSITORY_NAME,
+                             imageScanningConfiguration={"scanOnPush": False})
+    _push_layers(client, [b"base-layer"])
 
-    result = create_ecr_repository()
+    result = create_ecr_repository(CONFIG)
 
     assert result is True
     response = client.describe_repositories(repositoryNames=[ECR_REPOSITORY_NAME])
     assert response["repositories"][0]["repositoryName"] == ECR_REPOSITORY_NAME
+    assert response["repositories"][0]["imageScanningConfiguration"]["scanOnPush"] is True
+    assert _push_layers(client, [b"base-layer"]) == 0
+
+
+@mock_aws
+def test_delete_and_create_repository_if_recreate():
+    client = boto3.client("ecr", region_name="us-east-1")
+    client.create_repository(repositoryName=ECR_REPOSITORY_NAME)
+    _push_layers(client, [b"base-layer"])
+
+    result = create_ecr_repository(CONFIG, recreate=True)
+
+    assert result is True
+    assert _push_layers(client, [b"base-layer"]) == len(b"base-layer")
 
 
 @mock_aws
@@ -121,7 +165,7 @@ def test_handle_exception():
         client = boto3.client("ecr", region_name="us-east-1")
         client.create_repository(repositoryName=ECR_REPOSITORY_NAME)
 
-        result = create_ecr_repository()
+        result = create_ecr_repository(CONFIG)
         assert result is False
         
 @mock_aws
@@ -135,7 +179,7 @@ def test_create_repository_with_custom_name():
     # Set the custom repository name in environment
     os.environ["ECR_REPOSITORY_NAME"] = custom_name
     
-    result = create_ecr_repository()
+    result = create_ecr_repository(DeployConfig.from_env())
     
     assert result is True
     response = client.describe_repositories(repositoryNames=[custom_name])
@@ -143,3 +187,115 @@ def test_create_repository_with_custom_name():
     
     # Reset environment variable
     os.environ["ECR_REPOSITORY_NAME"] = original_name
+
+
+@mock_aws
+def test_back_to_back_deploys_only_push_missing_layers():
+    api_calls = []
+
+    # Every stage goes through the shared client, so its events see all the calls of a deploy
+    shared_client = get_client("ecr", **CONFIG.get_boto3_session_args())
+    shared_client.meta.events.register("before-call.ecr.*", lambda model, **_: api_calls.append(model.name))
+    client = boto3.client("ecr", region_name="us-east-1")
+    base_layer, app_layer_v1, app_layer_v2 = b"b" * 4096, b"app v1", b"app v2"
+
+    assert create_ecr_repository(CONFIG) is True
+    first_push = _push_layers(client, [base_layer, app_layer_v1])
+    first_calls = list(api_calls)
+
+    assert create_ecr_repository(CONFIG) is True
+    second_push = _push_layers(client, [base_layer, app_layer_v2])
+
+    assert first_calls == ["DescribeRepositories", "CreateRepository"]
+    assert api_calls[len(first_calls):] == ["DescribeRepositories"]
+    assert first_push == len(base_layer) + len(app_layer_v1)
+    assert second_push == len(app_layer_v2)
+
+
+@mock_aws
+def test_reuse_existing_build_retags_fingerprint_image(tmp_path):
+    from src.deploy_to_ecr import reuse_existing_build
+    from src.ecr_registry import fingerprint_tag
+    from _util import _util_hash
+
+    (tmp_path / "lambda_function.py").write_text("def lambda_handler(event, context):\n    return {}\n")
+    fingerprint = _util_hash.tree_digest(str(tmp_path), use_cache=False).digest
+    client = boto3.client("ecr", region_name="us-east-1")
+    client.create_repository(repositoryName=ECR_REPOSITORY_NAME)
+
+    assert reuse_existing_build(CONFIG, fingerprint) is False
+
+    manifest = '{"schemaVersion": 2, "mediaType": "application/vnd.docker.distribution.manifest.v2+json"}'
+    client.put_image(repositoryName=ECR_REPOSITORY_NAME, imageManifest=manifest,
+                     imageTag=fingerprint_tag(fingerprint))
+
+    assert reuse_existing_build(CONFIG, fingerprint) is True
+    tags = client.describe_images(repositoryName=ECR_REPOSITORY_NAME)["imageDetails"][0]["imageTags"]
+    assert set(tags) == {fingerprint_tag(fingerprint), CONFIG.ecr_image_tag}
+
+    (tmp_path / "lambda_function.py").write_text("def lambda_handler(event, context):\n    return None\n")
+    assert _util_hash.tree_digest(str(tmp_path), use_cache=False).digest != fingerprint
+
+
+def test_deploy_config_is_resolved_per_deployment(tmp_path):
+    env_file = tmp_path / ".env"
+    env_file.write_text("ECR_REPOSITORY_NAME=from-env-file\nECR_IMAGE_TAG=v1\n")
+
+    config = DeployConfig.from_env(env_file=str(env_file), environ={"ECR_IMAGE_TAG": "v2"})
+    other = config.replace(ecr_repository_name="other-repo", app_location=None)
+
+    assert config.ecr_repository_name == "from-env-file"
+    assert config.ecr_image_tag == "v2"
+    assert other.ecr_repository_name == "other-repo"
+    assert config.ecr_repository_name == "from-env-file"
+    assert os.environ.get("ECR_REPOSITORY_NAME") != "from-env-file"
+
+
+def test_shared_client_is_reused_per_service_region_and_profile():
+    client = get_client("ecr", region_name="us-east-1", profile_name="moto")
+
+    assert get_client("ecr", region_name="us-east-1", profile_name="moto") is client
+    assert get_client("ecr", region_name="us-west-2", profile_name="moto") is not client
+    assert client.meta.config.max_pool_connections >= 10
+    assert client.meta.config.retries["mode"] == "adaptive"
+
+
+def test_check_artifact_generates_missing_files_into_the_manifest(tmp_path):
+    (tmp_path / "requirements.txt").write_text("requests\n")
+    (tmp_path / "lambda_function.py").write_text("def lambda_handler(event, context):\n    return {}\n")
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "Dockerfile").write_text("FROM nested\n")
+    manifest = _util_file_.scan_directory(str(tmp_path), targets=deploy_to_ecr.ARTIFACT_FILES)
+
+    assert manifest.find("Dockerfile") == str(tmp_path / "pkg" / "Dockerfile")
+    assert manifest.find("Dockerfile", max_depth=0) is None
+    assert deploy_to_ecr.check_artifact(str(tmp_path), manifest=manifest)
+    assert manifest.find("Dockerfile", max_depth=0) == str(tmp_path / "Dockerfile")
+    assert _util_hash_.tree_digest(str(tmp_path), manifest=manifest, use_cache=False).digest == \
+        _util_hash_.tree_digest(str(tmp_path), use_cache=False).digest
+
+
+def test_check_artifact_fails_when_the_dockerfile_cannot_be_generated(tmp_path, monkeypatch):
+    from src import gen_dockerfile
+
+    (tmp_path / "requirements.txt").write_text("requests\n")
+    (tmp_path / "main.py").write_text("def main(name):\n    return name\n")
+    monkeypatch.setattr(gen_dockerfile, "generate_dockerfile", lambda *args, **kwargs: False)
+
+    assert not deploy_to_ecr.check_artifact(str(tmp_path))
+    assert not (tmp_path / "lambda_function.py").exists()
+
+
+def test_response_closer_closes_the_streamed_build_response():
+    import io
+    import requests
+    from requests.hooks import dispatch_hook
+
+    session = requests.Session()
+    close = deploy_to_ecr.response_closer(session)
+    response = requests.Response()
+    response.raw = io.BytesIO(b'{"stream": "Step 1/3 : FROM python"}\n')
+    dispatch_hook("response", session.hooks, response)
+
+    close()
+    assert response.raw.closed
@@ -0,0 +1,17 @@
+import subprocess
+from config import DeployConfig
+from src import deploy_to_ecr_subprocess as sub
+
+
+def test_fingerprint_tag_is_not_pushed_when_the_push_failed(monkeypatch):
+    commands = []
+
+    def run_command_progress(command):
+        commands.append(command)
+        return subprocess.CompletedProcess(command, 1 if command.startswith("docker push") else 0)
+
+    monkeypatch.setattr(sub, "run_command_progress", run_command_progress)
+    config = DeployConfig(aws_account_id="123456789012", ecr_repository_name="app")
+
+    assert not sub.tag_and_push_image(config, extra_tags=["fp-abc"])
+    assert not any("fp-abc" in command for command in commands)
@@ -0,0 +1,126 @@
+from src.docker_stream import follow_build, follow_buildkit, follow_push
+
+
+def test_follow_build_times_steps_and_counts_cache_hits():
+    chunks = [
+        {"stream": "Step 1/3 : FROM public.ecr.aws/lambda/python:3.11\n"},
+        {"stream": " ---> 1b2c3d4e5f60\n"},
+        {"stream": "Step 2/3 : RUN pip install -r requirements.txt\n"},
+        {"stream": " ---> Using cache\n ---> 2b2c3d4e5f60\n"},
+        {"stream": "Step 3/3 : COPY . .\n"},
+        {"aux": {"ID": "sha256:abc"}},
+        {"stream": "Successfully built abc\n"},
+    ]
+    lines = []
+
+    report = follow_build(iter(chunks), on_line=lines.append)
+
+    assert report.success
+    assert report.image_id == "sha256:abc"
+    assert [step.number for step in report.steps] == [1, 2, 3]
+    assert [step.cached for step in report.steps] == [False, True, False]
+    assert report.cache_hits == 1
+    assert lines[0] == "Step 1/3 : FROM public.ecr.aws/lambda/python:3.11"
+
+
+def test_follow_build_cancels_on_first_error_and_bounds_output():
+    consumed = []
+    cancelled = []
+
+    def chunks():
+        for i in range(1000):
+            consumed.append(i)
+            yield {"stream": f"line {i}\n"}
+        consumed.append("error")
+        yield {"errorDetail": {"message": "pip failed"}, "error": "pip failed"}
+        consumed.append("after error")
+        yield {"stream": "never read\n"}
+
+    report = follow_build(chunks(), cancel=lambda: cancelled.append(True), on_line=lambda line: None,
+                          tail_lines=10)
+
+    assert not report.success
+    assert report.error == "pip failed"
+    assert cancelled == [True]
+    assert "after error" not in consumed
+    assert len(report.tail) == 10
+    assert report.tail[-1] == "pip failed"
+
+
+def test_follow_push_reports_uploaded_and_skipped_layers():
+    chunks = [
+        {"status": "The push refers to repository [123456789012.dkr.ecr.us-east-1.amazonaws.com/test-repo]"},
+        {"status": "Preparing", "progressDetail": {}, "id": "aaa"},
+        {"status": "Preparing", "progressDetail": {}, "id": "bbb"},
+        {"status": "Layer already exists", "progressDetail": {}, "id": "bbb"},
+        {"status": "Pushing", "progressDetail": {"current": 512, "total": 2048}, "id": "aaa"},
+        {"status": "Pushing", "progressDetail": {"current": 1536, "total": 2048}, "id": "aaa"},
+        {"status": "Pushed", "progressDetail": {}, "id": "aaa"},
+        {"status": "latest: digest: sha256:def size: 1234"},
+        {"progressDetail": {}, "aux": {"Tag": "latest", "Digest": "sha256:def", "Size": 1234}},
+    ]
+    lines = []
+
+    report = follow_push(iter(chunks), on_line=lines.append)
+
+    assert report.success
+    assert report.digest == "sha256:def"
+    assert report.skipped_layers == ["bbb"]
+    assert report.bytes_uploaded == 2048
+    assert lines.count("aaa: Pushing") == 1
+    assert "aaa: Pushed" in lines
+    assert "1 already in the registry" in report.summary()
+
+
+def test_follow_push_fails_on_error_in_stream():
+    chunks = [
+        {"status": "Preparing", "progressDetail": {}, "id": "aaa"},
+        {"errorDetail": {"message": "denied: not authorized"}, "error": "denied: not authorized"},
+        {"status": "Pushed", "progressDetail": {}, "id": "aaa"},
+    ]
+
+    report = follow_push(iter(chunks), on_line=lambda line: None)
+
+    assert not report.success
+    assert report.error == "denied: not authorized"
+    assert report.layers["aaa"].status == "Preparing"
+
+
+def test_follow_buildkit_reads_steps_cache_hits_and_durations():
+    lines = [
+        "#1 [internal] load build definition from Dockerfile",
+        "#1 DONE 0.0s",
+        "#4 importing cache manifest from 123456789012.dkr.ecr.us-east-1.amazonaws.com/test-repo:buildcache",
+        "#4 DONE 0.4s",
+        "#5 [1/3] FROM public.ecr.aws/lambda/python:3.11",
+        "#5 CACHED",
+        "#6 [builder 2/3] RUN pip install -r requirements.txt",
+        "#6 CACHED",
+        "#7 [3/3] COPY . .",
+        "#7 DONE 1.5s",
+    ]
+
+    report = follow_buildkit(iter(lines), on_line=lambda line: None)
+
+    assert report.success
+    assert [step.instruction for step in report.steps] == [
+        "FROM public.ecr.aws/lambda/python:3.11", "RUN pip install -r requirements.txt", "COPY . ."]
+    assert [step.cached for step in report.steps] == [True, True, False]
+    assert report.steps[2].duration == 1.5
+    assert round(report.cache_hit_ratio, 2) == 0.67
+
+
+def test_follow_buildkit_cancels_on_error():
+    cancelled = []
+    lines = [
+        "#6 [2/3] RUN pip install -r requirements.txt",
+        "#6 ERROR: process \"/bin/sh -c pip install -r requirements.txt\" did not complete successfully",
+        "#7 [3/3] COPY . .",
+    ]
+
+    report = follow_buildkit(iter(lines), cancel=lambda: cancelled.append(True), on_line=lambda line: None)
+
+    assert not report.success
+    assert report.error.startswith("process")
+    assert cancelled == [True]
+    assert len(report.steps) == 1
@@ -0,0 +1,75 @@
+import os
+import json
+import time
+import base64
+import stat
+import datetime
+
+from src import ecr_auth
+
+
+def _token(expires_in: float) -> dict:
+    return {"username": "AWS", "password": "secret", "registry": "123456789012.dkr.ecr.us-east-1.amazonaws.com",
+            "expires_at": time.time() + expires_in}
+
+
+def test_token_is_fetched_once_and_cached_privately(tmp_path, monkeypatch):
+    monkeypatch.setenv("ECR_TOKEN_CACHE_DIR", str(tmp_path))
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        return _token(12 * 60 * 60)
+
+    first = ecr_auth.get_authorization("123456789012", "us-east-1", "moto", fetch)
+    second = ecr_auth.get_authorization("123456789012", "us-east-1", "moto", fetch)
+
+    assert first == second
+    assert len(fetches) == 1
+    filepath = ecr_auth.cache_filepath("123456789012", "us-east-1", "moto")
+    assert stat.S_IMODE(os.stat(filepath).st_mode) == 0o600
+
+
+def test_token_is_refreshed_before_it_expires(tmp_path, monkeypatch):
+    monkeypatch.setenv("ECR_TOKEN_CACHE_DIR", str(tmp_path))
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        return _token(60)
+
+    ecr_auth.get_authorization("123456789012", "us-east-1", None, fetch, refresh_margin=300)
+    ecr_auth.get_authorization("123456789012", "us-east-1", None, fetch, refresh_margin=300)
+    ecr_auth.get_authorization("123456789012", "us-west-2", None, fetch, refresh_margin=0)
+
+    assert len(fetches) == 3
+
+
+def test_token_from_response():
+    expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=12)
+    response = {"authorizationData": [{
+        "authorizationToken": base64.b64encode(b"AWS:secret").decode("utf-8"),
+        "proxyEndpoint": "https://123456789012.dkr.ecr.us-east-1.amazonaws.com",
+        "expiresAt": expires_at,
+    }]}
+
+    token = ecr_auth.token_from_response(response)
+
+    assert token["username"] == "AWS"
+    assert token["password"] == "secret"
+    assert token["registry"] == "123456789012.dkr.ecr.us-east-1.amazonaws.com"
+    assert token["expires_at"] == expires_at.timestamp()
+
+
+def test_docker_login_is_current(tmp_path, monkeypatch):
+    monkeypatch.setenv("DOCKER_CONFIG", str(tmp_path))
+    token = _token(12 * 60 * 60)
+
+    assert ecr_auth.docker_login_is_current(token) is False
+
+    auth = base64.b64encode(b"AWS:secret").decode("utf-8")
+    (tmp_path / "config.json").write_text(json.dumps({"auths": {token["registry"]: {"auth": auth}}}))
+    assert ecr_auth.docker_login_is_current(token) is True
+
+    (tmp_path / "config.json").write_text(json.dumps({"credHelpers": {token["registry"]: "ecr-login"}}))
+    assert ecr_auth.docker_login_is_current(token) is True
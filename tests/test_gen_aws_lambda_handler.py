@@ -0,0 +1,274 @@
+import importlib.util
+import json
+import os
+import runpy
+import sys
+
+import pytest
+
+from src.gen_aws_lambda_handler import HandlerOptions, ResponseCache, generate_lambda_handler
+from src.main_analyzer import KEYWORD_ONLY, analyze_main_source
+
+HEAVY_MAIN = '''
+import numpy_that_is_not_installed as np
+from collections import OrderedDict
+import os.path
+
+raise RuntimeError("main.py must not be executed")
+
+
+def main(role_arn: str, region: str = "us-east-1", *, retries: int = 3):
+    """List the buckets."""
+    from _task import _task
+    import json as j
+    return _task.list_s3_buckets(role_arn=role_arn, region=region, retries=retries, path=os.path.sep)
+'''
+
+
+def test_analyzer_reads_main_without_importing_it():
+    main = analyze_main_source(HEAVY_MAIN)
+
+    assert [(p.name, p.default, p.annotation) for p in main.parameters] == [
+        ("role_arn", None, "str"), ("region", "'us-east-1'", "str"), ("retries", "3", "int")]
+    assert main.parameters[2].kind == KEYWORD_ONLY
+    assert main.imports == ["from _task import _task", "import json as j", "import os.path"]
+    assert main.return_expression.startswith("_task.list_s3_buckets(role_arn=role_arn")
+    assert main.inlinable
+
+
+def test_single_return_is_inlined_with_defaults(tmp_path):
+    (tmp_path / "main.py").write_text(HEAVY_MAIN)
+
+    assert generate_lambda_handler(str(tmp_path))
+    handler = (tmp_path / "lambda_function.py").read_text()
+    compile(handler, "lambda_function.py", "exec")
+    assert "from _task import _task" in handler and "numpy" not in handler
+    assert "region = query_params.get('region', 'us-east-1')" in handler
+    assert "if role_arn is None:" in handler
+
+
+def test_main_with_logic_is_called_with_the_given_parameters(tmp_path, monkeypatch):
+    (tmp_path / "main.py").write_text(
+        "def main(name, greeting='hello'):\n"
+        "    if not name:\n"
+        "        return None\n"
+        "    return f'{greeting} {name}'\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "main", raising=False)
+
+    assert generate_lambda_handler(str(tmp_path))
+    handler = runpy.run_path(str(tmp_path / "lambda_function.py"))["lambda_handler"]
+
+    assert json.loads(handler({"queryStringParameters": {"name": "x"}}, None)["body"]) == "hello x"
+    assert json.loads(handler({"queryStringParameters": {"name": "x", "greeting": "hi"}}, None)["body"]) == "hi x"
+    assert handler({"queryStringParameters": {"greeting": "hi"}}, None)["statusCode"] == 404
+
+
+def test_return_reading_names_of_main_py_calls_main(tmp_path, monkeypatch):
+    (tmp_path / "main.py").write_text(
+        "import json\n"
+        "SUFFIX = '!'\n\n\n"
+        "def helper(name):\n"
+        "    return name.upper()\n\n\n"
+        "def main(name):\n"
+        "    return json.dumps([helper(name) + SUFFIX for _ in range(1)])\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "main", raising=False)
+
+    assert not analyze_main_source((tmp_path / "main.py").read_text()).inlinable
+    assert generate_lambda_handler(str(tmp_path))
+    assert "from main import main" in (tmp_path / "lambda_function.py").read_text()
+    handler = runpy.run_path(str(tmp_path / "lambda_function.py"))["lambda_handler"]
+    assert json.loads(handler({"queryStringParameters": {"name": "x"}}, None)["body"]) == '["X!"]'
+
+
+def test_handler_is_rewritten_only_when_main_changes(tmp_path):
+    handler_path = tmp_path / "lambda_function.py"
+    (tmp_path / "main.py").write_text("def main(name):\n    return name\n")
+    assert generate_lambda_handler(str(tmp_path))
+    generated, stat = handler_path.read_bytes(), handler_path.stat()
+
+    assert generate_lambda_handler(str(tmp_path))
+    assert handler_path.stat().st_mtime_ns == stat.st_mtime_ns and handler_path.read_bytes() == generated
+
+    (tmp_path / "main.py").write_text("def main(name, title):\n    return title + name\n")
+    assert generate_lambda_handler(str(tmp_path))
+    assert "title = query_params.get('title')" in handler_path.read_text()
+
+    (tmp_path / "main.py").write_text("def main(name):\n    return name\n")
+    assert generate_lambda_handler(str(tmp_path))
+    assert handler_path.read_bytes() == generated
+
+    handler_path.write_text("def lambda_handler(event, context):\n    return {}\n")
+    assert generate_lambda_handler(str(tmp_path))
+    assert handler_path.read_text() == "def lambda_handler(event, context):\n    return {}\n"
+
+
+OLD_GENERATOR_HANDLER = """import json
+from _task import _task
+
+def lambda_handler(event, context):
+
+    name = None
+    try:
+        query_params = event.get('queryStringParameters', {})
+        print(query_params)
+        if query_params:
+            name = query_params.get('name', 'default_value_if_missing')
+        return {'statusCode': 200, 'body': json.dumps(_task.run(name=name))}
+    except Exception as err:
+        return {'statusCode': 404, 'body': json.dumps(str(err))}
+"""
+
+
+def test_handler_of_the_generator_before_headers_is_regenerated(tmp_path):
+    handler_path = tmp_path / "lambda_function.py"
+    handler_path.write_text(OLD_GENERATOR_HANDLER)
+    (tmp_path / "main.py").write_text("def main(name):\n    return name\n")
+
+    assert generate_lambda_handler(str(tmp_path))
+    handler = handler_path.read_text()
+    assert handler.startswith("# Generated from main.py by aws_ecr_deploy")
+    assert "default_value_if_missing" not in handler and "_task" not in handler
+
+
+def test_response_cache_serves_warm_invocations(tmp_path, monkeypatch):
+    (tmp_path / "main.py").write_text(
+        "calls = []\n\n\n"
+        "def main(name):\n"
+        "    calls.append(name)\n"
+        "    return name.upper()\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "main", raising=False)
+    handler_path = tmp_path / "lambda_function.py"
+    assert generate_lambda_handler(str(tmp_path))
+    uncached = handler_path.read_text()
+
+    assert generate_lambda_handler(str(tmp_path), options=HandlerOptions(response_cache=ResponseCache(ttl=60, max_entries=2)))
+    assert handler_path.read_text() != uncached
+    handler = runpy.run_path(str(handler_path))["lambda_handler"]
+    for name in ["a", "a", "b", "c", "a"]:
+        assert json.loads(handler({"queryStringParameters": {"name": name}}, None)["body"]) == name.upper()
+
+    # The second "a" is a hit, the last one was evicted by "b" and "c"
+    assert sys.modules["main"].calls == ["a", "b", "c", "a"]
+
+    assert generate_lambda_handler(str(tmp_path))
+    assert handler_path.read_text() == uncached
+
+
+def test_initializers_are_hoisted_and_keep_warm_pings_skip_main(tmp_path):
+    (tmp_path / "main.py").write_text(
+        "import itertools\n\n\n"
+        "def main(name):\n"
+        "    counter = itertools.count()\n"
+        "    prefix = f'{next(counter)}'\n"
+        "    return [name, prefix, next(counter)]\n")
+    options = HandlerOptions(hoist=("counter", "prefix"), keep_warm=True)
+
+    assert generate_lambda_handler(str(tmp_path), options=options)
+    handler_source = (tmp_path / "lambda_function.py").read_text()
+    assert "\ncounter = itertools.count()\nprefix = f'{next(counter)}'\n" in handler_source
+    assert "from main import" not in handler_source
+    handler = runpy.run_path(str(tmp_path / "lambda_function.py"))["lambda_handler"]
+
+    assert handler({"keep_warm": True}, None) == {"keep_warm": True}
+    # The counter lives as long as the execution environment, the ping did not advance it
+    bodies = [json.loads(handler({"queryStringParameters": {"name": "x"}}, None)["body"]) for _ in range(2)]
+    assert bodies == [["x", "0", 1], ["x", "0", 2]]
+
+    # Hoisting a value computed from the request would serve every request the first one
+    (tmp_path / "main.py").write_text("import os\n\n\ndef main(name):\n    path = os.path.join(name)\n    return path\n")
+    assert generate_lambda_handler(str(tmp_path), options=HandlerOptions(hoist=("path",)))
+    assert "from main import main" in (tmp_path / "lambda_function.py").read_text()
+
+
+def test_lazy_imports_run_on_first_use(tmp_path, monkeypatch):
+    for module in ("lazy_dep_a", "lazy_dep_b", "lazy_dep_c"):
+        (tmp_path / f"{module}.py").write_text("class Thing:\n    name = 'thing'\n\n\ndef value():\n    return 1\n")
+        monkeypatch.delitem(sys.modules, module, raising=False)
+    (tmp_path / "main.py").write_text(
+        "import lazy_dep_a\n"
+        "from lazy_dep_b import Thing\n"
+        "from lazy_dep_c import Thing as Kind\n\n\n"
+        "def main(mode):\n"
+        "    return lazy_dep_a.value() if mode == 'a' else (Thing().name if mode == 'b' else isinstance(mode, Kind))\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    assert generate_lambda_handler(str(tmp_path), options=HandlerOptions(lazy_imports=True))
+    spec = importlib.util.spec_from_file_location("lazy_handler", tmp_path / "lambda_function.py")
+    handler = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(handler)
+
+    # isinstance() needs the class itself, so lazy_dep_c is imported as before
+    assert "lazy_dep_c" in sys.modules and "lazy_dep_a" not in sys.modules and "lazy_dep_b" not in sys.modules
+    assert json.loads(handler.lambda_handler({"queryStringParameters": {"mode": "a"}}, None)["body"]) == 1
+    assert handler.lazy_dep_a is sys.modules["lazy_dep_a"] and "lazy_dep_b" not in sys.modules
+    assert list(handler.LazyImport.used) == ["lazy_dep_a"]
+
+
+def test_dotted_lazy_imports_of_one_package_share_a_proxy(tmp_path, monkeypatch):
+    (tmp_path / "lazy_pkg").mkdir()
+    (tmp_path / "lazy_pkg" / "__init__.py").write_text("")
+    for module in ("lazy_pkg", "lazy_pkg.first", "lazy_pkg.second"):
+        monkeypatch.delitem(sys.modules, module, raising=False)
+    (tmp_path / "lazy_pkg" / "first.py").write_text("value = 1\n")
+    (tmp_path / "lazy_pkg" / "second.py").write_text("value = 2\n")
+    (tmp_path / "main.py").write_text(
+        "import lazy_pkg.first\nimport lazy_pkg.second\n\n\n"
+        "def main(name):\n    return [name, lazy_pkg.first.value, lazy_pkg.second.value]\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    assert generate_lambda_handler(str(tmp_path), options=HandlerOptions(lazy_imports=True))
+    handler_source = (tmp_path / "lambda_function.py").read_text()
+    assert handler_source.count("lazy_pkg = LazyImport(") == 1
+    handler = runpy.run_path(str(tmp_path / "lambda_function.py"))["lambda_handler"]
+
+    assert "lazy_pkg" not in sys.modules
+    assert json.loads(handler({"queryStringParameters": {"name": "x"}}, None)["body"]) == ["x", 1, 2]
+
+
+@pytest.mark.parametrize("template_name", ["api_gateway_handler", "sqs_batch_handler"])
+def test_lazy_imports_of_names_the_template_uses_too(tmp_path, template_name):
+    # json, os and perf_counter are imported by the templates or by LazyImport itself as well
+    (tmp_path / "main.py").write_text(
+        "import json\nimport os\nfrom time import perf_counter\n\n\n"
+        "def main(name):\n"
+        "    return json.dumps({'name': name, 'sep': os.sep, 'timed': perf_counter() > 0})\n")
+
+    assert generate_lambda_handler(str(tmp_path), template_name=template_name,
+                                   options=HandlerOptions(lazy_imports=True))
+    assert "json = LazyImport('json', 'json')" in (tmp_path / "lambda_function.py").read_text()
+    handler = runpy.run_path(str(tmp_path / "lambda_function.py"))["lambda_handler"]
+
+    expected = json.dumps({"name": "x", "sep": os.sep, "timed": True})
+    if template_name == "api_gateway_handler":
+        assert json.loads(handler({"queryStringParameters": {"name": "x"}}, None)["body"]) == expected
+    else:
+        assert handler({"Records": [{"messageId": "1", "body": json.dumps({"name": "x"})}]}, None) == \
+            {"batchItemFailures": []}
+
+
+def test_coroutine_main_runs_on_one_event_loop(tmp_path, monkeypatch):
+    # The downstream calls wait for each other, they only complete when main() runs them concurrently
+    (tmp_path / "main.py").write_text(
+        "import asyncio\n\nloops = []\n\n\n"
+        "async def fetch(index, started):\n"
+        "    started.append(index)\n"
+        "    while len(started) < 3:\n"
+        "        await asyncio.sleep(0.001)\n"
+        "    return index\n\n\n"
+        "async def main(name):\n"
+        "    loops.append(asyncio.get_running_loop())\n"
+        "    started = []\n"
+        "    return [name] + list(await asyncio.gather(*(fetch(index, started) for index in range(3))))\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "main", raising=False)
+
+    assert generate_lambda_handler(str(tmp_path))
+    handler = runpy.run_path(str(tmp_path / "lambda_function.py"))["lambda_handler"]
+    for name in ("x", "y"):
+        assert json.loads(handler({"queryStringParameters": {"name": name}}, None)["body"]) == [name, 0, 1, 2]
+
+    first, second = sys.modules["main"].loops
+    assert first is second and not first.is_closed()
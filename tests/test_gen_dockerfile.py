@@ -0,0 +1,55 @@
+from src.gen_dockerfile import generate_dockerfile, render_dockerfile
+
+
+def test_dependencies_are_installed_before_the_code_is_copied():
+    dockerfile = render_dockerfile(base_image="python3.12")
+    lines = dockerfile.splitlines()
+
+    assert lines[0] == "FROM public.ecr.aws/lambda/python:3.12"
+    assert lines.index("COPY requirements.txt ./") < lines.index("COPY . ./")
+    assert "--no-cache-dir" in dockerfile
+    assert dockerfile.rstrip().endswith('CMD [ "lambda_function.lambda_handler" ]')
+
+
+def test_multi_stage_copies_only_installed_packages():
+    dockerfile = render_dockerfile(base_image="my-registry/python:3.11", multi_stage=True)
+    from_lines = [line for line in dockerfile.splitlines() if line.startswith("FROM")]
+
+    assert from_lines == ["FROM my-registry/python:3.11 AS builder", "FROM my-registry/python:3.11"]
+    assert "COPY --from=builder /opt/packages ./" in dockerfile
+
+
+def test_existing_dockerfile_is_kept(tmp_path):
+    (tmp_path / "Dockerfile").write_text("FROM scratch\n")
+
+    assert generate_dockerfile(str(tmp_path))
+    assert (tmp_path / "Dockerfile").read_text() == "FROM scratch\n"
+
+
+def test_generated_dockerfile_follows_the_wheelhouse_option(tmp_path):
+    assert generate_dockerfile(str(tmp_path))
+    assert "--mount=type=bind,from=wheelhouse" not in (tmp_path / "Dockerfile").read_text()
+
+    assert generate_dockerfile(str(tmp_path), wheelhouse=True)
+    dockerfile = (tmp_path / "Dockerfile").read_text()
+    assert dockerfile.startswith("# syntax=docker/dockerfile:1\n# Generated by aws_ecr_deploy")
+    assert "--mount=type=bind,from=wheelhouse" in dockerfile
+
+    assert generate_dockerfile(str(tmp_path), wheelhouse=True)
+    assert (tmp_path / "Dockerfile").read_text() == dockerfile
+
+
+def test_dockerfile_generated_before_the_header_is_generated_again(tmp_path):
+    (tmp_path / "Dockerfile").write_text(render_dockerfile())
+
+    assert generate_dockerfile(str(tmp_path), wheelhouse=True)
+    assert "--mount=type=bind,from=wheelhouse" in (tmp_path / "Dockerfile").read_text()
+
+
+def test_hand_written_dockerfile_mounting_the_wheelhouse_needs_it(tmp_path):
+    hand_written = "FROM python:3.12\nRUN --mount=type=bind,from=wheelhouse,target=/w pip install -r r.txt\n"
+    (tmp_path / "Dockerfile").write_text(hand_written)
+
+    assert not generate_dockerfile(str(tmp_path))
+    assert generate_dockerfile(str(tmp_path), wheelhouse=True)
+    assert (tmp_path / "Dockerfile").read_text() == hand_written
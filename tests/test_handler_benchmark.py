@@ -0,0 +1,24 @@
+import json
+from dataclasses import asdict
+
+from src import handler_benchmark
+from src.gen_aws_lambda_handler import generate_lambda_handler
+
+
+def test_benchmark_replays_events_in_a_fresh_interpreter(tmp_path):
+    (tmp_path / "main.py").write_text("def main(name):\n    import decimal\n    return name\n")
+    assert generate_lambda_handler(str(tmp_path))
+    events = tmp_path / "events.jsonl"
+    events.write_text('{"queryStringParameters": {"name": "a"}}\n{"queryStringParameters": null}\n')
+
+    result = handler_benchmark.run_benchmark(str(tmp_path), events_path=str(events), iterations=20, cold_runs=2)
+
+    assert len(result.init_ms_runs) == 2 and result.init_ms > 0
+    assert "decimal" in [module.module for module in result.imports]
+    assert 0 < result.p50_ms <= result.p95_ms <= result.p99_ms <= result.max_ms
+    assert result.errors == 0 and result.peak_rss_kb >= result.rss_after_init_kb > 0
+
+    baseline = json.loads(json.dumps(asdict(result)))
+    assert handler_benchmark.regressions(result, baseline) == []
+    baseline["init_ms"] = result.init_ms / 2
+    assert handler_benchmark.regressions(result, baseline)[0].startswith("init_ms:")
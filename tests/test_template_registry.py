@@ -0,0 +1,79 @@
+import base64
+import json
+import os
+import runpy
+import sys
+
+import pytest
+
+from src import template_registry
+from src.gen_aws_lambda_handler import generate_lambda_handler
+
+
+def test_templates_are_compiled_once_and_cached_as_bytecode():
+    template = template_registry.get_template("api_gateway_handler")
+
+    assert template_registry.get_template("api_gateway_handler") is template
+    assert any(name.startswith("__jinja2_") for name in os.listdir(template_registry.cache_dir()))
+    with pytest.raises(ValueError, match="Unknown template"):
+        template_registry.get_template("generic_lambda_handler")
+
+
+@pytest.mark.parametrize("template_name, event", [
+    ("sqs_batch_handler", {"Records": [{"messageId": "1", "body": json.dumps({"name": "a"})},
+                                       {"messageId": "2", "body": json.dumps({"name": "b", "greeting": "hi"})}]}),
+    ("scheduled_handler", {"detail-type": "Scheduled Event", "detail": {"name": "a"}}),
+])
+def test_event_source_templates_call_main(tmp_path, template_name, event):
+    (tmp_path / "main.py").write_text("def main(name, greeting='hello'):\n    return f'{greeting} {name}'\n")
+
+    assert generate_lambda_handler(str(tmp_path), template_name=template_name)
+    handler = runpy.run_path(str(tmp_path / "lambda_function.py"))["lambda_handler"]
+
+    assert handler(event, None) == ({"batchItemFailures": []} if template_name == "sqs_batch_handler" else "hello a")
+
+
+@pytest.mark.parametrize("main_source", [
+    # Three records wait for each other, they only get through when handled at the same time
+    "import threading\n\nbarrier = threading.Barrier(3, timeout=5)\n\n\n"
+    "def main(n):\n    barrier.wait()\n    if n == 2:\n        raise RuntimeError(n)\n    return n\n",
+    "import asyncio\n\nwaiting = []\n\n\n"
+    "async def main(n):\n    waiting.append(n)\n    while len(waiting) < 3:\n        await asyncio.sleep(0.01)\n"
+    "    if n == 2:\n        raise RuntimeError(n)\n    return n\n",
+])
+def test_batch_handler_reports_the_failed_records(tmp_path, monkeypatch, main_source):
+    (tmp_path / "main.py").write_text(main_source)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "main", raising=False)
+
+    assert generate_lambda_handler(str(tmp_path), template_name="sqs_batch_handler")
+    handler = runpy.run_path(str(tmp_path / "lambda_function.py"))["lambda_handler"]
+
+    records = [{"messageId": "m1", "body": json.dumps({"n": 1})},
+               {"kinesis": {"sequenceNumber": "s2", "data": base64.b64encode(b'{"n": 2}').decode()}},
+               {"messageId": "m3", "body": json.dumps({"n": 3})},
+               {"messageId": "m4", "body": json.dumps({"m": 4})}]
+    assert handler({"Records": records}, None) == {"batchItemFailures": [{"itemIdentifier": "s2"},
+                                                                         {"itemIdentifier": "m4"}]}
+
+
+@pytest.mark.parametrize("main_source", [
+    "handled = []\n\n\n"
+    "def main(n):\n    handled.append(n)\n    if n == 2:\n        raise RuntimeError(n)\n    return handled\n",
+    "handled = []\n\n\n"
+    "async def main(n):\n    handled.append(n)\n    if n == 2:\n        raise RuntimeError(n)\n    return handled\n",
+])
+def test_fifo_batch_stops_at_the_first_failed_message(tmp_path, monkeypatch, main_source):
+    (tmp_path / "main.py").write_text(main_source)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "main", raising=False)
+
+    assert generate_lambda_handler(str(tmp_path), template_name="sqs_batch_handler")
+    handler = runpy.run_path(str(tmp_path / "lambda_function.py"))["lambda_handler"]
+
+    records = [{"messageId": f"m{n}", "body": json.dumps({"n": n}), "attributes": {"MessageGroupId": "g"}}
+               for n in (1, 2, 3, 4)]
+    assert handler({"Records": records}, None) == {"batchItemFailures": [{"itemIdentifier": "m2"},
+                                                                         {"itemIdentifier": "m3"},
+                                                                         {"itemIdentifier": "m4"}]}
+    assert sys.modules["main"].handled == [1, 2]
@@ -0,0 +1,37 @@
+import pytest
+
+from _util import _util_file as _util_file_
+
+
+def test_scan_directory_finds_targets_in_one_pass(tmp_path):
+    (tmp_path / "b").mkdir()
+    (tmp_path / "b" / "c").mkdir()
+    (tmp_path / "__pycache__").mkdir()
+    (tmp_path / "__pycache__" / "main.cpython-311.pyc").write_bytes(b"")
+    (tmp_path / "main.py").write_text("")
+    (tmp_path / "z.txt").write_text("")
+    (tmp_path / "b" / "requirements.txt").write_text("")
+    (tmp_path / "b" / "c" / "deep.txt").write_text("")
+
+    manifest = _util_file_.scan_directory(str(tmp_path), targets=("main.py", "requirements.txt"))
+    shallow = _util_file_.scan_directory(str(tmp_path), max_depth=1, ignore_patterns=("__pycache__", "*.txt"))
+
+    assert [entry.relpath for entry in manifest.files] == ["main.py", "z.txt", "b/requirements.txt", "b/c/deep.txt"]
+    assert manifest.find("main.py", max_depth=0) == str(tmp_path / "main.py")
+    assert manifest.find("requirements.txt", max_depth=0) is None
+    assert manifest.find("requirements.txt") == str(tmp_path / "b" / "requirements.txt")
+    assert [entry.relpath for entry in shallow.files] == ["main.py"]
+
+
+def test_scan_directory_lists_symlinks_without_following_them(tmp_path):
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "main.py").write_text("")
+    (tmp_path / "broken.py").symlink_to(tmp_path / "missing.py")
+    (tmp_path / "linked").symlink_to(tmp_path / "pkg")
+
+    manifest = _util_file_.scan_directory(str(tmp_path))
+
+    assert [(entry.relpath, entry.symlink) for entry in manifest.files] == [
+        ("broken.py", True), ("linked", True), ("main.py", False)]
+    with pytest.raises(FileNotFoundError):
+        _util_file_.scan_directory(str(tmp_path / "missing"))
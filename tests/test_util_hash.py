@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+from _util import _util_hash as _util_hash_
+
+
+def _write_tree(root):
+    (root / "models").mkdir()
+    (root / "models" / "empty").mkdir()
+    (root / "main.py").write_text("def main():\n    return 1\n")
+    (root / "models" / "v1").mkdir()
+    (root / "models" / "v1" / "config.json").write_text("{}")
+    (root / "models" / "weights.bin").write_bytes(os.urandom(64 * 1024))
+
+
+def test_warm_rehash_reads_only_changed_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(_util_hash_, "RACY_WINDOW_NS", 0)
+    app = tmp_path / "app"
+    app.mkdir()
+    _write_tree(app)
+    cache_path = str(tmp_path / "cache.json")
+
+    cold = _util_hash_.tree_digest(str(app), cache_path=cache_path)
+    warm = _util_hash_.tree_digest(str(app), cache_path=cache_path)
+    (app / "main.py").write_text("def main():\n    return 2\n")
+    changed = _util_hash_.tree_digest(str(app), cache_path=cache_path)
+
+    assert (cold.hashed, cold.cached) == (3, 0)
+    assert (warm.hashed, warm.cached) == (0, 3)
+    assert warm.digest == cold.digest
+    assert (changed.hashed, changed.cached) == (1, 2)
+    assert changed.digest != cold.digest
+    assert changed.directories["models"] == cold.directories["models"]
+
+
+def test_digest_covers_paths_and_large_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(_util_hash_, "MMAP_THRESHOLD", 1024)
+    _write_tree(tmp_path)
+    before = _util_hash_.tree_digest(str(tmp_path), use_cache=False)
+
+    (tmp_path / "models" / "weights.bin").rename(tmp_path / "weights.bin")
+    after = _util_hash_.tree_digest(str(tmp_path), use_cache=False)
+
+    assert before.files["models/weights.bin"] == after.files["weights.bin"]
+    assert before.digest != after.digest
+
+
+def test_racy_files_do_not_rewrite_the_cache(tmp_path, monkeypatch):
+    app = tmp_path / "app"
+    app.mkdir()
+    _write_tree(app)
+    cache_path = tmp_path / "cache.json"
+    _util_hash_.tree_digest(str(app), cache_path=str(cache_path))
+    # main.py is modified within the racy window, the other files are old enough to be cached
+    for path in app.rglob("*"):
+        if path.is_file() and path.name != "main.py":
+            os.utime(path, ns=(0, 0))
+    _util_hash_.tree_digest(str(app), cache_path=str(cache_path))
+    saved = []
+    monkeypatch.setattr(_util_hash_, "save_stat_cache", lambda *args: saved.append(args))
+
+    rehashed = _util_hash_.tree_digest(str(app), cache_path=str(cache_path))
+
+    assert (rehashed.hashed, saved) == (1, [])
+    assert "main.py" not in _util_hash_.load_stat_cache(str(cache_path))
+
+
+def test_symlinks_are_hashed_by_target_and_errors_raise(tmp_path):
+    (tmp_path / "main.py").write_text("")
+    (tmp_path / "broken.py").symlink_to("missing.py")
+    before = _util_hash_.tree_digest(str(tmp_path), use_cache=False)
+
+    (tmp_path / "broken.py").unlink()
+    (tmp_path / "broken.py").symlink_to("other.py")
+
+    assert _util_hash_.tree_digest(str(tmp_path), use_cache=False).digest != before.digest
+    with pytest.raises(OSError):
+        _util_hash_.tree_digest(str(tmp_path / "missing"), use_cache=False)
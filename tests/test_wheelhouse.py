@@ -0,0 +1,59 @@
+import os
+
+from config import DeployConfig
+from src import wheelhouse
+from src.gen_dockerfile import render_dockerfile
+
+CONFIG = DeployConfig.from_env(ecr_repository_name="test-repo", docker_base_image="python3.12")
+
+
+def test_key_depends_on_requirements_and_target_only():
+    key = wheelhouse.requirements_key(b"requests==2.32.3\nboto3\n", "manylinux2014_x86_64", "3.12")
+
+    assert key == wheelhouse.requirements_key(b"# deps\nrequests==2.32.3  # http\n\n boto3\n",
+                                              "manylinux2014_x86_64", "3.12")
+    assert key != wheelhouse.requirements_key(b"requests==2.32.3\nboto3\n", "manylinux2014_aarch64", "3.12")
+    assert key != wheelhouse.requirements_key(b"requests==2.32.3\nboto3\n", "manylinux2014_x86_64", "3.11")
+    assert wheelhouse.python_version("public.ecr.aws/lambda/python:3.12-arm64") == "3.12"
+    assert wheelhouse.docker_platform("manylinux2014_aarch64") == "linux/arm64"
+
+
+def test_complete_wheelhouse_is_reused_without_running_pip(tmp_path, monkeypatch):
+    monkeypatch.setenv("WHEELHOUSE_DIR", str(tmp_path / "wheelhouse"))
+    monkeypatch.setattr(wheelhouse, "_run", lambda command: (_ for _ in ()).throw(AssertionError(command)))
+    requirements = tmp_path / "requirements.txt"
+    requirements.write_text("requests==2.32.3\n")
+    key = wheelhouse.requirements_key(requirements.read_bytes(), CONFIG.wheelhouse_platform, "3.12")
+    os.makedirs(tmp_path / "wheelhouse" / key)
+    (tmp_path / "wheelhouse" / key / wheelhouse.COMPLETE_MARKER).touch()
+
+    assert wheelhouse.ensure_wheelhouse(CONFIG, str(requirements)) == str(tmp_path / "wheelhouse" / key)
+
+
+def test_failed_download_falls_back_to_building_in_the_base_image(tmp_path, monkeypatch):
+    monkeypatch.setenv("WHEELHOUSE_DIR", str(tmp_path / "wheelhouse"))
+    commands = []
+
+    def run(command):
+        commands.append(command)
+        return command[0] == "docker"
+
+    monkeypatch.setattr(wheelhouse, "_run", run)
+    requirements = tmp_path / "requirements.txt"
+    requirements.write_text("psycopg2==2.9.9\n")
+
+    path = wheelhouse.ensure_wheelhouse(CONFIG, str(requirements))
+
+    assert [command[2:4] for command in commands] == [["pip", "download"], ["--rm", "--platform"]]
+    assert "public.ecr.aws/lambda/python:3.12" in commands[1]
+    assert os.path.isfile(os.path.join(path, wheelhouse.COMPLETE_MARKER))
+    assert os.listdir(tmp_path / "wheelhouse") == [os.path.basename(path)]
+
+
+def test_generated_dockerfile_installs_offline_from_the_wheelhouse():
+    dockerfile = render_dockerfile(wheelhouse=True)
+
+    assert dockerfile.startswith("# syntax=docker/dockerfile:1\n")
+    assert "--mount=type=bind,from=wheelhouse,target=/tmp/wheelhouse" in dockerfile
+    assert "--mount=type=cache,target=/root/.cache/pip" in dockerfile
+    assert "--no-index --find-links /tmp/wheelhouse" in dockerfile